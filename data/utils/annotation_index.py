@@ -0,0 +1,248 @@
+"""
+Packed annotation index of EgoExOR takes.
+
+Scene graph annotations are stored as one small group per frame
+(`annotations/frame_<i>/rel_annotations`, [n, 3] byte strings), so reading them frame by
+frame costs a metadata lookup and a string decode each. This tool adds a derived CSR
+index to every take:
+
+    annotation_index/vocabulary  [n_tokens]          byte strings, sorted
+    annotation_index/triplets    [n_triplets, 3]     int16 ids into the vocabulary
+    annotation_index/offsets     [num_frames + 1]    int64, frame i owns triplets[offsets[i]:offsets[i + 1]]
+    annotation_index/present     [num_frames]        bool, frame i has an annotation group
+
+The per-frame groups are left untouched. Readers use `TakeAnnotations` /
+`read_frame_annotations`, which use the index when it exists and fall back to the groups
+otherwise.
+
+Usage (from the repository root):
+    python -m data.utils.annotation_index --hdf5_path egoexor.h5
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+import h5py
+import numpy as np
+
+from data.utils.hdf5_utils import iter_takes
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_GROUP = 'annotation_index'
+FRAME_PREFIX = 'frame_'
+
+
+def _frame_number(name):
+    if name.startswith(FRAME_PREFIX) and name[len(FRAME_PREFIX):].isdigit():
+        return int(name[len(FRAME_PREFIX):])
+    return None
+
+
+def _num_frames(take_group, frame_numbers):
+    num_frames = max(frame_numbers) + 1 if frame_numbers else 0
+    if 'frames/rgb' in take_group:
+        num_frames = max(num_frames, take_group['frames/rgb'].shape[0])
+    return num_frames
+
+
+def _index_is_current(take_group):
+    """True if the take has an index that covers its current annotation groups."""
+    if INDEX_GROUP not in take_group:
+        return False
+    num_groups = len(take_group['annotations']) if 'annotations' in take_group else 0
+    return int(take_group[INDEX_GROUP].attrs.get('num_annotation_groups', -1)) == num_groups
+
+
+class TakeAnnotations:
+    """
+    Annotations of one take in CSR form, held in memory.
+
+    `frame_ids` / `range_ids` return views into the packed id array (no copies);
+    `frame` returns the rows as byte strings like `rel_annotations[:]`.
+    """
+    def __init__(self, vocabulary, triplets, offsets, present):
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.triplets = triplets
+        self.offsets = offsets
+        self.present = present
+        self._strings = None
+
+    def __len__(self):
+        return len(self.present)
+
+    @property
+    def num_triplets(self):
+        return len(self.triplets)
+
+    @classmethod
+    def from_index(cls, take_group):
+        index = take_group[INDEX_GROUP]
+        return cls(index['vocabulary'][()], index['triplets'][()], index['offsets'][()], index['present'][()])
+
+    @classmethod
+    def from_groups(cls, take_group):
+        """Pack the per-frame annotation groups of a take (one pass over all of them)."""
+        frames = {}
+        if 'annotations' in take_group:
+            for name, frame_group in take_group['annotations'].items():
+                frame_number = _frame_number(name)
+                if frame_number is not None and 'rel_annotations' in frame_group:
+                    rows = np.asarray(frame_group['rel_annotations'][()], dtype=object)
+                    frames[frame_number] = rows.reshape(-1, 3) if rows.size else np.empty((0, 3), dtype=object)
+
+        num_frames = _num_frames(take_group, list(frames))
+        counts = np.zeros(num_frames, dtype=np.int64)
+        present = np.zeros(num_frames, dtype=bool)
+        for frame_number, rows in frames.items():
+            counts[frame_number] = len(rows)
+            present[frame_number] = True
+        offsets = np.zeros(num_frames + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        tokens = [frames[i] for i in sorted(frames)]
+        tokens = np.concatenate(tokens) if tokens else np.empty((0, 3), dtype=object)
+        tokens = np.array([t if isinstance(t, bytes) else str(t).encode('utf-8') for t in tokens.ravel()],
+                          dtype=object)
+        if len(tokens):
+            vocabulary, ids = np.unique(tokens, return_inverse=True)
+        else:
+            vocabulary, ids = np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+        if len(vocabulary) > np.iinfo(np.int16).max:
+            raise ValueError(f"{take_group.name}: {len(vocabulary)} distinct annotation tokens do not fit int16 ids")
+        return cls(vocabulary, ids.astype(np.int16).reshape(-1, 3), offsets, present)
+
+    @classmethod
+    def load(cls, take_group, fallback=True):
+        """
+        From the packed index if it is current, otherwise from the per-frame groups
+        (or None with `fallback=False`, for callers that only touch a few frames).
+        """
+        if _index_is_current(take_group):
+            return cls.from_index(take_group)
+        return cls.from_groups(take_group) if fallback else None
+
+    def has_frame(self, frame_idx):
+        return 0 <= frame_idx < len(self.present) and bool(self.present[frame_idx])
+
+    def frame_ids(self, frame_idx):
+        """Vocabulary ids [n, 3] of a frame (a view), None if the frame is not annotated."""
+        if not self.has_frame(frame_idx):
+            return None
+        return self.triplets[self.offsets[frame_idx]:self.offsets[frame_idx + 1]]
+
+    def range_ids(self, start, stop):
+        """
+        Ids of the frames [start, stop) as (triplets, offsets): a view of the packed ids and
+        offsets rebased to it, so frame start + i owns triplets[offsets[i]:offsets[i + 1]].
+        """
+        start, stop = max(start, 0), min(stop, len(self.present))
+        if stop <= start:
+            return self.triplets[:0], np.zeros(1, dtype=np.int64)
+        offsets = self.offsets[start:stop + 1]
+        return self.triplets[offsets[0]:offsets[-1]], offsets - offsets[0]
+
+    def frame(self, frame_idx):
+        """Rows [n, 3] of byte strings, as stored in rel_annotations; None if not annotated."""
+        ids = self.frame_ids(frame_idx)
+        return None if ids is None else self.vocabulary[ids]
+
+    def frame_strings(self, frame_idx):
+        """Rows of a frame as lists of str (each vocabulary entry is decoded once per take)."""
+        ids = self.frame_ids(frame_idx)
+        if ids is None:
+            return None
+        if self._strings is None:
+            self._strings = [token.decode('utf-8') for token in self.vocabulary]
+        return [[self._strings[i] for i in row] for row in ids.tolist()]
+
+
+def read_frame_annotations(h5_file, take_path, frame_idx):
+    """
+    rel_annotations rows of a single frame (byte strings), or None if the frame has none.
+
+    Reads only this frame's slice of the packed index when the take has one, otherwise
+    the frame's annotation group.
+    """
+    take_group = h5_file[take_path]
+    if _index_is_current(take_group):
+        index = take_group[INDEX_GROUP]
+        if not 0 <= frame_idx < index['present'].shape[0] or not index['present'][frame_idx]:
+            return None
+        begin, end = index['offsets'][frame_idx:frame_idx + 2]
+        vocabulary = np.asarray(index['vocabulary'][()], dtype=object)
+        return vocabulary[index['triplets'][begin:end]]
+
+    ann_path = f'annotations/{FRAME_PREFIX}{frame_idx}/rel_annotations'
+    if ann_path in take_group:
+        return take_group[ann_path][:]
+    return None
+
+
+def write_index(take_group, annotations):
+    """Write (or replace) the packed index of a take."""
+    if INDEX_GROUP in take_group:
+        del take_group[INDEX_GROUP]
+    index = take_group.create_group(INDEX_GROUP)
+    index.create_dataset('vocabulary', data=annotations.vocabulary.astype(object), dtype=h5py.string_dtype(encoding='utf-8'))
+    index.create_dataset('triplets', data=annotations.triplets, dtype=np.int16)
+    index.create_dataset('offsets', data=annotations.offsets, dtype=np.int64)
+    index.create_dataset('present', data=annotations.present, dtype=bool)
+    index.attrs['num_annotation_groups'] = len(take_group['annotations']) if 'annotations' in take_group else 0
+
+
+def build_index(hdf5_path, overwrite=False):
+    """Add the packed annotation index to every take of an HDF5 file that lacks a current one."""
+    start = time.time()
+    built = skipped = 0
+    with h5py.File(hdf5_path, 'a') as f:
+        for take_path in iter_takes(f):
+            take_group = f[take_path]
+            if 'annotations' not in take_group or (_index_is_current(take_group) and not overwrite):
+                skipped += 1
+                continue
+            annotations = TakeAnnotations.from_groups(take_group)
+            write_index(take_group, annotations)
+            built += 1
+            logger.info(f"{take_path}: {annotations.num_triplets} triplets, "
+                         f"{int(annotations.present.sum())} annotated frames, {len(annotations.vocabulary)} tokens")
+    logger.info(f"Indexed {built} takes ({skipped} skipped) in {time.time() - start:.1f}s")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build the packed (CSR) annotation index of an EgoExOR HDF5 file.")
+    parser.add_argument(
+        "--hdf5_path",
+        type=str,
+        required=True,
+        help="HDF5 file to index (modified in place)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Rebuild indexes that are already current."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.hdf5_path):
+        logger.error(f"Input file does not exist: {args.hdf5_path}")
+        return 1
+
+    try:
+        build_index(args.hdf5_path, overwrite=args.overwrite)
+        return 0
+    except Exception as e:
+        logger.error(f"Error indexing annotations: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
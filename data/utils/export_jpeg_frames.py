@@ -0,0 +1,200 @@
+"""
+JPEG export of EgoExOR takes: every camera view as its own JPEG, decoded on read at
+reduced scale.
+
+Every view of a take's `frames/rgb` ([num_frames, num_cameras, H, W, 3] uint8) is
+JPEG-encoded and appended to `<output_dir>/<surgery_type>_<procedure_id>_<take_id>.jpg.bin`;
+`<...>.offsets.npy` (int64, [num_frames * num_cameras + 1]) holds where every view starts,
+frame-major. Blank (all-zero) views are stored with zero length. A JSON header per take
+describes the export:
+
+    {"version": 1, "take": "data/<surgery_type>/<procedure_id>/take/<take_id>",
+     "shape": [...], "quality": 90, "file": "<...>.jpg.bin", "offsets": "<...>.offsets.npy",
+     "signature": {...}}
+
+`signature` is the size/mtime of the HDF5 file the export was made from; the header is
+written last. The default output directory is `<hdf5_path>.jpegframes`; the loaders read
+from it when there is no raw export (`JpegFrameStore` in
+scene_graph_helpers/dataset/jpeg_frames.py) and decode every view at the smallest DCT scale
+(1/2, 1/4, 1/8) that still covers the vision tower's input size. JPEG is lossy, compare the
+validation metrics before training on an export. Encodes with PyTurboJPEG when installed,
+else with Pillow.
+
+Usage (from the repository root):
+    python -m data.utils.export_jpeg_frames --hdf5_path EgoExOR.h5 --quality 90
+"""
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+try:
+    from turbojpeg import TJPF_RGB, TJSAMP_420, TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from data.utils.export_raw_frames import FRAMES_KEY, take_file_stem
+from data.utils.hdf5_utils import file_signature, iter_takes, open_for_scan
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JPEG_FRAMES_VERSION = 1
+JPEG_FRAMES_SUFFIX = '.jpegframes'
+
+
+def _read_header(header_path):
+    try:
+        with open(header_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def make_encoder(quality):
+    """view [H, W, 3] uint8 -> JPEG bytes (4:2:0)."""
+    if TurboJPEG is not None:
+        turbo = TurboJPEG()
+        return lambda view: turbo.encode(view, quality=quality, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+
+    def encode(view):
+        buffer = io.BytesIO()
+        Image.fromarray(view).save(buffer, format='JPEG', quality=quality, subsampling=2)
+        return buffer.getvalue()
+    return encode
+
+
+def export_take(frame_ds, take_path, output_dir, signature, encode, quality):
+    """Write the JPEG blob, offsets and header of one take. Reads one chunk row of frames at a time."""
+    stem = take_file_stem(take_path)
+    num_frames, num_cameras = frame_ds.shape[:2]
+    offsets = np.zeros(num_frames * num_cameras + 1, dtype=np.int64)
+
+    blob_path = os.path.join(output_dir, f'{stem}.jpg.bin')
+    tmp_path = f'{blob_path}.tmp{os.getpid()}'
+    position = 0
+    with open(tmp_path, 'wb') as blob:
+        step = frame_ds.chunks[0] if frame_ds.chunks else 1
+        for start in range(0, num_frames, step):
+            block = frame_ds[start:start + step]
+            for offset, frame in enumerate(block):
+                for cam_idx in range(num_cameras):
+                    view = frame[cam_idx]
+                    # blank views stay empty and are read back as zeros
+                    data = encode(np.ascontiguousarray(view)) if view.any() else b''
+                    blob.write(data)
+                    position += len(data)
+                    offsets[(start + offset) * num_cameras + cam_idx + 1] = position
+    os.replace(tmp_path, blob_path)
+    offsets_path = os.path.join(output_dir, f'{stem}.offsets.npy')
+    with open(f'{offsets_path}.tmp{os.getpid()}', 'wb') as f:
+        np.save(f, offsets)
+    os.replace(f'{offsets_path}.tmp{os.getpid()}', offsets_path)
+
+    header = {
+        'version': JPEG_FRAMES_VERSION,
+        'take': take_path,
+        'shape': list(frame_ds.shape),
+        'quality': quality,
+        'file': os.path.basename(blob_path),
+        'offsets': os.path.basename(offsets_path),
+        'signature': signature,
+    }
+    header_path = os.path.join(output_dir, f'{stem}.json')
+    with open(f'{header_path}.tmp{os.getpid()}', 'w') as f:
+        json.dump(header, f)
+    os.replace(f'{header_path}.tmp{os.getpid()}', header_path)
+    return position
+
+
+def export_jpeg_frames(hdf5_path, output_dir=None, quality=90, overwrite=False):
+    """Encode `frames/rgb` of every take whose header is missing or stale (all of them with `overwrite`)."""
+    start = time.time()
+    output_dir = output_dir or os.fspath(hdf5_path) + JPEG_FRAMES_SUFFIX
+    os.makedirs(output_dir, exist_ok=True)
+    signature = file_signature(hdf5_path)
+    encode = make_encoder(quality)
+    exported = skipped = raw_bytes = jpeg_bytes = 0
+    with open_for_scan(hdf5_path) as f:
+        for take_path in iter_takes(f):
+            take_group = f[take_path]
+            if FRAMES_KEY not in take_group:
+                continue
+            frame_ds = take_group[FRAMES_KEY]
+            header = _read_header(os.path.join(output_dir, f'{take_file_stem(take_path)}.json'))
+            if not overwrite and header is not None and header.get('version') == JPEG_FRAMES_VERSION \
+                    and header.get('signature') == signature and header.get('shape') == list(frame_ds.shape) \
+                    and header.get('quality') == quality:
+                skipped += 1
+                continue
+            take_bytes = export_take(frame_ds, take_path, output_dir, signature, encode, quality)
+            take_raw_bytes = frame_ds.size * frame_ds.dtype.itemsize
+            raw_bytes += take_raw_bytes
+            jpeg_bytes += take_bytes
+            exported += 1
+            logger.info(f"{take_path}: {frame_ds.shape[0]} frames, {take_raw_bytes / max(take_bytes, 1):.1f}x smaller")
+    logger.info(f"Exported {exported} takes ({jpeg_bytes / 1024 ** 3:.2f} GB, "
+                f"{raw_bytes / max(jpeg_bytes, 1):.1f}x smaller than uncompressed, {skipped} up to date) "
+                f"to {output_dir} in {time.time() - start:.1f}s")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Encode every camera view of every take as a JPEG.")
+    parser.add_argument(
+        "--hdf5_path",
+        type=str,
+        required=True,
+        help="HDF5 file to export."
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help=f"Output directory (default: <hdf5_path>{JPEG_FRAMES_SUFFIX}, where the loaders look for it)."
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=90,
+        help="JPEG quality (1-100)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Export takes that are already up to date again."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if TurboJPEG is None and Image is None:
+        logger.error("Exporting JPEG frames requires PyTurboJPEG or Pillow")
+        return 1
+    if not os.path.exists(args.hdf5_path):
+        logger.error(f"Input file does not exist: {args.hdf5_path}")
+        return 1
+
+    try:
+        export_jpeg_frames(args.hdf5_path, output_dir=args.output_dir, quality=args.quality,
+                           overwrite=args.overwrite)
+        return 0
+    except Exception as e:
+        logger.error(f"Error exporting JPEG frames: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Raw frame export of EgoExOR takes, for memory-mapped reads without HDF5 decompression.
+
+Every take's `frames/rgb` ([num_frames, num_cameras, H, W, 3] uint8) is written
+uncompressed to `<output_dir>/<surgery_type>_<procedure_id>_<take_id>.rgb`, one frame
+after the other. Every frame starts on a page boundary (frames are zero-padded to a
+multiple of the page size), so the views of a frame are whole pages of the file. A small
+JSON header next to it (`<...>.json`) describes the layout:
+
+    {"version": 1, "take": "data/<surgery_type>/<procedure_id>/take/<take_id>",
+     "shape": [...], "dtype": "uint8", "frame_stride": <bytes>, "signature": {...}}
+
+`signature` is the size/mtime of the HDF5 file the export was made from. The header is
+written last, so a take without a header was not (completely) exported. The default
+output directory is `<hdf5_path>.rawframes`. The loaders read from it instead of the HDF5
+file when it exists (`RawFrameStore` in scene_graph_helpers/dataset/raw_frames.py); any
+later change of the HDF5 file (e.g. frame_validity.py) makes the export stale, so it has to
+be written again (`--overwrite`).
+
+Usage (from the repository root):
+    python -m data.utils.export_raw_frames --hdf5_path EgoExOR.h5
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from data.utils.hdf5_utils import file_signature, iter_takes, open_for_scan
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RAW_FRAMES_VERSION = 1
+RAW_FRAMES_SUFFIX = '.rawframes'
+FRAMES_KEY = 'frames/rgb'
+PAGE_SIZE = 4096
+
+
+def take_file_stem(take_path):
+    # data/<surgery_type>/<procedure_id>/take/<take_id> -> <surgery_type>_<procedure_id>_<take_id>
+    parts = take_path.strip('/').split('/')
+    return f"{parts[1]}_{parts[2]}_{parts[4]}" if len(parts) == 5 else take_path.strip('/').replace('/', '_')
+
+
+def frame_stride(frame_ds):
+    """Bytes per frame in the raw file: one frame of all cameras, rounded up to whole pages."""
+    frame_bytes = int(np.prod(frame_ds.shape[1:])) * frame_ds.dtype.itemsize
+    return -(-frame_bytes // PAGE_SIZE) * PAGE_SIZE
+
+
+def _read_header(header_path):
+    try:
+        with open(header_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def export_take(frame_ds, take_path, output_dir, signature):
+    """Write the raw file and header of one take. Reads one chunk row of frames at a time."""
+    stem = take_file_stem(take_path)
+    num_frames = frame_ds.shape[0]
+    frame_bytes = int(np.prod(frame_ds.shape[1:])) * frame_ds.dtype.itemsize
+    stride = frame_stride(frame_ds)
+
+    raw_path = os.path.join(output_dir, f'{stem}.rgb')
+    tmp_path = f'{raw_path}.tmp{os.getpid()}'
+    raw = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=(max(num_frames, 1), stride))
+    step = frame_ds.chunks[0] if frame_ds.chunks else 1
+    for start in range(0, num_frames, step):
+        block = frame_ds[start:start + step]
+        raw[start:start + len(block), :frame_bytes] = block.reshape(len(block), -1).view(np.uint8)
+    raw.flush()
+    del raw
+    os.replace(tmp_path, raw_path)
+
+    header = {
+        'version': RAW_FRAMES_VERSION,
+        'take': take_path,
+        'file': os.path.basename(raw_path),
+        'shape': list(frame_ds.shape),
+        'dtype': frame_ds.dtype.str,
+        'frame_stride': stride,
+        'signature': signature,
+    }
+    header_path = os.path.join(output_dir, f'{stem}.json')
+    with open(f'{header_path}.tmp{os.getpid()}', 'w') as f:
+        json.dump(header, f)
+    os.replace(f'{header_path}.tmp{os.getpid()}', header_path)
+    return num_frames * stride
+
+
+def export_raw_frames(hdf5_path, output_dir=None, overwrite=False):
+    """Export `frames/rgb` of every take whose header is missing or stale (all of them with `overwrite`)."""
+    start = time.time()
+    output_dir = output_dir or os.fspath(hdf5_path) + RAW_FRAMES_SUFFIX
+    os.makedirs(output_dir, exist_ok=True)
+    signature = file_signature(hdf5_path)
+    exported = skipped = total_bytes = 0
+    with open_for_scan(hdf5_path) as f:
+        for take_path in iter_takes(f):
+            take_group = f[take_path]
+            if FRAMES_KEY not in take_group:
+                continue
+            frame_ds = take_group[FRAMES_KEY]
+            header = _read_header(os.path.join(output_dir, f'{take_file_stem(take_path)}.json'))
+            if not overwrite and header is not None and header.get('version') == RAW_FRAMES_VERSION \
+                    and header.get('signature') == signature and header.get('shape') == list(frame_ds.shape):
+                skipped += 1
+                continue
+            total_bytes += export_take(frame_ds, take_path, output_dir, signature)
+            exported += 1
+            logger.info(f"{take_path}: {frame_ds.shape[0]} frames")
+    logger.info(f"Exported {exported} takes ({total_bytes / 1024 ** 3:.2f} GB, {skipped} up to date) "
+                f"to {output_dir} in {time.time() - start:.1f}s")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Export frames/rgb of every take as page-aligned raw files.")
+    parser.add_argument(
+        "--hdf5_path",
+        type=str,
+        required=True,
+        help="HDF5 file to export."
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help=f"Output directory (default: <hdf5_path>{RAW_FRAMES_SUFFIX}, where the loaders look for it)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Export takes that are already up to date again."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.hdf5_path):
+        logger.error(f"Input file does not exist: {args.hdf5_path}")
+        return 1
+
+    try:
+        export_raw_frames(args.hdf5_path, output_dir=args.output_dir, overwrite=args.overwrite)
+        return 0
+    except Exception as e:
+        logger.error(f"Error exporting raw frames: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Video export of EgoExOR takes: one compressed stream per camera, decoded on read.
+
+Every camera of a take's `frames/rgb` ([num_frames, num_cameras, H, W, 3] uint8) is
+encoded to `<output_dir>/<surgery_type>_<procedure_id>_<take_id>/cam<index>.mkv`
+(H.264, HEVC or MJPEG through PyAV), with a fixed GOP and no B-frames, so any frame is
+decoded from the keyframe before it without looking ahead. A JSON header per take
+(`<surgery_type>_<procedure_id>_<take_id>.json`) lists the keyframes of every stream:
+
+    {"version": 2, "take": "data/<surgery_type>/<procedure_id>/take/<take_id>",
+     "shape": [...], "fps": 15, "codec": "h264", "gop": 16, "signature": {...},
+     "cameras": {"0": {"file": "<stem>/cam0.mkv", "keyframes": [0, 16, ...], "blank": [[start, stop], ...],
+                       "bytes": ...}, ...}}
+
+`blank` lists the frame ranges in which the camera's view is all zeros. Lossy codecs do not
+decode them back to exact zeros, so the reader returns zeros for them instead of decoding.
+
+`signature` is the size/mtime of the HDF5 file the export was made from; the header is
+written last. The default output directory is `<hdf5_path>.videoframes`; the loaders read
+from it when there is no raw export (`VideoFrameStore` in
+scene_graph_helpers/dataset/video_frames.py), decoding whole GOPs and caching them.
+
+H.264/HEVC are lossy: the frames the model sees are not bit-identical to the HDF5 frames
+(compare the validation metrics before training on an export). Requires PyAV (pip install av).
+
+Usage (from the repository root):
+    python -m data.utils.export_video_frames --hdf5_path EgoExOR.h5 --codec h264 --crf 18 --gop 16
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from fractions import Fraction
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from data.utils.export_raw_frames import FRAMES_KEY, take_file_stem
+from data.utils.hdf5_utils import file_signature, iter_takes, open_for_scan
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+VIDEO_FRAMES_VERSION = 2
+VIDEO_FRAMES_SUFFIX = '.videoframes'
+CODECS = {'h264': 'libx264', 'hevc': 'libx265', 'mjpeg': 'mjpeg'}
+
+
+def _read_header(header_path):
+    try:
+        with open(header_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _open_stream(path, codec, height, width, fps, crf, gop):
+    """Output container and video stream of one camera, with a fixed GOP and no B-frames."""
+    container = av.open(path, mode='w')
+    stream = container.add_stream(CODECS[codec], rate=fps)
+    # yuv420p needs even sizes, frames are edge-padded and cropped again on read
+    stream.height = height + height % 2
+    stream.width = width + width % 2
+    stream.codec_context.gop_size = gop
+    if codec == 'h264':
+        stream.pix_fmt = 'yuv420p'
+        stream.options = {'crf': str(crf), 'bf': '0', 'sc_threshold': '0'}
+    elif codec == 'hevc':
+        stream.pix_fmt = 'yuv420p'
+        stream.options = {'crf': str(crf),
+                          'x265-params': f'keyint={gop}:min-keyint={gop}:scenecut=0:bframes=0:log-level=error'}
+    else:
+        stream.pix_fmt = 'yuvj420p'
+    return container, stream
+
+
+def blank_ranges(blank):
+    """[start, stop) ranges of the True entries of a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], blank, [False]]).astype(np.int8)))
+    return edges.reshape(-1, 2).tolist()
+
+
+def _mux(container, packets, keyframes, fps):
+    for packet in packets:
+        if packet.pts is not None and packet.is_keyframe:
+            keyframes.append(int(round(float(packet.pts * packet.time_base) * fps)))
+        container.mux(packet)
+
+
+def export_take(frame_ds, take_path, output_dir, signature, codec, crf, gop, fps):
+    """Encode every camera of one take. Reads one chunk row of frames at a time, for all cameras."""
+    stem = take_file_stem(take_path)
+    num_frames, num_cameras, height, width = frame_ds.shape[:4]
+    take_dir = os.path.join(output_dir, stem)
+    os.makedirs(take_dir, exist_ok=True)
+
+    paths = [os.path.join(take_dir, f'cam{cam_idx}.mkv') for cam_idx in range(num_cameras)]
+    tmp_paths = [f'{path}.tmp{os.getpid()}.mkv' for path in paths]
+    outputs = [_open_stream(tmp_path, codec, height, width, fps, crf, gop) for tmp_path in tmp_paths]
+    keyframes = [[] for _ in range(num_cameras)]
+    blank = np.zeros((num_cameras, num_frames), dtype=bool)
+    pad = ((0, height % 2), (0, width % 2), (0, 0))
+    try:
+        step = frame_ds.chunks[0] if frame_ds.chunks else 1
+        for start in range(0, num_frames, step):
+            block = frame_ds[start:start + step]
+            for offset, frame in enumerate(block):
+                for cam_idx, (container, stream) in enumerate(outputs):
+                    blank[cam_idx, start + offset] = not frame[cam_idx].any()
+                    image = np.pad(frame[cam_idx], pad, mode='edge') if height % 2 or width % 2 else frame[cam_idx]
+                    video_frame = av.VideoFrame.from_ndarray(np.ascontiguousarray(image), format='rgb24')
+                    video_frame.pts = start + offset
+                    video_frame.time_base = Fraction(1, fps)
+                    _mux(container, stream.encode(video_frame), keyframes[cam_idx], fps)
+        for cam_idx, (container, stream) in enumerate(outputs):
+            _mux(container, stream.encode(None), keyframes[cam_idx], fps)
+    finally:
+        for container, _ in outputs:
+            container.close()
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+
+    cameras = {}
+    for cam_idx, path in enumerate(paths):
+        cam_keyframes = sorted(set(keyframes[cam_idx]))
+        if not cam_keyframes or cam_keyframes[0] != 0:
+            raise RuntimeError(f"{path}: the stream does not start with a keyframe")
+        cameras[str(cam_idx)] = {'file': os.path.relpath(path, output_dir), 'keyframes': cam_keyframes,
+                                 'blank': blank_ranges(blank[cam_idx]), 'bytes': os.path.getsize(path)}
+    header = {
+        'version': VIDEO_FRAMES_VERSION,
+        'take': take_path,
+        'shape': list(frame_ds.shape),
+        'fps': fps,
+        'codec': codec,
+        'gop': gop,
+        'signature': signature,
+        'cameras': cameras,
+    }
+    header_path = os.path.join(output_dir, f'{stem}.json')
+    with open(f'{header_path}.tmp{os.getpid()}', 'w') as f:
+        json.dump(header, f)
+    os.replace(f'{header_path}.tmp{os.getpid()}', header_path)
+    return sum(camera['bytes'] for camera in cameras.values())
+
+
+def export_video_frames(hdf5_path, output_dir=None, codec='h264', crf=18, gop=16, fps=15, overwrite=False):
+    """Encode `frames/rgb` of every take whose header is missing or stale (all of them with `overwrite`)."""
+    start = time.time()
+    output_dir = output_dir or os.fspath(hdf5_path) + VIDEO_FRAMES_SUFFIX
+    os.makedirs(output_dir, exist_ok=True)
+    signature = file_signature(hdf5_path)
+    exported = skipped = raw_bytes = video_bytes = 0
+    with open_for_scan(hdf5_path) as f:
+        for take_path in iter_takes(f):
+            take_group = f[take_path]
+            if FRAMES_KEY not in take_group:
+                continue
+            frame_ds = take_group[FRAMES_KEY]
+            header = _read_header(os.path.join(output_dir, f'{take_file_stem(take_path)}.json'))
+            if not overwrite and header is not None and header.get('version') == VIDEO_FRAMES_VERSION \
+                    and header.get('signature') == signature and header.get('shape') == list(frame_ds.shape) \
+                    and header.get('codec') == codec and header.get('gop') == gop:
+                skipped += 1
+                continue
+            take_bytes = export_take(frame_ds, take_path, output_dir, signature, codec, crf, gop, fps)
+            take_raw_bytes = frame_ds.size * frame_ds.dtype.itemsize
+            raw_bytes += take_raw_bytes
+            video_bytes += take_bytes
+            exported += 1
+            logger.info(f"{take_path}: {frame_ds.shape[0]} frames, {take_raw_bytes / max(take_bytes, 1):.1f}x smaller")
+    logger.info(f"Exported {exported} takes ({video_bytes / 1024 ** 3:.2f} GB, "
+                f"{raw_bytes / max(video_bytes, 1):.1f}x smaller than uncompressed, {skipped} up to date) "
+                f"to {output_dir} in {time.time() - start:.1f}s")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Encode frames/rgb of every take as one video stream per camera.")
+    parser.add_argument(
+        "--hdf5_path",
+        type=str,
+        required=True,
+        help="HDF5 file to export."
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help=f"Output directory (default: <hdf5_path>{VIDEO_FRAMES_SUFFIX}, where the loaders look for it)."
+    )
+    parser.add_argument(
+        "--codec",
+        type=str,
+        default="h264",
+        choices=sorted(CODECS),
+        help="Video codec (MJPEG: every frame is a keyframe)."
+    )
+    parser.add_argument(
+        "--crf",
+        type=int,
+        default=18,
+        help="Constant rate factor of H.264/HEVC (lower is better quality)."
+    )
+    parser.add_argument(
+        "--gop",
+        type=int,
+        default=16,
+        help="Frames per GOP: a read decodes up to this many frames of a camera."
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=15,
+        help="Frame rate written to the streams (frames are addressed by index)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Export takes that are already up to date again."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if av is None:
+        logger.error("Exporting video frames requires PyAV (pip install av)")
+        return 1
+    if not os.path.exists(args.hdf5_path):
+        logger.error(f"Input file does not exist: {args.hdf5_path}")
+        return 1
+
+    try:
+        export_video_frames(args.hdf5_path, output_dir=args.output_dir, codec=args.codec, crf=args.crf,
+                            gop=args.gop, fps=args.fps, overwrite=args.overwrite)
+        return 0
+    except Exception as e:
+        logger.error(f"Error exporting video frames: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Blank-camera bitmap of EgoExOR takes.
+
+A camera that did not record at a timestep is stored as an all-zero view in `frames/rgb`.
+Loaders used to read every ego view and scan its pixels (`img.any()`) only to discard the
+blank ones. This tool scans each take once and stores which views hold an image:
+
+    frames/valid    [num_frames, ceil(num_cameras / 8)]    uint8, np.packbits of the
+                                                            [num_frames, num_cameras] mask
+
+Bit `cam` of row `frame` (`np.unpackbits(valid[frame], count=num_cameras)[cam]`) is set when
+the view has a non-zero pixel. The take index picks the bitmap up, so loaders skip blank
+views before reading them. `frames/rgb` is not modified, and rechunk_h5.py copies the bitmap.
+
+Usage (from the repository root):
+    python -m data.utils.frame_validity --hdf5_path egoexor.h5
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from data.utils.hdf5_utils import iter_takes, open_for_scan
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FRAMES_KEY = 'frames/rgb'
+VALIDITY_KEY = 'frames/valid'
+
+
+def compute_validity(frame_ds):
+    """Bool [num_frames, num_cameras]: True where a view has a non-zero pixel. Reads one chunk row of frames at a time."""
+    num_frames, num_cameras = frame_ds.shape[:2]
+    step = frame_ds.chunks[0] if frame_ds.chunks else 1
+    valid = np.zeros((num_frames, num_cameras), dtype=bool)
+    for start in range(0, num_frames, step):
+        block = frame_ds[start:start + step]
+        valid[start:start + len(block)] = block.reshape(len(block), num_cameras, -1).any(axis=2)
+    return valid
+
+
+def write_validity(take_group, valid):
+    """Write (or replace) the packed bitmap of a take."""
+    if VALIDITY_KEY in take_group:
+        del take_group[VALIDITY_KEY]
+    ds = take_group.create_dataset(VALIDITY_KEY, data=np.packbits(valid, axis=1))
+    ds.attrs['num_cameras'] = valid.shape[1]
+
+
+def build_validity(hdf5_path, overwrite=False):
+    """Add the blank-camera bitmap to every take of an HDF5 file that lacks one."""
+    start = time.time()
+    built = skipped = 0
+    with open_for_scan(hdf5_path, 'a') as f:
+        for take_path in iter_takes(f):
+            take_group = f[take_path]
+            if FRAMES_KEY not in take_group or (VALIDITY_KEY in take_group and not overwrite):
+                skipped += 1
+                continue
+            valid = compute_validity(take_group[FRAMES_KEY])
+            write_validity(take_group, valid)
+            built += 1
+            logger.info(f"{take_path}: {int((~valid).sum())} of {valid.size} views blank")
+    logger.info(f"Wrote {built} bitmaps ({skipped} takes skipped) in {time.time() - start:.1f}s")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Store a bitmap of the non-blank camera views of every take.")
+    parser.add_argument(
+        "--hdf5_path",
+        type=str,
+        required=True,
+        help="HDF5 file to scan (modified in place)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Recompute bitmaps that already exist."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.hdf5_path):
+        logger.error(f"Input file does not exist: {args.hdf5_path}")
+        return 1
+
+    try:
+        build_validity(args.hdf5_path, overwrite=args.overwrite)
+        return 0
+    except Exception as e:
+        logger.error(f"Error computing frame validity: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Helpers shared by the tools that walk the takes of an EgoExOR HDF5 file.
+"""
+import os
+
+import h5py
+
+# Chunk cache of the tools that scan every frame of a take (exports, frame_validity.py): a
+# large one, so chunks spanning several frames are decompressed once.
+SCAN_RDCC_NBYTES = 512 * 1024 ** 2
+
+
+def open_for_scan(hdf5_path, mode='r'):
+    """The HDF5 file opened with the chunk cache of a full scan."""
+    return h5py.File(hdf5_path, mode, rdcc_nbytes=SCAN_RDCC_NBYTES)
+
+
+def iter_takes(h5_file):
+    """Path of every take group (data/<surgery_type>/<procedure_id>/take/<take_id>) of the file."""
+    if 'data' not in h5_file:
+        return
+    for surgery_type in h5_file['data']:
+        for procedure_id in h5_file[f'data/{surgery_type}']:
+            takes_path = f'data/{surgery_type}/{procedure_id}/take'
+            if takes_path not in h5_file:
+                continue
+            for take_id in h5_file[takes_path]:
+                yield f'{takes_path}/{take_id}'
+
+
+def file_signature(path):
+    """Size and modification time of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
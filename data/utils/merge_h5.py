@@ -5,11 +5,27 @@ Script to merge multiple EgoExOR HDF5 dataset files into a single file.
 This script takes multiple HDF5 files and combines them into a single file, 
 preserving all data and optionally, recalculating the train/validation/test splits.
 
-Example usage:
-    python merge_h5.py --input_files file1.h5 file2.h5 --output_file merged.h5
+Example usage (from the repository root):
+    python -m data.utils.merge_h5 --data_dir /path/to/dataset --input_files file1.h5 file2.h5 --output_file merged.h5
+
+With `--num_workers N` the takes are copied by N processes into temporary files next to
+the output and then moved into it, which gives the same datasets as the serial merge.
+
+Every copied take is recorded in `<output_file>.manifest.json`. Running the merge again
+on the same output resumes it: intact takes are kept and only new or damaged takes are
+copied, so publishing one more input file does not require a full rebuild
+(`--overwrite` rebuilds from scratch, `--verify` rechecks content hashes).
+
+With `--virtual` no take data is copied: every take of the output is an HDF5 external
+link into its input file (stored relative to the output), and only `metadata` and
+`splits` are written physically. The input files must stay in place.
 """
 import os
 import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
 import h5py
 import random
 import logging
@@ -19,6 +35,11 @@ from pathlib import Path
 from sklearn.model_selection import train_test_split
 import random
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from data.utils.rechunk_h5 import CODECS, LAYOUTS, copy_dataset_rechunked, is_rechunk_target
+from data.utils.hdf5_utils import file_signature
+from data.utils.merge_manifest import MergeManifest, open_take, take_datasets, take_hash
 
 
 # Set up logging
@@ -55,9 +76,50 @@ def parse_args():
         required=True,
         help="Path to save the merged HDF5 dataset."
     )
+    parser.add_argument(
+        "--rechunk_layout",
+        type=str,
+        choices=LAYOUTS,
+        default=None,
+        help="Rewrite frames/rgb, point_cloud/* and audio/snippets with this chunk layout while merging (see rechunk_h5)."
+    )
+    parser.add_argument(
+        "--rechunk_codec",
+        type=str,
+        choices=CODECS,
+        default="lzf",
+        help="Codec of the rewritten datasets, only used with --rechunk_layout."
+    )
+    parser.add_argument(
+        "--rechunk_threads",
+        type=int,
+        default=1,
+        help="Compression threads, only used with --rechunk_layout."
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Worker processes copying takes in parallel (1 keeps the serial merge)."
+    )
+    parser.add_argument(
+        "--virtual",
+        action="store_true",
+        help="Link the takes of the input files instead of copying them (zero-copy, read-only use)."
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Rebuild the output from scratch instead of resuming from its manifest."
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="When resuming, recompute the content hash of every take already in the output."
+    )
     return parser.parse_args()
 
-def copy_group(src_file, dst_file, src_path, dst_path=None):
+def copy_group(src_file, dst_file, src_path, dst_path=None, rechunk=None, take_jobs=None):
     """
     Copy a group and all its contents from src_file to dst_file.
     
@@ -66,7 +128,15 @@ def copy_group(src_file, dst_file, src_path, dst_path=None):
         dst_file: Destination HDF5 file object
         src_path: Path to the source group
         dst_path: Path to the destination group (if different from src_path)
+        rechunk: Optional keyword arguments of rechunk_h5.copy_dataset_rechunked; when given,
+            the per-frame datasets of each take are rewritten instead of copied as-is
+        take_jobs: Optional list; when given, take groups are not copied but appended to it as
+            (source file, take path) and an empty placeholder group is created in dst_file
     """
+    if take_jobs is not None and _is_take_path(src_path) and src_path in src_file:
+        _defer_take(src_file, dst_file, src_path, take_jobs)
+        return
+
     if dst_path is None:
         dst_path = src_path
     
@@ -92,11 +162,223 @@ def copy_group(src_file, dst_file, src_path, dst_path=None):
             
             if isinstance(item, h5py.Group):
                 # Recursively copy subgroups
-                copy_group(src_file, dst_file, src_item_path, dst_item_path)
+                copy_group(src_file, dst_file, src_item_path, dst_item_path, rechunk=rechunk, take_jobs=take_jobs)
             else:
                 # Copy dataset if it doesn't exist
                 if dst_item_path not in dst_file:
-                    src_file.copy(src_item_path, dst_file[dst_path])
+                    if rechunk is not None and is_rechunk_target(dst_item_path):
+                        copy_dataset_rechunked(item, dst_file[dst_path], name, **rechunk)
+                    else:
+                        src_file.copy(src_item_path, dst_file[dst_path])
+
+def _is_take_path(path):
+    """Return True for `data/<surgery_type>/<procedure_id>/take/<take_id>`."""
+    parts = path.strip('/').split('/')
+    return len(parts) == 5 and parts[0] == 'data' and parts[3] == 'take'
+
+
+def _defer_take(src_file, dst_file, take_path, take_jobs):
+    """Record a take to copy and reserve its name in the output."""
+    dst_file.require_group(os.path.dirname(take_path))
+    dst_file.create_group(take_path)
+    take_jobs.append((src_file.filename, take_path))
+
+
+def _group_storage_size(group):
+    """Bytes allocated in the file by all datasets below `group`."""
+    sizes = []
+    group.visititems(lambda name, item: sizes.append(item.id.get_storage_size())
+                     if isinstance(item, h5py.Dataset) else None)
+    return sum(sizes)
+
+
+def _copy_take_worker(input_file, take_path, tmp_dir, rechunk):
+    """
+    Copy one take into the temporary file of this worker process.
+
+    Returns:
+        (take_path, worker_file, bytes, seconds, datasets, content hash)
+    """
+    worker_file = os.path.join(tmp_dir, f"worker_{os.getpid()}.h5")
+    start = time.perf_counter()
+    with h5py.File(input_file, 'r') as in_file, h5py.File(worker_file, 'a') as out_file:
+        copy_group(in_file, out_file, take_path, rechunk=rechunk)
+        # object copies keep the raw chunks, so the hash also holds for the output file
+        group = out_file[take_path]
+        nbytes = _group_storage_size(group)
+        datasets, content_hash = take_datasets(group), take_hash(group)
+    return take_path, worker_file, nbytes, time.perf_counter() - start, datasets, content_hash
+
+
+def _copy_takes_serial(out_file, take_jobs, rechunk=None, manifest=None):
+    """
+    Copy the deferred takes one after another in this process.
+
+    Args:
+        out_file: Output HDF5 file object holding a placeholder group per take
+        take_jobs: List of (input file, take path)
+        rechunk: Optional rechunk options
+        manifest: Optional MergeManifest updated after every take
+    """
+    total_bytes = 0
+    start = time.perf_counter()
+    for done, (input_file, take_path) in enumerate(take_jobs, 1):
+        with h5py.File(input_file, 'r') as in_file:
+            del out_file[take_path]
+            copy_group(in_file, out_file, take_path, rechunk=rechunk)
+        group = out_file[take_path]
+        total_bytes += _group_storage_size(group)
+        if manifest is not None:
+            _record_take(out_file, manifest, take_path, input_file, take_datasets(group), take_hash(group))
+        logger.info(f"[{done}/{len(take_jobs)}] Copied {take_path}")
+    if take_jobs:
+        elapsed = time.perf_counter() - start
+        logger.info(f"Copied {len(take_jobs)} takes ({total_bytes / 1e9:.2f} GB) in {elapsed:.1f}s, "
+                    f"{total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s")
+
+
+def _link_takes(out_file, take_jobs, manifest=None):
+    """
+    Replace the placeholder of every deferred take with an external link into its input file.
+
+    Link targets are stored relative to the output file, so the output and the input files
+    can be moved together. The relative paths of all linked files are kept in the root
+    attribute `virtual_sources`, which lets readers keep those files open.
+
+    Args:
+        out_file: Output HDF5 file object holding a placeholder group per take
+        take_jobs: List of (input file, take path)
+        manifest: Optional MergeManifest updated after every take
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_file.filename))
+    sources = set(out_file.attrs.get('virtual_sources', []))
+    for done, (input_file, take_path) in enumerate(take_jobs, 1):
+        source = os.path.relpath(os.path.abspath(input_file), out_dir)
+        del out_file[take_path]
+        out_file[take_path] = h5py.ExternalLink(source, f'/{take_path}')
+        sources.add(source)
+        out_file.attrs['virtual_sources'] = sorted(sources)
+        if manifest is not None:
+            with open_take(out_file, take_path) as group:
+                datasets = take_datasets(group)
+            _record_take(out_file, manifest, take_path, input_file, datasets, None)
+        logger.info(f"[{done}/{len(take_jobs)}] Linked {take_path} -> {source}")
+
+
+def _record_take(out_file, manifest, take_path, input_file, datasets, content_hash):
+    """Add a copied take to the manifest once it is on disk."""
+    out_file.flush()
+    manifest.record_take(take_path, input_file, datasets, content_hash)
+    manifest.save()
+
+
+def _copy_takes_parallel(out_file, take_jobs, num_workers, rechunk=None, manifest=None):
+    """
+    Copy the deferred takes with a process pool and move them into the output file.
+
+    Every worker writes the takes it receives into its own temporary file next to the
+    output. Afterwards the takes are copied into the output in the same order the
+    serial merge would have copied them; HDF5 object copies move the raw chunks, so
+    the resulting datasets are byte-identical to the serial merge.
+
+    Args:
+        out_file: Output HDF5 file object holding a placeholder group per take
+        take_jobs: List of (input file, take path)
+        num_workers: Number of worker processes
+        rechunk: Optional rechunk options (the thread pool is not shared with the workers)
+        manifest: Optional MergeManifest updated after every take moved into the output
+    """
+    if not take_jobs:
+        return
+    worker_rechunk = None
+    if rechunk is not None:
+        worker_rechunk = {k: v for k, v in rechunk.items() if k != 'executor'}
+
+    tmp_dir = tempfile.mkdtemp(prefix=".merge_h5_", dir=os.path.dirname(os.path.abspath(out_file.filename)))
+    worker_files, worker_results = {}, {}
+    total_bytes = 0
+    start = time.perf_counter()
+    try:
+        # spawn: the parent holds the output file open for writing, children must not inherit it
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_copy_take_worker, input_file, take_path, tmp_dir, worker_rechunk)
+                       for input_file, take_path in take_jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                take_path, worker_file, nbytes, seconds, datasets, content_hash = future.result()
+                worker_files[take_path] = worker_file
+                worker_results[take_path] = (datasets, content_hash)
+                total_bytes += nbytes
+                elapsed = time.perf_counter() - start
+                logger.info(f"[{done}/{len(futures)}] Copied {take_path}: {nbytes / 1e6:.1f} MB in {seconds:.1f}s "
+                            f"(overall {total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s)")
+
+        copy_start = time.perf_counter()
+        handles = {}
+        try:
+            for input_file, take_path in take_jobs:
+                worker_file = worker_files[take_path]
+                if worker_file not in handles:
+                    handles[worker_file] = h5py.File(worker_file, 'r')
+                src = handles[worker_file]
+                del out_file[take_path]
+                src.copy(src[take_path], out_file[os.path.dirname(take_path)], name=os.path.basename(take_path))
+                if manifest is not None:
+                    _record_take(out_file, manifest, take_path, input_file, *worker_results[take_path])
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Copied {len(take_jobs)} takes ({total_bytes / 1e9:.2f} GB) with {num_workers} workers in "
+                    f"{elapsed:.1f}s, {total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s "
+                    f"(moving into the output took {time.perf_counter() - copy_start:.1f}s)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+SPLIT_DTYPE = [
+    ('surgery_type', h5py.string_dtype()),
+    ('procedure_id', np.int32),
+    ('take_id', np.int32),
+    ('frame_id', np.int32)
+]
+
+
+def build_frame_entries(takes, frame_counts):
+    """
+    Expand takes into one split entry per frame.
+
+    Args:
+        takes: List of tuples (surgery_type, procedure_id, take_id)
+        frame_counts: Number of frames of each take
+
+    Returns:
+        Structured array with SPLIT_DTYPE, frames of each take in order
+    """
+    counts = np.asarray(frame_counts, dtype=np.int64).reshape(-1)
+    entries = np.empty(int(counts.sum()), dtype=SPLIT_DTYPE)
+    if len(entries) == 0:
+        return entries
+
+    surgery_types = np.empty(len(takes), dtype=object)
+    surgery_types[:] = [take[0] for take in takes]
+    entries['surgery_type'] = np.repeat(surgery_types, counts)
+    entries['procedure_id'] = np.repeat(np.asarray([int(take[1]) for take in takes], dtype=np.int32), counts)
+    entries['take_id'] = np.repeat(np.asarray([int(take[2]) for take in takes], dtype=np.int32), counts)
+    # frame id = position inside the own take
+    take_starts = np.cumsum(counts) - counts
+    entries['frame_id'] = np.arange(len(entries)) - np.repeat(take_starts, counts)
+    return entries
+
+
+def _take_frame_counts(h5_file, takes):
+    """Number of RGB frames of each (surgery_type, procedure_id, take_id), 0 if it has none."""
+    counts = []
+    for surgery_type, procedure_id, take_id in takes:
+        frames_key = f"data/{surgery_type}/{procedure_id}/take/{take_id}/frames/rgb"
+        counts.append(h5_file[frames_key].shape[0] if frames_key in h5_file else 0)
+    return counts
+
 
 def get_take_frame_entries(h5_file):
     """
@@ -106,12 +388,12 @@ def get_take_frame_entries(h5_file):
         h5_file: HDF5 file object
         
     Returns:
-        List of tuples (surgery_type, procedure_id, take_id, frame_id)
+        Structured array with SPLIT_DTYPE, one row (surgery_type, procedure_id, take_id, frame_id) per frame
     """
-    entries = []
+    takes, counts = [], []
     
     if 'data' not in h5_file:
-        return entries
+        return build_frame_entries(takes, counts)
     
     # Iterate through all surgery types
     for surgery_type in h5_file['data']:
@@ -125,14 +407,12 @@ def get_take_frame_entries(h5_file):
                     frames_path = f'{take_path}/{take_id}/frames/rgb'
                     if frames_path in h5_file:
                         try:
-                            num_frames = h5_file[frames_path].shape[0]
-                            # Add entry for each frame
-                            for frame_id in range(num_frames):
-                                entries.append((surgery_type, int(procedure_id), int(take_id), frame_id))
+                            counts.append(h5_file[frames_path].shape[0])
+                            takes.append((surgery_type, int(procedure_id), int(take_id)))
                         except Exception as e:
                             logger.warning(f"Error getting frame count for {frames_path}: {e}")
     
-    return entries
+    return build_frame_entries(takes, counts)
 
 
 
@@ -141,21 +421,17 @@ def _populate_split(h5_file, split_name, entries):
         
     Args:
         split_name: Name of the split (train, validation, test)
-        entries: List of tuples (surgery_type, clip_id, subclip_id, frame_idx)
+        entries: Structured array with SPLIT_DTYPE (see build_frame_entries), or a list of
+            tuples (surgery_type, clip_id, subclip_id, frame_idx)
     """
-    # Create structured array for split
-    split_dtype = [
-        ('surgery_type', h5py.string_dtype()),
-        ('procedure_id', np.int32),
-        ('take_id', np.int32),
-        ('frame_id', np.int32)
-    ]
-    
-    # Convert entries to structured array
-    split_data = np.array(
-        [(entry[0], int(entry[1]), int(entry[2]), int(entry[3])) for entry in entries],
-        dtype=split_dtype
-    )
+    if isinstance(entries, np.ndarray):
+        split_data = entries.astype(SPLIT_DTYPE, copy=False)
+    else:
+        # Convert entries to structured array
+        split_data = np.array(
+            [(entry[0], int(entry[1]), int(entry[2]), int(entry[3])) for entry in entries],
+            dtype=SPLIT_DTYPE
+        )
 
     # Create group if it doesn't exist
     if "splits" not in h5_file:
@@ -247,24 +523,16 @@ def create_splits(h5_file, train_size=0.7, val_size=0.15, test_size=0.15, random
         for tid in test_ids:
             test_subclips.append((surgery_type, procedure_id, tid))
 
-    # Helper: expand takes to frame entries
-    def _populate_frames(subclips, out_list):
-        for surgery_type, procedure_id, take_id in subclips:
-            frames_key = f"data/{surgery_type}/{procedure_id}/take/{take_id}/frames/rgb"
-            if frames_key in h5_file:
-                for fid in range(len(h5_file[frames_key])):
-                    out_list.append((surgery_type, procedure_id, take_id, fid))
-
-    # Build frame-level splits
-    train_entries, val_entries, test_entries = [], [], []
-    _populate_frames(train_subclips, train_entries)
-    _populate_frames(val_subclips,   val_entries)
-    _populate_frames(test_subclips,  test_entries)
-
-    # Shuffle for randomness
-    random.shuffle(train_entries)
-    random.shuffle(val_entries)
-    random.shuffle(test_entries)
+    # Expand takes to frame entries, one vectorized block per split
+    train_entries = build_frame_entries(train_subclips, _take_frame_counts(h5_file, train_subclips))
+    val_entries = build_frame_entries(val_subclips, _take_frame_counts(h5_file, val_subclips))
+    test_entries = build_frame_entries(test_subclips, _take_frame_counts(h5_file, test_subclips))
+
+    # Shuffle for randomness (random.shuffle of the row order, same permutation as shuffling a list)
+    for entries in (train_entries, val_entries, test_entries):
+        order = list(range(len(entries)))
+        random.shuffle(order)
+        entries[:] = entries[order]
 
     # Populate HDF5 groups
     _populate_split(h5_file, "train",      train_entries)
@@ -278,19 +546,99 @@ def create_splits(h5_file, train_size=0.7, val_size=0.15, test_size=0.15, random
     print(f"Test:  {len(test_entries)} frames ({len(test_entries)/total:.1%})")
 
 
-def merge_files(input_files, splits_file, output_file):
+def merge_files(input_files, splits_file, output_file, rechunk_layout=None, rechunk_codec="lzf",
+                rechunk_level=None, rechunk_threads=1, num_workers=1, overwrite=False, verify=False,
+                virtual=False):
     """
     Merge multiple HDF5 files into a single file.
     
     Args:
         input_files: List of input file paths
         output_file: Output file path
+        rechunk_layout: If set ('camera' or 'frame'), rewrite frames/rgb, point_cloud/* and
+            audio/snippets for random frame access while copying (see rechunk_h5)
+        rechunk_codec: Codec of the rewritten datasets
+        rechunk_level: Optional compression level of the rewritten datasets
+        rechunk_threads: Compression threads
+        num_workers: If > 1, takes are copied in parallel by this many worker processes
+        overwrite: Rebuild the output from scratch even if it has a manifest
+        verify: When resuming, recompute the content hash of the takes already in the output
+        virtual: Link the takes into the input files instead of copying them; only
+            `metadata` and `splits` are written to the output
+
+    Every copied take is recorded in `<output_file>.manifest.json`. If the output and its
+    manifest already exist, the merge resumes: intact takes are kept, damaged, partial or
+    outdated ones are removed, and only missing takes are copied.
     """
     # Ensure output directory exists
     os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
 
-    # Create new output file
-    with h5py.File(output_file, 'w') as out_file:
+    if virtual and rechunk_layout is not None:
+        raise ValueError("A virtual merge links the input datasets, they cannot be rechunked")
+
+    rechunk, executor = None, None
+    if rechunk_layout is not None:
+        executor = ThreadPoolExecutor(max_workers=rechunk_threads) if rechunk_threads > 1 else None
+        rechunk = dict(layout=rechunk_layout, codec=rechunk_codec, level=rechunk_level, executor=executor)
+        logger.info(f"Rewriting per-frame datasets with layout={rechunk_layout}, codec={rechunk_codec}")
+    try:
+        _merge_files(input_files, splits_file, output_file, rechunk, num_workers, overwrite, verify, virtual)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _prune_output(out_file, manifest, verify=False):
+    """
+    Remove every take of a resumed output that is not intact according to the manifest.
+
+    Args:
+        out_file: Output HDF5 file object opened for appending
+        manifest: MergeManifest of the output
+        verify: Also compare content hashes
+    """
+    present = []
+    if 'data' in out_file:
+        for surgery_type in out_file['data']:
+            for procedure_id in out_file[f'data/{surgery_type}']:
+                takes_path = f'data/{surgery_type}/{procedure_id}/take'
+                if takes_path in out_file:
+                    present.extend(f'{takes_path}/{take_id}' for take_id in out_file[takes_path])
+
+    kept = 0
+    for take_path in present:
+        reason = manifest.check_take(out_file, take_path, verify=verify)
+        if reason is None:
+            kept += 1
+            continue
+        logger.warning(f"Removing {take_path} from the output: {reason}")
+        del out_file[take_path]
+        manifest.forget(take_path)
+    for take_path in list(manifest.takes):
+        if take_path not in out_file:
+            logger.warning(f"Dropping {take_path} from the manifest: missing from the output file")
+            manifest.forget(take_path)
+    manifest.save()
+    logger.info(f"Resuming merge: keeping {kept} intact takes")
+
+
+def _merge_files(input_files, splits_file, output_file, rechunk=None, num_workers=1, overwrite=False, verify=False,
+                 virtual=False):
+    # The walk below only plans: takes are deferred and copied afterwards, serially or in parallel
+    take_jobs = []
+
+    manifest = None if overwrite else MergeManifest.load(output_file)
+    resume = manifest is not None and os.path.exists(output_file)
+    if not resume:
+        manifest = MergeManifest(output_file)
+
+    # Create new output file, or append to the one the manifest describes
+    with h5py.File(output_file, 'a' if resume else 'w') as out_file:
+        if resume:
+            _prune_output(out_file, manifest, verify=verify)
+        else:
+            manifest.save()
+
         # Initialize the base structure from the first file
         logger.info(f"Initializing base structure from {input_files[0]}")
         with h5py.File(input_files[0], 'r') as first_file:
@@ -330,7 +678,7 @@ def merge_files(input_files, splits_file, output_file):
                             # If clip doesn't exist in output, copy the entire clip
                             if procedure_id not in out_file[f'data/{surgery_type}']:
                                 logger.info(f"Copying {procedure_path}")
-                                copy_group(in_file, out_file, procedure_path)
+                                copy_group(in_file, out_file, procedure_path, rechunk=rechunk, take_jobs=take_jobs)
                             else:
                                 # Clip exists, check individual subclips
                                 logger.info(f"Data {procedure_path} exists, checking for new take")
@@ -344,19 +692,31 @@ def merge_files(input_files, splits_file, output_file):
                                         # Copy subclip if it doesn't exist in output
                                         if take_id not in out_file[takes_path]:
                                             logger.info(f"Copying new subclip {take_path}")
-                                            copy_group(in_file, out_file, take_path)
+                                            copy_group(in_file, out_file, take_path, rechunk=rechunk, take_jobs=take_jobs)
                                         else:
                                             logger.warning(f"Skipping {take_path} - already exists in output file")
                                 elif takes_path in in_file:
                                     # Subclips folder exists in input but not in output
                                     logger.info(f"Adding subclips folder to {procedure_path}")
-                                    copy_group(in_file, out_file, takes_path)
+                                    copy_group(in_file, out_file, takes_path, rechunk=rechunk, take_jobs=take_jobs)
                                 else:
                                     logger.warning(f"No subclips found in {procedure_path}")
+
+        if virtual:
+            _link_takes(out_file, take_jobs, manifest)
+        elif num_workers > 1:
+            _copy_takes_parallel(out_file, take_jobs, num_workers, rechunk, manifest)
+        else:
+            _copy_takes_serial(out_file, take_jobs, rechunk, manifest)
         
         # —— 3) Inject the supplied splits file ——
         # if you want to create new splits you should call create_splits(h5_file=out_file, *args) and comment the below lines.
-        if splits_file is not None:
+        # the injected splits only change with the splits file, keep them when it did not change
+        splits_signature = file_signature(splits_file) if splits_file is not None else None
+        if resume and splits_file is not None and manifest.splits == splits_signature \
+                and 'splits' in out_file and len(out_file['splits']) > 0:
+            logger.info(f"Splits from {splits_file} are up to date")
+        elif splits_file is not None:
             logger.info(f"Loading splits from {splits_file}")
             with h5py.File(splits_file, 'r') as split_h5:
                 if 'splits' not in split_h5:
@@ -368,6 +728,9 @@ def merge_files(input_files, splits_file, output_file):
                     del out_file['splits']
                 # copy the entire splits group
                 split_h5.copy('splits', out_file, name='splits')
+            out_file.flush()
+            manifest.splits = splits_signature
+            manifest.save()
 
         logger.info(f"Dataset merge complete! Saved to {output_file}")
 
@@ -398,7 +761,14 @@ def main():
         merge_files(
             input_files,
             splits_file,
-            output_file
+            output_file,
+            rechunk_layout=args.rechunk_layout,
+            rechunk_codec=args.rechunk_codec,
+            rechunk_threads=args.rechunk_threads,
+            num_workers=args.num_workers,
+            overwrite=args.overwrite,
+            verify=args.verify,
+            virtual=args.virtual,
         )
         return 0
     except Exception as e:
@@ -0,0 +1,166 @@
+"""
+Manifest of a merged EgoExOR HDF5 file.
+
+`merge_h5` records every take it copies (source file, take path, dataset shapes and a
+content hash) in a JSON sidecar next to the output file. A later merge into the same
+output reads it back to keep the takes that are still intact and only copies what is
+new, missing or damaged. Datasets added to a take after the merge (e.g. `frames/valid`,
+`annotation_index/*`, `audio/clap_embedding`) are not part of the check, so resuming keeps them.
+"""
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+
+import h5py
+import numpy as np
+
+from data.utils.hdf5_utils import file_signature
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def take_datasets(group):
+    """Shape and dtype of every dataset below a take group, keyed by relative path."""
+    datasets = {}
+
+    def _visit(name, item):
+        if isinstance(item, h5py.Dataset):
+            datasets[name] = {'shape': list(item.shape), 'dtype': str(item.dtype)}
+    group.visititems(_visit)
+    return datasets
+
+
+@contextmanager
+def open_take(out_file, take_path):
+    """
+    Yield the group of a take of the output file.
+
+    Takes linked by a virtual merge are opened read-only in their source file: following
+    the link from an output opened for writing would open the source for writing too.
+    """
+    link = out_file.get(take_path, getlink=True)
+    if isinstance(link, h5py.ExternalLink):
+        source = os.path.join(os.path.dirname(os.path.abspath(out_file.filename)), link.filename)
+        with h5py.File(source, 'r') as src_file:
+            yield src_file[link.path]
+    else:
+        yield out_file[take_path]
+
+
+def _has_vlen(dtype):
+    if dtype.names:
+        return any(_has_vlen(dtype[name]) for name in dtype.names)
+    return dtype.kind == 'O' or h5py.check_vlen_dtype(dtype) is not None
+
+
+def _update_with_dataset(digest, ds):
+    digest.update(f"{ds.name}|{ds.shape}|{ds.dtype}".encode('utf-8'))
+    if ds.chunks is None or _has_vlen(ds.dtype):
+        # variable-length data is stored as heap references, hash the values instead
+        values = ds[()]
+        if isinstance(values, np.ndarray) and not _has_vlen(values.dtype):
+            digest.update(values.tobytes())
+        else:
+            for value in np.asarray(values, dtype=object).ravel():
+                digest.update(value if isinstance(value, bytes) else repr(value).encode('utf-8'))
+        return
+
+    # chunked data: hash the stored chunks without decompressing them
+    for i in range(ds.id.get_num_chunks()):
+        info = ds.id.get_chunk_info(i)
+        _, data = ds.id.read_direct_chunk(info.chunk_offset)
+        digest.update(np.asarray(info.chunk_offset, dtype=np.int64).tobytes())
+        digest.update(data)
+
+
+def take_hash(group, names=None):
+    """Content hash of a take group (the datasets `names`, by default all, in name order)."""
+    digest = hashlib.blake2b(digest_size=20)
+    if names is None:
+        names = []
+        group.visititems(lambda name, item: names.append(name) if isinstance(item, h5py.Dataset) else None)
+    for name in sorted(names):
+        _update_with_dataset(digest, group[name])
+    return digest.hexdigest()
+
+
+class MergeManifest:
+    """
+    JSON sidecar `<output>.manifest.json` describing the takes of a merged file.
+
+    `takes` maps a take path to {'source', 'source_signature', 'datasets', 'hash'}
+    ('hash' is None for takes that are external links of a virtual merge).
+    `splits` records the signature of the splits file that was injected.
+    """
+    def __init__(self, output_file, takes=None, splits=None):
+        self.output_file = os.fspath(output_file)
+        self.path = self.output_file + MANIFEST_SUFFIX
+        self.takes = takes if takes is not None else {}
+        self.splits = splits
+
+    @classmethod
+    def load(cls, output_file):
+        """Return the manifest of `output_file`, or None if there is no readable one."""
+        path = os.fspath(output_file) + MANIFEST_SUFFIX
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if payload.get('version') != MANIFEST_VERSION:
+            return None
+        return cls(output_file, takes=payload.get('takes', {}), splits=payload.get('splits'))
+
+    def save(self):
+        payload = {'version': MANIFEST_VERSION, 'takes': self.takes, 'splits': self.splits}
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def record_take(self, take_path, source, datasets, content_hash):
+        self.takes[take_path] = {
+            'source': os.fspath(source),
+            'source_signature': file_signature(source),
+            'datasets': datasets,
+            'hash': content_hash,
+        }
+
+    def forget(self, take_path):
+        self.takes.pop(take_path, None)
+
+    def check_take(self, out_file, take_path, verify=False):
+        """
+        Check a take of the output against the manifest.
+
+        Only the datasets recorded at merge time are compared; datasets derived later by
+        the data/utils tools are ignored, so an intact take is kept together with them.
+
+        Args:
+            out_file: Output HDF5 file object
+            take_path: Take path inside the file
+            verify: Also recompute and compare the content hash
+
+        Returns:
+            None if the take is intact, otherwise the reason why it is not
+        """
+        entry = self.takes.get(take_path)
+        if entry is None:
+            return "not in the manifest (interrupted copy)"
+        if take_path not in out_file:
+            return "missing from the output file"
+        signature = file_signature(entry['source'])
+        if signature is not None and signature != entry['source_signature']:
+            return f"source {entry['source']} changed"
+        with open_take(out_file, take_path) as group:
+            datasets = take_datasets(group)
+            if any(datasets.get(name) != recorded for name, recorded in entry['datasets'].items()):
+                return "datasets differ from the manifest"
+            # linked takes of a virtual merge have no hash, their data lives in the source file
+            if verify and entry['hash'] is not None and take_hash(group, names=entry['datasets']) != entry['hash']:
+                return "content hash mismatch"
+        return None
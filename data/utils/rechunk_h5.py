@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+"""
+Script to rewrite the large per-frame datasets of an EgoExOR HDF5 file with a chunk
+layout and codec tuned for random frame access.
+
+The individual files (and a plain merge of them) keep the chunking the recordings
+were written with, so reading a single camera of a single frame can decompress a
+chunk spanning several frames and cameras. This script copies the file and rewrites
+`frames/rgb`, `point_cloud/*` and `audio/snippets` of every take with one chunk per
+frame (or per frame and camera for `frames/rgb`). Everything else is copied as-is.
+
+Blosc/LZ4 needs the optional `hdf5plugin` package, both for writing and for reading
+the rewritten file (the dataset loaders import it when available).
+
+Example usage:
+    python -m data.utils.rechunk_h5 --input_file egoexor.h5 --output_file egoexor_rechunked.h5 \
+        --layout camera --codec blosc-lz4 --threads 8
+"""
+import os
+import sys
+import time
+import zlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Datasets (relative to a take) that are read per frame by the dataloaders
+RECHUNK_DATASETS = ('frames/rgb', 'point_cloud/coordinates', 'point_cloud/colors', 'audio/snippets')
+CODECS = ('gzip', 'lzf', 'blosc-lz4', 'none')
+LAYOUTS = ('camera', 'frame')
+
+# Upper bound of the slab copied per read/write round trip
+COPY_BLOCK_BYTES = 256 * 1024 ** 2
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Rechunk/transcode an EgoExOR HDF5 file for random frame access.")
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        required=True,
+        help="HDF5 file to rewrite."
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        required=True,
+        help="Path of the rewritten HDF5 file."
+    )
+    parser.add_argument(
+        "--layout",
+        type=str,
+        choices=LAYOUTS,
+        default="camera",
+        help="'camera': one chunk per frame and camera for frames/rgb, 'frame': one chunk per frame."
+    )
+    parser.add_argument(
+        "--codec",
+        type=str,
+        choices=CODECS,
+        default="lzf",
+        help="Compression of the rewritten datasets."
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=None,
+        help="Compression level for gzip (0-9) and blosc-lz4 (0-9)."
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Compression threads (gzip chunks are compressed in a thread pool, blosc uses its own threads)."
+    )
+    parser.add_argument(
+        "--bench_samples",
+        type=int,
+        default=32,
+        help="Random frame reads per dataset used for the decode-cost report (0 disables it)."
+    )
+    return parser.parse_args()
+
+
+def is_rechunk_target(path):
+    """Return True if `path` is one of the per-frame datasets of a take."""
+    return '/take/' in path and path.endswith(RECHUNK_DATASETS)
+
+
+def target_chunks(path, shape, layout):
+    """
+    Chunk shape for a rewritten dataset.
+
+    Args:
+        path: Dataset path inside the file
+        shape: Dataset shape, the first axis is the frame axis
+        layout: 'camera' or 'frame'
+
+    Returns:
+        Tuple with one frame along axis 0 (and one camera along axis 1 for
+        `frames/rgb` with the 'camera' layout), full extent elsewhere.
+    """
+    chunks = [1] + [max(1, int(s)) for s in shape[1:]]
+    if layout == 'camera' and path.endswith('frames/rgb') and len(shape) > 1:
+        chunks[1] = 1
+    return tuple(chunks)
+
+
+def codec_kwargs(codec, level=None, threads=1):
+    """
+    Keyword arguments of `create_dataset` for the selected codec.
+
+    Args:
+        codec: One of CODECS
+        level: Optional compression level
+        threads: Blosc thread count
+
+    Returns:
+        dict with `compression` (and `compression_opts`/`shuffle` where applicable)
+    """
+    if codec == 'none':
+        return {}
+    if codec == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': 4 if level is None else int(level)}
+    if codec == 'lzf':
+        return {'compression': 'lzf'}
+    if codec == 'blosc-lz4':
+        # the blosc filter reads its thread count from the environment when it is loaded
+        os.environ.setdefault('BLOSC_NTHREADS', str(max(1, int(threads))))
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError("The blosc-lz4 codec needs the hdf5plugin package: pip install hdf5plugin")
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if level is None else int(level),
+                                     shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}")
+
+
+def _iter_chunk_offsets(block_start, block_shape, chunks):
+    """Yield (offset, slices) of every chunk of a block that starts at frame `block_start`."""
+    grid = [range(0, s, c) for s, c in zip(block_shape, chunks)]
+    for corner in np.ndindex(*[len(g) for g in grid]):
+        offset = tuple(g[i] for g, i in zip(grid, corner))
+        slices = tuple(slice(o, o + c) for o, c in zip(offset, chunks))
+        yield (block_start + offset[0],) + offset[1:], slices
+
+
+def copy_dataset_rechunked(src_ds, dst_group, name, layout='camera', codec='lzf', level=None, executor=None):
+    """
+    Copy `src_ds` into `dst_group[name]` with the target chunk layout and codec.
+
+    Data is copied in frame blocks of at most COPY_BLOCK_BYTES. For gzip with an
+    executor, the chunks of a block are compressed with zlib in the thread pool
+    (zlib releases the GIL) and written with `write_direct_chunk`, which produces
+    the same bytes as HDF5's deflate filter. Other codecs run the HDF5 filter pipeline.
+
+    Args:
+        src_ds: Source h5py dataset
+        dst_group: Destination h5py group
+        name: Name of the new dataset in `dst_group`
+        layout: 'camera' or 'frame'
+        codec: One of CODECS
+        level: Optional compression level
+        executor: Optional ThreadPoolExecutor used for gzip
+
+    Returns:
+        The new h5py dataset
+    """
+    chunks = target_chunks(src_ds.name, src_ds.shape, layout)
+    kwargs = codec_kwargs(codec, level, threads=getattr(executor, '_max_workers', 1))
+    dst_ds = dst_group.create_dataset(name, shape=src_ds.shape, dtype=src_ds.dtype, chunks=chunks, **kwargs)
+    for attr_name, attr_value in src_ds.attrs.items():
+        dst_ds.attrs[attr_name] = attr_value
+
+    num_frames = src_ds.shape[0] if src_ds.ndim else 0
+    if num_frames == 0:
+        return dst_ds
+
+    frame_bytes = max(1, int(np.prod(src_ds.shape[1:])) * src_ds.dtype.itemsize)
+    block_frames = max(1, COPY_BLOCK_BYTES // frame_bytes)
+    direct_gzip = codec == 'gzip' and executor is not None
+    gzip_level = kwargs.get('compression_opts', 4)
+
+    for start in range(0, num_frames, block_frames):
+        stop = min(num_frames, start + block_frames)
+        block = src_ds[start:stop]
+        if not direct_gzip:
+            dst_ds[start:stop] = block
+            continue
+
+        offsets, pieces = [], []
+        for offset, slices in _iter_chunk_offsets(start, block.shape, chunks):
+            piece = block[slices]
+            if piece.shape != chunks:
+                # edge chunks must be padded to the full chunk shape
+                padded = np.zeros(chunks, dtype=block.dtype)
+                padded[tuple(slice(0, s) for s in piece.shape)] = piece
+                piece = padded
+            offsets.append(offset)
+            pieces.append(np.ascontiguousarray(piece))
+        compressed = executor.map(lambda p: zlib.compress(memoryview(p).cast('B'), gzip_level), pieces)
+        for offset, data in zip(offsets, compressed):
+            dst_ds.id.write_direct_chunk(offset, data)
+    return dst_ds
+
+
+def measure_access(ds, samples=32, seed=0):
+    """
+    Average cost of reading one random frame (one random camera for `frames/rgb`).
+
+    Args:
+        ds: h5py dataset
+        samples: Number of random reads
+        seed: Seed of the read positions, the same positions are used before and after
+
+    Returns:
+        Milliseconds per read, or None if the dataset is empty
+    """
+    if samples <= 0 or ds.ndim == 0 or ds.shape[0] == 0:
+        return None
+    rng = np.random.default_rng(seed)
+    per_camera = ds.name.endswith('frames/rgb') and ds.ndim > 1
+    frames = rng.integers(0, ds.shape[0], size=samples)
+    cameras = rng.integers(0, ds.shape[1], size=samples) if per_camera else None
+
+    start = time.perf_counter()
+    for i, frame_idx in enumerate(frames):
+        if per_camera:
+            ds[int(frame_idx), int(cameras[i])]
+        else:
+            ds[int(frame_idx)]
+    return (time.perf_counter() - start) * 1000.0 / samples
+
+
+def _drop_page_cache(path):
+    """Evict a file from the page cache (best effort, Linux), so reads hit the disk again."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def measure_file(path, samples=32):
+    """
+    Random-read cost of every RECHUNK_DATASETS dataset of a file, keyed by dataset path.
+
+    The file is opened fresh (empty chunk cache) after dropping it from the page cache,
+    so the source and the rewritten file are measured under the same conditions.
+    """
+    if samples <= 0:
+        return {}
+    _drop_page_cache(path)
+    results = {}
+    with h5py.File(path, 'r') as f:
+        def _visit(name, item):
+            if isinstance(item, h5py.Dataset) and is_rechunk_target(f'/{name}'):
+                results[f'/{name}'] = measure_access(item, samples)
+        f.visititems(_visit)
+    return results
+
+
+def rechunk_group(src_file, dst_file, src_path='/', layout='camera', codec='lzf', level=None,
+                  executor=None, stats=None):
+    """
+    Copy a group recursively, rewriting RECHUNK_DATASETS and copying everything else as-is.
+
+    Args:
+        src_file: Source HDF5 file object
+        dst_file: Destination HDF5 file object
+        src_path: Path of the group to copy
+        layout, codec, level, executor: See copy_dataset_rechunked
+        stats: Optional list, one dict per rewritten dataset is appended
+    """
+    src_group = src_file[src_path]
+    dst_group = dst_file.require_group(src_path)
+    for attr_name, attr_value in src_group.attrs.items():
+        dst_group.attrs[attr_name] = attr_value
+
+    for name, item in src_group.items():
+        item_path = f"{src_path.rstrip('/')}/{name}"
+        if isinstance(item, h5py.Group):
+            rechunk_group(src_file, dst_file, item_path, layout, codec, level, executor, stats)
+        elif name in dst_group:
+            continue
+        elif is_rechunk_target(item_path):
+            start = time.perf_counter()
+            dst_ds = copy_dataset_rechunked(item, dst_group, name, layout, codec, level, executor)
+            if stats is not None:
+                stats.append({
+                    'path': item_path,
+                    'bytes_before': item.id.get_storage_size(),
+                    'bytes_after': dst_ds.id.get_storage_size(),
+                    'copy_seconds': time.perf_counter() - start,
+                })
+            logger.info(f"Rewrote {item_path} with chunks {dst_ds.chunks}")
+        else:
+            src_file.copy(item, dst_group, name=name)
+
+
+def log_stats(stats):
+    """Log storage size and decode cost of the rewritten datasets."""
+    def _ms(v):
+        return f"{v:8.2f}" if v is not None else "     n/a"
+
+    total_before = total_after = 0
+    for s in stats:
+        total_before += s['bytes_before']
+        total_after += s['bytes_after']
+        logger.info(f"{s['path']}: {s['bytes_before'] / 1e6:10.1f} MB -> {s['bytes_after'] / 1e6:10.1f} MB, "
+                    f"read {_ms(s['ms_before'])} ms -> {_ms(s['ms_after'])} ms")
+    logger.info(f"Total rewritten: {total_before / 1e9:.2f} GB -> {total_after / 1e9:.2f} GB "
+                f"over {len(stats)} datasets")
+
+
+def rechunk_file(input_file, output_file, layout='camera', codec='lzf', level=None, threads=1, bench_samples=32):
+    """
+    Rewrite an EgoExOR HDF5 file with per-frame (or per-camera) chunks.
+
+    Args:
+        input_file: Source file path
+        output_file: Destination file path (overwritten)
+        layout: 'camera' or 'frame'
+        codec: One of CODECS
+        level: Optional compression level
+        threads: Compression threads
+        bench_samples: Random reads per dataset for the decode-cost report
+
+    Returns:
+        List of per-dataset stats dicts
+    """
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        raise ValueError("input_file and output_file must differ")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    # measured before the copy reads the source and on a fresh handle after it, so neither
+    # file is served from the chunk or page cache the copy filled
+    ms_before = measure_file(input_file, bench_samples)
+    stats = []
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        with h5py.File(input_file, 'r') as src_file, h5py.File(output_file, 'w') as dst_file:
+            rechunk_group(src_file, dst_file, '/', layout, codec, level, executor, stats)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    ms_after = measure_file(output_file, bench_samples)
+    for s in stats:
+        s['ms_before'] = ms_before.get(s['path'])
+        s['ms_after'] = ms_after.get(s['path'])
+
+    log_stats(stats)
+    return stats
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.input_file):
+        logger.error(f"Input file does not exist: {args.input_file}")
+        return 1
+
+    try:
+        rechunk_file(
+            args.input_file,
+            args.output_file,
+            layout=args.layout,
+            codec=args.codec,
+            level=args.level,
+            threads=args.threads,
+            bench_samples=args.bench_samples,
+        )
+        logger.info(f"Rechunked file saved to {args.output_file}")
+        return 0
+    except Exception as e:
+        logger.error(f"Error rechunking file: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
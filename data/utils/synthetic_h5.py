@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Script to write a small synthetic EgoExOR HDF5 file with the schema of data/README.md.
+
+Every take gets `sources` attributes, `frames/rgb`, `eye_gaze/coordinates`,
+`eye_gaze_depth/values`, `hand_tracking/positions`, `audio/waveform` + `audio/snippets`,
+`point_cloud/coordinates` + `colors` and per-frame `annotations`; the file gets
+`metadata` (vocabularies, sources) and `splits`. Sizes are configurable, so data-pipeline
+benchmarks can run without the full dataset. Frames are blocky noise (compressible like
+camera images, unlike white noise) and a fraction of the ego views is blank.
+
+Like the individual files, `frames/rgb` chunks span several frames and all cameras; use
+rechunk_h5.py for the other layouts.
+
+Example usage (from the repository root):
+    python -m data.utils.synthetic_h5 --output_file synthetic.h5 --procedures 2 --takes 2 --num_frames 64
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import date
+
+import h5py
+import numpy as np
+
+from data.utils.constants import CAMERA_TYPE_MAPPING
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EGO_CAMERAS = ['head_surgeon', 'assistant', 'circulator', 'anesthetist']
+# Cameras of a take per surgery type, ego cameras first
+TAKE_CAMERAS = {
+    'MISS': EGO_CAMERAS + ['or_light', 'microscope', 'external_1', 'external_2', 'external_3',
+                           'external_4', 'external_5', 'simstation'],
+    'Ultrasound': EGO_CAMERAS + ['external_1', 'external_2', 'external_3', 'external_4', 'external_5',
+                                 'ultrasound'],
+}
+# A subset of the scene graph vocabulary (dataset_utils.ENTITY_VOCAB / RELATION_VOCAB)
+ENTITIES = ['head_surgeon', 'assistant', 'circulator', 'anaesthetist', 'patient', 'operating_table',
+            'instrument_table', 'scalpel', 'ultrasound_probe', 'needle']
+RELATIONS = ['holding', 'closeTo', 'lyingOn', 'cutting', 'scanning', 'touching', 'looking']
+SPLITS = ('train', 'validation', 'test')
+# Same layout as merge_h5.SPLIT_DTYPE
+SPLIT_DTYPE = [
+    ('surgery_type', h5py.string_dtype()),
+    ('procedure_id', np.int32),
+    ('take_id', np.int32),
+    ('frame_id', np.int32)
+]
+VOCABULARY_DTYPE = [('name', h5py.string_dtype()), ('id', np.int32)]
+# Frozen CLAP features as written by llava_helpers/build_clap_embeddings.py
+CLAP_EMBEDDING_KEY = 'audio/clap_embedding'
+CLAP_EMBEDDING_DIM = 512
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Write a synthetic EgoExOR HDF5 file for benchmarks.")
+    parser.add_argument("--output_file", type=str, required=True, help="Path of the synthetic HDF5 file.")
+    parser.add_argument("--surgery_types", type=str, nargs='+', default=list(TAKE_CAMERAS),
+                        choices=list(TAKE_CAMERAS), help="Surgery types to generate.")
+    parser.add_argument("--procedures", type=int, default=2, help="Procedures per surgery type.")
+    parser.add_argument("--takes", type=int, default=2, help="Takes per procedure.")
+    parser.add_argument("--num_frames", type=int, default=64, help="Frames per take.")
+    parser.add_argument("--height", type=int, default=128, help="Height of the camera views.")
+    parser.add_argument("--width", type=int, default=128, help="Width of the camera views.")
+    parser.add_argument("--num_points", type=int, default=2048, help="Points per point cloud frame.")
+    parser.add_argument("--audio_rate", type=int, default=4800,
+                        help="Audio samples per second (one snippet per frame). 0 writes no audio.")
+    parser.add_argument("--clap_embedding", action="store_true",
+                        help="Also write random audio/clap_embedding features, so loaders never load CLAP.")
+    parser.add_argument("--frames_per_chunk", type=int, default=4, help="Frames per chunk of frames/rgb.")
+    parser.add_argument("--codec", type=str, choices=('gzip', 'lzf', 'none'), default="gzip",
+                        help="Compression of the per-frame datasets.")
+    parser.add_argument("--blank_ratio", type=float, default=0.1, help="Fraction of blank (all zero) ego views.")
+    parser.add_argument("--max_triplets", type=int, default=8, help="Maximum scene graph triplets per frame.")
+    parser.add_argument("--split_ratios", type=float, nargs=3, default=[0.7, 0.15, 0.15],
+                        help="Fractions of the frames of every take in train/validation/test.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    return parser.parse_args()
+
+
+def _compression(codec):
+    return {} if codec == 'none' else {'compression': codec}
+
+
+def _vocabulary(names):
+    return np.array([(name, i) for i, name in enumerate(names)], dtype=VOCABULARY_DTYPE)
+
+
+def write_metadata(f):
+    metadata = f.require_group('metadata')
+    vocabulary = metadata.require_group('vocabulary')
+    vocabulary.create_dataset('entity', data=_vocabulary(ENTITIES))
+    vocabulary.create_dataset('relation', data=_vocabulary(RELATIONS))
+    sources = sorted((name, i) for name, i in CAMERA_TYPE_MAPPING.items() if i >= 0)
+    metadata.require_group('sources').create_dataset(
+        'sources', data=np.array([(name, i) for name, i in sources], dtype=VOCABULARY_DTYPE))
+    dataset = metadata.require_group('dataset')
+    dataset.attrs['version'] = 'synthetic'
+    dataset.attrs['creation_date'] = date.today().isoformat()
+    dataset.attrs['title'] = 'Synthetic EgoExOR'
+
+
+def _camera_frames(rng, num_frames, num_cameras, height, width, blank_ratio, num_ego):
+    """uint8 [num_frames, num_cameras, H, W, 3]: one blocky base image per camera, jittered per frame."""
+    block = 8
+    small = rng.integers(0, 256, (num_cameras, -(-height // block), -(-width // block), 3), dtype=np.uint8)
+    base = small.repeat(block, axis=1).repeat(block, axis=2)[:, :height, :width]
+    noise = rng.integers(-8, 9, (num_frames, num_cameras, 1, 1, 3), dtype=np.int16)
+    frames = np.clip(base[None].astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    blank = rng.random((num_frames, num_ego)) < blank_ratio
+    frames[:, :num_ego][blank] = 0
+    return frames
+
+
+def write_take(take, rng, args, num_frames, cameras):
+    """Write all modalities of one take group."""
+    num_cameras, num_ego = len(cameras), sum(name in EGO_CAMERAS for name in cameras)
+    compression = _compression(args.codec)
+
+    sources = take.create_group('sources')
+    sources.attrs['source_count'] = num_cameras
+    for i, name in enumerate(cameras):
+        sources.attrs[f'source_{i}'] = name
+
+    frames_per_chunk = max(min(args.frames_per_chunk, num_frames), 1)
+    rgb = take.create_dataset('frames/rgb', shape=(num_frames, num_cameras, args.height, args.width, 3),
+                              dtype=np.uint8, chunks=(frames_per_chunk, num_cameras, args.height, args.width, 3),
+                              **compression)
+    for start in range(0, num_frames, frames_per_chunk):
+        stop = min(start + frames_per_chunk, num_frames)
+        rgb[start:stop] = _camera_frames(rng, stop - start, num_cameras, args.height, args.width,
+                                         args.blank_ratio, num_ego)
+
+    ego_ids = np.array([CAMERA_TYPE_MAPPING[name] for name in cameras[:num_ego]], dtype=np.float32)
+    gaze = np.empty((num_frames, num_ego, 3), dtype=np.float32)
+    gaze[..., 0] = ego_ids
+    gaze[..., 1] = rng.uniform(0, args.width, (num_frames, num_ego))
+    gaze[..., 2] = rng.uniform(0, args.height, (num_frames, num_ego))
+    gaze[..., 1:][rng.random((num_frames, num_ego)) < 0.05] = -1.
+    take.create_dataset('eye_gaze/coordinates', data=gaze)
+    take.create_dataset('eye_gaze_depth/values',
+                        data=rng.uniform(0.3, 2.0, (num_frames, num_ego)).astype(np.float32))
+
+    hands = rng.normal(0, 0.3, (num_frames, num_ego, 17)).astype(np.float32)
+    hands[..., 0] = ego_ids
+    hands[..., 1:][rng.random((num_frames, num_ego)) < 0.2] = np.nan
+    take.create_dataset('hand_tracking/positions', data=hands)
+
+    if args.audio_rate > 0:
+        waveform = rng.normal(0, 0.1, (num_frames * args.audio_rate, 2)).astype(np.float32)
+        take.create_dataset('audio/waveform', data=waveform, **compression)
+        take.create_dataset('audio/snippets', data=waveform.reshape(num_frames, args.audio_rate, 2),
+                            chunks=(1, args.audio_rate, 2), **compression)
+        if args.clap_embedding:
+            take.create_dataset(CLAP_EMBEDDING_KEY, chunks=(min(num_frames, 256), CLAP_EMBEDDING_DIM),
+                                data=rng.normal(0, 1, (num_frames, CLAP_EMBEDDING_DIM)).astype(np.float16))
+
+    point_chunks = (1, args.num_points, 3)
+    take.create_dataset('point_cloud/coordinates', chunks=point_chunks, **compression,
+                        data=rng.uniform(-2, 2, (num_frames, args.num_points, 3)).astype(np.float32))
+    take.create_dataset('point_cloud/colors', chunks=point_chunks, **compression,
+                        data=rng.random((num_frames, args.num_points, 3)).astype(np.float32))
+
+    annotations = take.create_group('annotations')
+    string_dtype = h5py.string_dtype(encoding='utf-8')
+    for frame_idx in range(num_frames):
+        n = int(rng.integers(1, args.max_triplets + 1))
+        subjects, objects = rng.integers(0, len(ENTITIES), n), rng.integers(0, len(ENTITIES), n)
+        predicates = rng.integers(0, len(RELATIONS), n)
+        frame = annotations.create_group(f'frame_{frame_idx}')
+        frame.create_dataset('rel_annotations', dtype=string_dtype, data=np.array(
+            [[ENTITIES[s], RELATIONS[p], ENTITIES[o]] for s, p, o in zip(subjects, predicates, objects)], dtype=object))
+        frame.create_dataset('scene_graph', data=np.stack([subjects, predicates, objects], axis=1).astype(np.float32))
+
+
+def write_splits(f, split_rows):
+    splits = f.require_group('splits')
+    for split in SPLITS:
+        splits.create_dataset(split, data=np.array(split_rows[split], dtype=SPLIT_DTYPE), compression='gzip')
+
+
+def generate(args):
+    """Write the synthetic file described by the parsed arguments."""
+    start = time.time()
+    rng = np.random.default_rng(args.seed)
+    ratios = np.asarray(args.split_ratios, dtype=np.float64)
+    bounds = np.round(np.cumsum(ratios / ratios.sum()) * args.num_frames).astype(int)
+    split_rows = {split: [] for split in SPLITS}
+
+    with h5py.File(args.output_file, 'w') as f:
+        write_metadata(f)
+        for surgery_type in args.surgery_types:
+            for procedure_id in range(1, args.procedures + 1):
+                for take_id in range(1, args.takes + 1):
+                    take = f.create_group(f'data/{surgery_type}/{procedure_id}/take/{take_id}')
+                    write_take(take, rng, args, args.num_frames, TAKE_CAMERAS[surgery_type])
+                    # consecutive frame ranges of every take per split
+                    for split, low, high in zip(SPLITS, np.concatenate([[0], bounds[:-1]]), bounds):
+                        split_rows[split].extend((surgery_type, procedure_id, take_id, i) for i in range(low, high))
+                    logger.info(f"Wrote {take.name}")
+        write_splits(f, split_rows)
+
+    size = os.path.getsize(args.output_file) / 1024 ** 2
+    logger.info(f"Wrote {args.output_file} ({size:.1f} MB, "
+                f"{', '.join(f'{len(rows)} {split}' for split, rows in split_rows.items())} frames) "
+                f"in {time.time() - start:.1f}s")
+
+
+def main():
+    args = parse_args()
+    try:
+        generate(args)
+        return 0
+    except Exception as e:
+        logger.error(f"Error writing synthetic file: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
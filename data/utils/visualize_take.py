@@ -8,6 +8,7 @@ import subprocess
 from typing import Tuple
 from utils.constants import CAMERA_TYPE_MAPPING, EGOCENTRIC_SOURCES, EXOCENTRIC_SOURCES, GAZE_FIXATION, GAZE_FIXATION_TO_TAKE
 from utils.visualize_timepoint import draw_camera_label, _needs_fixation, apply_lut, _draw_hand_points
+from utils.annotation_index import TakeAnnotations, read_frame_annotations
 
 def parse_args():
     """Parse command line arguments."""
@@ -94,8 +95,9 @@ def load_data(h5_file, surgery_type, procedure_id, take_id):
         if f'{base_path}/hand_tracking/positions' in f:
             hand_tracking = f[f'{base_path}/hand_tracking/positions'][:]
         
-        # For annotations, we'll check if the annotations directory exists, but we'll load them per frame
+        # Annotations of every frame, packed once (from the annotation index if the take has one)
         annotations_dir_exists = f'{base_path}/annotations' in f
+        annotations = TakeAnnotations.load(f[base_path]) if annotations_dir_exists else None
         
         # Load vocabulary for annotations
         entity_vocab = {}
@@ -123,6 +125,7 @@ def load_data(h5_file, surgery_type, procedure_id, take_id):
             'h5_file': h5_file,
             "take_path": base_path,
             'annotations_path': f'{base_path}/annotations' if annotations_dir_exists else None,
+            'annotations': annotations,
             'entity_vocab': entity_vocab,
             'relation_vocab': relation_vocab,
             'audio': audio
@@ -134,10 +137,7 @@ def get_frame_annotations(h5_file, annotations_path, frame_id):
         return None
     
     with h5py.File(h5_file, 'r') as f:
-        ann_path = f'{annotations_path}/frame_{frame_id}/rel_annotations'
-        if ann_path in f:
-            return f[ann_path][:]
-        return None
+        return read_frame_annotations(f, annotations_path.rsplit('/', 1)[0], frame_id)
     
 
 def _choose_grid_layout(num_cameras: int) -> Tuple[int, int]:
@@ -175,7 +175,7 @@ def visualize_take(h5_file,
     take_path = take_data['take_path']
     global_audio = take_data['audio']
     h5_file_path = take_data['h5_file']
-    annotations_path = take_data['annotations_path']
+    annotations = take_data['annotations']
     
     num_frames, num_cameras, frame_h, frame_w, _ = rgb_video.shape
 
@@ -259,8 +259,8 @@ def visualize_take(h5_file,
 
         # Create and add scene graph visualization (double-wide now)
         current_annotations = None
-        if annotations_path is not None:
-            current_annotations = get_frame_annotations(h5_file_path, annotations_path, f_idx)
+        if annotations is not None:
+            current_annotations = annotations.frame(f_idx)
         # Create text annotation section (below camera frames)
         
         text_annotation_section = np.ones((text_annotations_height, 
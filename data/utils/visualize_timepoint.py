@@ -5,6 +5,7 @@ import cv2
 from pathlib import Path
 import matplotlib.pyplot as plt
 from utils.constants import CAMERA_TYPE_MAPPING, GAZE_FIXATION, GAZE_FIXATION_TO_TAKE
+from utils.annotation_index import read_frame_annotations
 
 def get_frame_annotations(h5_file, annotations_path, frame_id):
     """Get annotations for a specific frame."""
@@ -12,10 +13,7 @@ def get_frame_annotations(h5_file, annotations_path, frame_id):
         return None
     
     with h5py.File(h5_file, 'r') as f:
-        ann_path = f'{annotations_path}/frame_{frame_id}/rel_annotations'
-        if ann_path in f:
-            return f[ann_path][:]
-        return None
+        return read_frame_annotations(f, annotations_path.rsplit('/', 1)[0], frame_id)
 
 def _draw_hand_points(img_bgr: np.ndarray, hand_vals: np.ndarray):
     """Draw hand tracking points and connecting lines.
@@ -180,7 +178,6 @@ def visualize_frame_group(
 
         gaze_data = f.get(f"{take_path}/eye_gaze/coordinates")
         hand_data = f.get(f"{take_path}/hand_tracking/positions")
-        annotations_path = f"{take_path}/annotations"
 
         for cam_idx, cam_name in source_map.items():
             frame = rgb[cam_idx].copy()
@@ -228,7 +225,7 @@ def visualize_frame_group(
                 cv2.imwrite(str(fig_path / fn), frame_bgr_ready)
 
 
-        frame_annotation = f[f'{annotations_path}/frame_{frame_idx}/rel_annotations'][:]
+        frame_annotation = read_frame_annotations(f, take_path, frame_idx)
         if frame_annotation is not None:
             # Choose an icon (e.g. 📊, 🖼️, 🔍) and build your title
             icon = "📊"
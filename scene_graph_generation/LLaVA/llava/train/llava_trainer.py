@@ -1,6 +1,7 @@
 import os
 from typing import List, Optional
 
+import numpy as np
 import torch
 from torch import nn
 from torch.utils.data import Sampler
@@ -131,6 +132,110 @@ class LengthGroupedSampler(Sampler):
         return iter(indices)
 
 
+def get_block_shuffled_indices(takes, frames, block_size, window=1, shuffle=True, generator=None):
+    """
+    Order samples so that neighbouring frames of a take are read close together.
+
+    Samples are cut into blocks of `block_size` consecutive frames of one take (all samples of
+    a frame, e.g. its permutations, land in the same block). The blocks are shuffled, and the
+    samples of every `window` consecutive blocks are shuffled together: a larger window trades
+    locality (HDF5 chunk and page cache reuse) for randomness. Without `shuffle` the order is
+    simply by take and frame.
+    """
+    takes = np.asarray(takes, dtype=np.int64)
+    frames = np.asarray(frames, dtype=np.int64)
+    order = np.lexsort((frames, takes))
+    block_keys = np.stack([takes[order], frames[order] // max(block_size, 1)])
+    boundaries = np.flatnonzero(np.any(block_keys[:, 1:] != block_keys[:, :-1], axis=0)) + 1
+    blocks = np.split(order, boundaries) if len(order) else []
+    if not shuffle:
+        return order.tolist()
+
+    blocks = [blocks[i] for i in torch.randperm(len(blocks), generator=generator).tolist()]
+    indices = []
+    for start in range(0, len(blocks), max(window, 1)):
+        group = np.concatenate(blocks[start:start + max(window, 1)])
+        indices.extend(group[torch.randperm(len(group), generator=generator).numpy()].tolist())
+    return indices
+
+
+def group_by_length_in_order(indices, lengths, batch_size, world_size):
+    """
+    Length grouping of get_length_grouped_indices on an already shuffled order: megabatches are
+    consecutive runs of `indices`, so the locality of the order is kept.
+    """
+    lengths = [abs(l) for l in lengths]  # modality lengths are signed
+    megabatch_size = world_size * batch_size
+    megabatches = [indices[i: i + megabatch_size] for i in range(0, len(indices), megabatch_size)]
+    megabatches = [sorted(megabatch, key=lambda i: lengths[i], reverse=True) for megabatch in megabatches]
+    megabatches = [split_to_even_chunks(megabatch, lengths, world_size) for megabatch in megabatches]
+    return [i for megabatch in megabatches for batch in megabatch for i in batch]
+
+
+def group_by_modality_length_in_order(indices, lengths, batch_size, world_size):
+    """
+    Modality grouping of get_modality_length_grouped_indices on an already shuffled order:
+    every megabatch holds one modality, and megabatches follow the position of their first sample.
+    """
+    if all(lengths[i] > 0 for i in indices) or all(lengths[i] < 0 for i in indices):
+        return group_by_length_in_order(indices, lengths, batch_size, world_size)
+    rank = {index: r for r, index in enumerate(indices)}
+    megabatch_size = world_size * batch_size
+    megabatches = []
+    for modality_indices in ([i for i in indices if lengths[i] > 0], [i for i in indices if lengths[i] < 0]):
+        grouped = group_by_length_in_order(modality_indices, lengths, batch_size, world_size)
+        megabatches.extend(grouped[i: i + megabatch_size] for i in range(0, len(grouped), megabatch_size))
+    megabatches.sort(key=lambda megabatch: min(rank[i] for i in megabatch))
+    return [i for megabatch in megabatches for i in megabatch]
+
+
+class BlockShuffleSampler(Sampler):
+    r"""
+    Sampler that shuffles blocks of consecutive frames of a take instead of single samples, so the
+    HDF5 chunk cache and the OS page cache are reused (see get_block_shuffled_indices). Optionally
+    groups by (modality) length like LengthGroupedSampler, without giving up the block order.
+    """
+
+    def __init__(
+        self,
+        takes,
+        frames,
+        block_size: int,
+        window: int = 1,
+        batch_size: int = 1,
+        world_size: int = 1,
+        lengths: Optional[List[int]] = None,
+        group_by_modality: bool = False,
+        shuffle: bool = True,
+        generator=None,
+    ):
+        if len(takes) != len(frames):
+            raise ValueError("takes and frames must have the same length.")
+        self.takes = takes
+        self.frames = frames
+        self.block_size = block_size
+        self.window = window
+        self.batch_size = batch_size
+        self.world_size = world_size
+        self.lengths = lengths
+        self.group_by_modality = group_by_modality
+        self.shuffle = shuffle
+        self.generator = generator
+
+    def __len__(self):
+        return len(self.takes)
+
+    def __iter__(self):
+        indices = get_block_shuffled_indices(self.takes, self.frames, self.block_size, self.window,
+                                             shuffle=self.shuffle, generator=self.generator)
+        if self.lengths is not None:
+            if self.group_by_modality:
+                indices = group_by_modality_length_in_order(indices, self.lengths, self.batch_size, self.world_size)
+            else:
+                indices = group_by_length_in_order(indices, self.lengths, self.batch_size, self.world_size)
+        return iter(indices)
+
+
 class LLaVATrainer(Trainer):
 
     def compute_loss(self, model, inputs, return_outputs=False):
@@ -177,16 +282,35 @@ class LLaVATrainer(Trainer):
         if self.train_dataset is None or not has_length(self.train_dataset):
             return None
 
-        if self.args.group_by_modality_length:
+        if self.args.block_shuffle_size > 0:
+            takes, frames = self.train_dataset.sample_locations
+            sampler = BlockShuffleSampler(
+                takes,
+                frames,
+                block_size=self.args.block_shuffle_size,
+                window=self.args.block_shuffle_window,
+                batch_size=self.args.train_batch_size,
+                world_size=self.args.world_size * self.args.gradient_accumulation_steps,
+                lengths=self.train_dataset.modality_lengths if self.args.group_by_modality_length else None,
+                group_by_modality=self.args.group_by_modality_length,
+            )
+        elif self.args.group_by_modality_length:
             lengths = self.train_dataset.modality_lengths
-            return LengthGroupedSampler(
+            sampler = LengthGroupedSampler(
                 self.args.train_batch_size,
                 world_size=self.args.world_size * self.args.gradient_accumulation_steps,
                 lengths=lengths,
                 group_by_modality=True,
             )
         else:
-            return super()._get_train_sampler()
+            sampler = super()._get_train_sampler()
+
+        # a dataset with a read-ahead gets the order of every epoch before its workers read
+        read_ahead = getattr(self.train_dataset, 'read_ahead', None)
+        if read_ahead is not None and sampler is not None:
+            sampler = read_ahead.sampler(sampler, batch_size=self.args.train_batch_size,
+                                         num_replicas=self.args.world_size)
+        return sampler
 
     def create_optimizer(self):
         """
@@ -22,12 +22,12 @@ import sys
 import pathlib
 import random
 from dataclasses import dataclass, field
+from functools import partial
 from typing import Dict, Optional, Sequence, List, Tuple, Any
 
 import numpy as np
 import open3d as o3d
 import torch
-import h5py
 import transformers
 from PIL import Image
 from llava import conversation as conversation_lib
@@ -42,7 +42,19 @@ from torchvision.transforms import functional as F, InterpolationMode
 # Add the project root to the path to access helpers
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../"))
 from scene_graph_generation.helpers.config_utils import ConfigManager
-from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.dataset_utils import reversed_sources, SOURCES, GAZE_FIXATION, GAZE_FIXATION_TO_TAKE
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.hdf5_utils import get_h5_pool, DEFAULT_RDCC_NBYTES
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.take_index import TakeIndex
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.frame_cache import FrameCache, load_views
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.sample_manifest import load_samples
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.modality_plan import ModalityPlan
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.ego_alignment import apply_gaze_fixation, gaze_rows, ego_rows
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.take_cache import TakeArrayCache
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.read_ahead import (
+    DEFAULT_READ_AHEAD_BYTES, FrameReads, ReadAhead, exo_cameras, modality_keys, plan_cameras, read_batch
+)
+from scene_graph_generation.scene_graph_prediction.scene_graph_helpers.dataset.audio_embedding import (
+    CLAP_MODEL_NAME, LazyAudioProcessor, has_audio, load_audio_features
+)
 import torch
 import torchaudio
 from transformers import ClapModel, ClapProcessor
@@ -82,6 +94,15 @@ class ModelArguments:
 class DataArguments:
     data_path: str = field(default=None, metadata={"help": "Path to data samples."})
     hdf5_path: str = field(default=None, metadata={"help": "Path to HDF5 file."})
+    take_index_path: Optional[str] = field(default=None, metadata={"help": "Take index sidecar file. Defaults to <hdf5_path>.takeindex.json."})
+    hdf5_rdcc_nbytes: int = field(default=DEFAULT_RDCC_NBYTES, metadata={"help": "Raw-chunk cache size (bytes) of the per-worker HDF5 handle."})
+    frame_cache_dir: Optional[str] = field(default=None, metadata={"help": "Directory of the on-disk cache of preprocessed frames. Disabled if None."})
+    frame_cache_dtype: str = field(default="bfloat16", metadata={"help": "Storage of the frame cache: 'bfloat16' or 'uint8' (normalized on read)."})
+    read_ahead_samples: int = field(default=0, metadata={"help": "Frames read ahead in the background by each DataLoader worker (0 disables)."})
+    read_ahead_threads: int = field(default=2, metadata={"help": "Read-ahead threads per DataLoader worker."})
+    read_ahead_bytes: int = field(default=DEFAULT_READ_AHEAD_BYTES, metadata={"help": "Memory budget (bytes) of the read-ahead buffer of each DataLoader worker."})
+    take_cache_bytes: int = field(default=0, metadata={"help": "Shared-memory budget (bytes) of the whole-take cache of eye gaze, gaze depth and hand tracking (0 disables)."})
+    batched_reads: bool = field(default=False, metadata={"help": "Fetch a batch with one HDF5 read per take and dataset (__getitems__) instead of per sample."})
     token_weight_path: Optional[str] = field(default=None)
     lazy_preprocess: bool = False
     is_multimodal: bool = False
@@ -134,6 +155,8 @@ class TrainingArguments(transformers.TrainingArguments):
     lora_bias: str = "none"
     mm_projector_lr: Optional[float] = None
     group_by_modality_length: bool = field(default=False)
+    block_shuffle_size: int = field(default=0, metadata={"help": "Shuffle blocks of this many consecutive frames of a take instead of single samples (0 disables)."})
+    block_shuffle_window: int = field(default=1, metadata={"help": "Number of blocks whose samples are shuffled together (larger is more random, less local)."})
     curriculum_learning_weights: Optional[str] = field(default=None)
 
 
@@ -910,13 +933,6 @@ class AudioTransform:
         data /= (max_vals + 1e-6)  # Avoid division by zero
         return data
 
-def _needs_fixation(role: str, take_path: str) -> bool:
-    """
-    Return True if the given (role, take_path) combination requires
-    the extra gaze-fixation offset.
-    """
-    takes_for_role = GAZE_FIXATION_TO_TAKE.get(role, [])
-    return take_path in takes_for_role
 class GazeNormalize:
     def __init__(self, img_width: int = 336, img_height: int = 336):
         self.img_width = img_width
@@ -1057,51 +1073,146 @@ class FrameTransform:
 
 
 
+# modalities dropped at random by the multimodal augmentation, in the order they are drawn
+DROPPABLE_MODALITIES = ('eye_gaze', 'eye_gaze_depth', 'hand_tracking', 'point_cloud', 'audio')
+# exo sources stored BGR, like the ego views
+BGR_EXO_SOURCES = ("ultrasound", "simstation")
+# draws of planned samples kept until they are loaded (a wrong read-ahead guess is never loaded)
+MAX_PENDING_DRAWS = 4096
+
+
+@dataclass
+class SampleDraw:
+    """The random choices of one sample, drawn before anything is read."""
+    exo_cams: List[int]           # exo cameras the sample uses, in order
+    dropped: frozenset            # modalities dropped by the multimodal augmentation
+    rng: random.Random            # the rest: the view selection of single-branch datasets
+
+
 # Define LazySupervisedDataset
 class LazySupervisedDataset(Dataset):
     """Dataset for supervised fine-tuning with EgoExOR HDF5 data."""
     def __init__(self, data_path: str, hdf5_path: str, tokenizer: transformers.PreTrainedTokenizer, data_args):
         super(LazySupervisedDataset, self).__init__()
-        list_data_dict = json.load(open(data_path, "r"))
+        # SampleManifest: NumPy columns shared by the forked workers, samples assembled on access
+        list_data_dict = load_samples(data_path)
         self.hdf5_path = hdf5_path
+        self.h5_pool = get_h5_pool(rdcc_nbytes=data_args.hdf5_rdcc_nbytes)
+        # scanned once in the main process, workers inherit it
+        self.take_index = TakeIndex.load(hdf5_path, sidecar_path=data_args.take_index_path)
         self.tokenizer = tokenizer
         self.list_data_dict = list_data_dict
         self.data_args = data_args
         self.do_img_order_augment = self.data_args.do_img_order_augment
         self.do_multimodal_augment = self.data_args.do_multimodal_augment
         self.multimodal_drop_prop = self.data_args.multimodal_drop_prop
+        # modalities the model consumes in this run, nothing else is read
+        self.modality_plan = ModalityPlan.from_config(data_args.dataset_name, data_args.egocentric_features,
+                                                      data_args.exocentric_features)
         if self.data_args.do_augment:
             self.augment = TrivialAugmentWide(strength=0.5)
         else:
             self.augment = None
         self.frame_transform = FrameTransform(self.data_args.image_processor)
+        self.frame_cache = None
+        if data_args.frame_cache_dir is not None:
+            self.frame_cache = FrameCache(data_args.frame_cache_dir, self.frame_transform,
+                                          storage_dtype=data_args.frame_cache_dtype, hdf5_path=hdf5_path)
         self.gaze_normalize = GazeNormalize(img_width=336, img_height=336)
         self.depth_normalize = GazeDepthNormalize(max_depth=1.0)
         self.hand_normalize = HandTrackingNormalize(img_width=336, img_height=336)
         self.audio_normalize = AudioTransform()
-        self.audio_processor = AudioProcessor(model_name="laion/larger_clap_general", d_model=1024, clap_hidden_size=512)
+        # CLAP is only loaded for takes without a precomputed audio/clap_embedding
+        self.audio_processor = LazyAudioProcessor(partial(AudioProcessor, model_name=CLAP_MODEL_NAME, d_model=1024, clap_hidden_size=512))
+        # gaze, gaze depth and hand tracking of whole takes in shared memory, mapped by every worker
+        self.take_cache = None
+        if data_args.take_cache_bytes > 0:
+            self.take_cache = TakeArrayCache(max_bytes=data_args.take_cache_bytes)
+        # background reads of the upcoming samples, fed with the epoch order by ReadAheadSampler
+        self.read_ahead = None
+        if data_args.read_ahead_samples > 0:
+            self.read_ahead = ReadAhead(self.read_plan, len(self.list_data_dict), depth=data_args.read_ahead_samples,
+                                        num_threads=data_args.read_ahead_threads, max_bytes=data_args.read_ahead_bytes)
+        # SampleDraws of the samples read_plan planned, by index, until _get_item uses them
+        self._draws: Dict[int, SampleDraw] = {}
 
     def __len__(self):
         return len(self.list_data_dict)
 
+    @property
+    def sample_locations(self):
+        """(take ids, frame indices) of all samples, for BlockShuffleSampler."""
+        return self.list_data_dict.index['take'], self.list_data_dict.index['frame_idx']
+
     @property
     def lengths(self):
-        length_list = []
-        for sample in self.list_data_dict:
-            img_tokens = 128
-            length_list.append(sum(len(conv['value'].split()) for conv in sample['conversations']) + img_tokens)
-        return length_list
+        img_tokens = 128
+        return (self.list_data_dict.word_counts() + img_tokens).tolist()
 
     @property
     def modality_lengths(self):
-        length_list = []
-        for sample in self.list_data_dict:
-            cur_len = sum(len(conv['value'].split()) for conv in sample['conversations'])
-            cur_len = cur_len if '<image>' in sample['conversations'][0]['value'] else -cur_len
-            length_list.append(cur_len)
-        return length_list
+        word_counts = self.list_data_dict.word_counts()
+        return np.where(self.list_data_dict.has_image(), word_counts, -word_counts).tolist()
+
+    def read_plan(self, i):
+        """(take path, frame, cameras, per-frame datasets) that __getitem__ may read for sample i, for the read-ahead."""
+        hdf5_indices = self.list_data_dict[i]['hdf5_indices']
+        path = f"data/{hdf5_indices['surgery_type']}/{hdf5_indices['procedure_id']}/take/{hdf5_indices['take_id']}"
+        frame_idx = hdf5_indices['frame_idx']
+        available_modalities = self.modality_plan.filter(hdf5_indices['available_modalities'])
+
+        take = self.take_index[path]
+        ego_indices, exo_indices = take.split_cameras(
+            self.data_args.ego_sources, self.data_args.exo_sources,
+            include_ultrasound='ultrasound' in available_modalities)
+        draw = self._draws.get(i) or self._sample_draw(take, exo_indices)
+        self._draws[i] = draw
+        while len(self._draws) > MAX_PENDING_DRAWS:
+            self._draws.pop(next(iter(self._draws)))
+        cams = plan_cameras(take, frame_idx, ego_indices, exo_indices, available_modalities, self.frame_cache,
+                            exo_flip=[take.camera_name(cam_idx) in BGR_EXO_SOURCES for cam_idx in draw.exo_cams],
+                            exo_cams=draw.exo_cams)
+        return path, frame_idx, cams, modality_keys(take, available_modalities - draw.dropped, self.take_cache)
+
+    def _sample_draw(self, take, exo_indices) -> SampleDraw:
+        """
+        Draw the random choices of a sample with its own RNG (seeded from the worker's RNG):
+        the exo cameras it uses and the modalities it drops. read_plan draws them for the
+        samples it plans and _get_item uses that draw, so the plan holds exactly the views and
+        datasets the sample reads.
+        """
+        rng = random.Random(random.getrandbits(64))
+        exo_cams = exo_cameras(take, exo_indices)
+        if self.do_img_order_augment:
+            rng.shuffle(exo_cams)
+            exo_cams = exo_cams[:rng.randint(1, min(7, len(exo_cams)))]
+        if self.data_args.dataset_name == "egoexor" and len(exo_cams) > 2:
+            # Randomly select images, ensuring at least 2 and at most 5 images when len > 2.
+            max_images = min(5, len(exo_cams))  # Cap at 5 images
+            num_to_keep = rng.randint(2, max_images)  # Randomly choose between 2 and max_images
+            kept_indices = rng.sample(range(len(exo_cams)), num_to_keep)  # Randomly select num_to_keep indices
+            exo_cams = [exo_cams[i] for i in kept_indices]
+        dropped = frozenset(modality for modality in DROPPABLE_MODALITIES
+                            if self.do_multimodal_augment and rng.random() <= self.multimodal_drop_prop)
+        return SampleDraw(exo_cams, dropped, rng)
 
     def __getitem__(self, i) -> dict[str, torch.Tensor]:
+        return self._get_item(i)
+
+    def __getitems__(self, indices: List[int]) -> List[dict]:
+        """
+        A whole batch (used by the DataLoader fetcher). With `batched_reads`, the reads of all
+        samples are planned first and done per take, one hyperslab or fancy-index read per
+        dataset, then every sample is assembled exactly as __getitem__ does. The read-ahead,
+        if enabled, already reads in the background and keeps the per-sample path.
+        """
+        if not self.data_args.batched_reads or self.read_ahead is not None:
+            return [self._get_item(i) for i in indices]
+        with self.h5_pool.file(self.hdf5_path) as f:
+            batch_reads = read_batch(f, [self.read_plan(i) for i in indices])
+        return [self._get_item(i, batch_reads) for i in indices]
+
+    def _get_item(self, i, batch_reads=None) -> dict[str, torch.Tensor]:
         sources = self.list_data_dict[i]
         if isinstance(i, int):
             sources = [sources]
@@ -1112,24 +1223,14 @@ class LazySupervisedDataset(Dataset):
         procedure_id = hdf5_indices['procedure_id']
         take_id = hdf5_indices['take_id']
         frame_idx = hdf5_indices['frame_idx']
-        available_modalities = set(hdf5_indices['available_modalities'])
+        # --- FILTER MODALITIES: dataset variant, configured features and model encoders ---
+        available_modalities = self.modality_plan.filter(hdf5_indices['available_modalities'])
 
         is_egoexor = True if self.data_args.dataset_name == "egoexor" else False
-        is_4dor = True if self.data_args.dataset_name == "4dor" else False
-        is_mmor = True if self.data_args.dataset_name == "mmor" else False
-
-        # --- FILTER MODALITIES ---
-        if is_4dor:
-            # only keep ego+exo
-            available_modalities &= {"ego_frames", "exo_frames"}
-
-        if is_mmor:
-            # drop gaze and hand-tracking
-            available_modalities -= {"eye_gaze", "eye_gaze_depth", "hand_tracking"}
 
         path = f'data/{surgery_type}/{procedure_id}/take/{take_id}'
 
-        ego_images,   exo_images   = [], []
+        ego_views = {}  # camera index -> raw uint8 ego view, kept for the blank-view check
         ego_source_names, exo_source_names = [], []
         ego_source_ids,   exo_source_ids   = [], []
         # --- initialize all modality slots to None --- #
@@ -1141,251 +1242,137 @@ class LazySupervisedDataset(Dataset):
             'audio':           None,
         }
 
-        with h5py.File(self.hdf5_path, 'r') as f:
-            # -- get the source name map -- #
-            sources_path = f"{path}/sources"
-            camera_names = {}
-            ego_indices, exo_indices = [], []
-
-            if sources_path in f:
-                src_grp = f[sources_path]
-                camera_count = src_grp.attrs.get('source_count', 0)
-
-                # read each source_i --> name . RGB images sorted in the same order
-                for i in range(camera_count):
-                    key = f'source_{i}'
-                    if key in src_grp.attrs:
-                        name = src_grp.attrs[key]
-                        if isinstance(name, bytes):
-                            name = name.decode('utf-8')
-                        camera_names[i] = name
-
-                        # classify ego/exo cameras
-                        if name in self.data_args.ego_sources:
-                            ego_indices.append(i)
-                        elif name in self.data_args.exo_sources:
-                            if name == "ultrasound":
-                                # check if ultrasound listed in available modalities
-                                if 'ultrasound' in available_modalities:
-                                    exo_indices.append(i)
-                            else:
-                                exo_indices.append(i)
-            
+        with self.h5_pool.file(self.hdf5_path) as f:
+            # -- source name map and ego/exo cameras come from the take index -- #
+            take = self.take_index[path]
+            # arrays of the batched read or the read-ahead if they have them, reads from f otherwise
+            if batch_reads is not None and (path, frame_idx) in batch_reads:
+                reads = FrameReads(f, path, frame_idx, *batch_reads[(path, frame_idx)], take_cache=self.take_cache)
+            elif self.read_ahead is not None and isinstance(i, int):
+                reads = self.read_ahead.reads(f, path, frame_idx, i, take_cache=self.take_cache)
+            else:
+                reads = FrameReads(f, path, frame_idx, take_cache=self.take_cache)
+            ego_indices, exo_indices = take.split_cameras(
+                self.data_args.ego_sources, self.data_args.exo_sources,
+                include_ultrasound='ultrasound' in available_modalities)
+            # the draw read_plan made for this sample if it was planned, a new one otherwise
+            draw = self._draws.pop(i, None) if isinstance(i, int) else None
+            if draw is None:
+                draw = self._sample_draw(take, exo_indices)
+
             if ego_indices:
                 ego_range = (min(ego_indices), max(ego_indices) + 1)
             else:
                 print(f"Warning: No ego cameras found in {path}. Using default range (0, 4).")
                 ego_range = (0, 4)
 
-            if exo_indices:
-                exo_range = (min(exo_indices), max(exo_indices) + 1)
-            else:
+            if not exo_indices:
                 print(f"Warning: No exo cameras found in {path}. Using default range (4, 9).")
-                exo_range = (4, 9)
 
 
-            # --- load RGB frames for this timestep ---
-            frame_ds = f[f'{path}/frames/rgb']
-            frame_rgb = torch.from_numpy(frame_ds[frame_idx]).float()
-            # frame_rgb shape = (n_cams, H, W, 3)
+            # --- RGB frames for this timestep: only the cameras that will be used are read, as uint8 ---
+            frame_ds = reads.frame_ds
+            # frame_ds shape = (n_frames, n_cams, H, W, 3)
+            num_cameras = frame_ds.shape[1]
 
             # --- Ego frames --- #
             if 'ego_frames' in available_modalities:
-                ego_slice = frame_rgb[ego_range[0]:ego_range[1]]
-                ego_list = [(ego_slice[j], j + ego_range[0]) for j in range(ego_slice.shape[0])]
-                
+                ego_cams = list(range(ego_range[0], min(ego_range[1], num_cameras)))
+
                 if self.do_img_order_augment: # currently always false
                     pass
-                    # random.shuffle(ego_list)
-                    # n = random.randint(1, min(7, len(ego_list)))
-                    # ego_list = ego_list[:n]
-
-                for img, cam_idx in ego_list:
-                    if isinstance(img, torch.Tensor):
-                        # Assuming img is [H, W, 3], convert to numpy and then PIL
-                        if isinstance(img, torch.Tensor):
-                            if not img.any():          # all pixels zero?
-                                # print(f"Warning: All pixels are zero in {path} for camera {cam_idx}. Skipping this frame.")
-                                continue
-                        else:
-                            raise ValueError(f"Expected torch.Tensor for img, got {type(img)}")
-                        img_np = img.cpu().numpy()
-                        if img_np.max() <= 1.0:
-                            img_np = (img_np * 255).astype(np.uint8)
-                        else:
-                            img_np = img_np.astype(np.uint8)
-                        img_np = img_np[..., ::-1] 
-                        img_pil = Image.fromarray(img_np).convert('RGB')
-                    else:
-                        raise ValueError(f"Expected torch.Tensor for img, got {type(img)}")
-                    proc = self.frame_transform(img_pil)
-
-                    if proc is not None:
-                        ego_images.append(proc)
-                        ego_source_names.append(camera_names.get(cam_idx, f"source_{cam_idx}"))
-                        ego_source_ids.append(cam_idx)
+                    # random.shuffle(ego_cams)
+                    # n = random.randint(1, min(7, len(ego_cams)))
+                    # ego_cams = ego_cams[:n]
+
+                valid_cams = take.valid_cameras(frame_idx, ego_cams)
+                if valid_cams is not None:
+                    # the take's bitmap marks blank views, kept views are read by load_views below
+                    ego_cams, read_cams = valid_cams, []
+                else:
+                    # views already in the frame cache are known to be non-blank and are not read
+                    read_cams = [cam_idx for cam_idx in ego_cams if self.frame_cache is None
+                                 or not self.frame_cache.contains(take, frame_idx, cam_idx, flip=True)]
+                ego_rgb = dict(zip(read_cams, reads.cameras(read_cams)))
+                for cam_idx in ego_cams:
+                    img_np = ego_rgb.get(cam_idx)
+                    if img_np is not None and not img_np.any():          # all pixels zero?
+                        # print(f"Warning: All pixels are zero in {path} for camera {cam_idx}. Skipping this frame.")
+                        continue
+                    # preprocessing waits until the view selection below is done
+                    if img_np is not None:
+                        ego_views[cam_idx] = img_np
+                    ego_source_names.append(take.camera_name(cam_idx))
+                    ego_source_ids.append(cam_idx)
             
             # --- Exo frames ---
             if 'exo_frames' in available_modalities:
-                exo_slice = frame_rgb[exo_range[0]:exo_range[1]]
-                exo_list = [(exo_slice[j], j + exo_range[0]) for j in range(exo_slice.shape[0])]
-
-                if self.do_img_order_augment:
-                    random.shuffle(exo_list)
-                    n = random.randint(1, min(7, len(exo_list)))
-                    exo_list = exo_list[:n]
-
-                exo_images = []
-                exo_source_names = []
-                exo_source_ids = []
-                for img, cam_idx in exo_list:
-                    if isinstance(img, torch.Tensor):
-                        # Assuming img is [H, W, 3], convert to numpy and then PIL
-                        img_np = img.cpu().numpy()
-                        if img_np.max() <= 1.0:
-                            img_np = (img_np * 255).astype(np.uint8)
-                        else:
-                            img_np = img_np.astype(np.uint8)
-                        if camera_names.get(cam_idx) == "ultrasound" or camera_names.get(cam_idx) == "simstation":
-                            img_np = img_np[..., ::-1]
-                        img_pil = Image.fromarray(img_np).convert('RGB')
-                    else:
-                        raise ValueError(f"Expected torch.Tensor for img, got {type(img)}")
-                    proc = self.frame_transform(img_pil)
-                    if proc is not None:
-                        exo_images.append(proc)
-                        exo_source_names.append(camera_names.get(cam_idx, f"source_{cam_idx}"))
-                        exo_source_ids.append(cam_idx)
-
-                if is_egoexor:
-                    # Randomly select images, ensuring at least 2 and at most 5 images when len > 2
-                    if len(exo_images) > 2:  # Only apply dropping/selection if we have more than 2 images
-                        max_images = min(5, len(exo_images))  # Cap at 5 images
-                        num_to_keep = random.randint(2, max_images)  # Randomly choose between 2 and max_images
-                        kept_indices = random.sample(range(len(exo_images)), num_to_keep)  # Randomly select num_to_keep indices
-                        exo_images = [exo_images[i] for i in kept_indices]
-                        exo_source_names = [exo_source_names[i] for i in kept_indices]
-                        exo_source_ids = [exo_source_ids[i] for i in kept_indices]
-
-                    
+                # the order augmentation and the 2-5 view selection of egoexor are drawn by
+                # _sample_draw on camera indices, so the dropped views are never read
+                exo_cams = draw.exo_cams
+
+                # exo views are only named here, they are read after the view selection
+                exo_source_ids = list(exo_cams)
+                exo_source_names = [take.camera_name(cam_idx) for cam_idx in exo_cams]
+
             # --- Eye gaze ---
             if 'eye_gaze' in available_modalities:
-                gaze_key = f'{path}/eye_gaze/coordinates'
-                if "gaze" in self.data_args.egocentric_features and gaze_key in f and \
-                (not self.do_multimodal_augment or random.random() > self.multimodal_drop_prop):
-                    raw = f[gaze_key][frame_idx]       # shape (n_points, 3): [source_type, x, y]
-                    for i in range(raw.shape[0]):
-                        cam_id = int(raw[i, 0])
-                        role = reversed_sources.get(cam_id)       # id ➜ "assistant", ...
-                        if role and _needs_fixation(role, path):
-                            raw[i, 1] += GAZE_FIXATION["x"]
-                            raw[i, 2] += GAZE_FIXATION["y"]
-                    
-                    
+                if take.has('eye_gaze/coordinates') and \
+                'eye_gaze' not in draw.dropped:
+                    raw = reads.row('eye_gaze/coordinates')       # shape (n_points, 3): [source_type, x, y]
+                    apply_gaze_fixation(raw, take)
+
                     coords = torch.from_numpy(raw[:, 1:3]).float()
                     coords = self.gaze_normalize(coords).to(dtype=torch.bfloat16)
                     camera_ids = torch.from_numpy(raw[:, 0]).long()
-                    # Map ego_source_names to SOURCES IDs
-                    ego_source_ids_mapped = [SOURCES[name] for name in ego_source_names]
-                    
-                    # Filter gaze data based on mapped ego_source_ids
-                    valid_indices = [
-                        idx for idx, cam_id in enumerate(camera_ids)
-                        if cam_id.item() in ego_source_ids_mapped
-                    ]
-                    #print(f"Valid gaze indices: {valid_indices}")
-                    valid_coords = coords[valid_indices]
-                    valid_camera_ids = camera_ids[valid_indices]
-
-                    # Reorder to match ego_source_names
-                    ordered_indices = []
-                    for source_id in ego_source_ids_mapped:
-                        for idx, cam_id in enumerate(valid_camera_ids):
-                            if cam_id.item() == source_id:
-                                ordered_indices.append(idx)
-                                break
-                    ordered_coords = valid_coords[ordered_indices] if ordered_indices else torch.zeros((0, 2), dtype=torch.bfloat16)
-                    ordered_camera_ids = valid_camera_ids[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.long)
+                    # first gaze row of every ego view (by SOURCES id), in the order of ego_source_names
+                    rows = torch.from_numpy(gaze_rows(camera_ids.numpy(), take.source_ids(ego_source_ids)))
 
                     modality_data['eye_gaze'] = {
-                        'data': ordered_coords,
-                        'camera_ids': ordered_camera_ids
+                        'data': coords[rows],
+                        'camera_ids': camera_ids[rows]
                     }
 
-                    #valid_mapped_ids = [ego_source_ids_mapped[i] for i, _ in enumerate(ego_source_ids_mapped) if i in [ego_source_ids_mapped.index(valid_camera_ids[idx].item()) for idx in ordered_indices]] if ordered_indices else []
-                    #print(f"Valid mapped gaze indices: {valid_mapped_ids}")
-                    #print(f"old ego_source_ids: {ego_source_ids}")
-                    #ego_source_ids = valid_mapped_ids
-                    #print(f"new ego_source_ids: {ego_source_ids}")
-
             # --- Eye gaze depth ---
             if 'eye_gaze_depth' in available_modalities:
-                depth_key = f'{path}/eye_gaze_depth/values'
-                if "gaze_depth" in self.data_args.egocentric_features and depth_key in f and \
-                (not self.do_multimodal_augment or random.random() > self.multimodal_drop_prop):
+                if take.has('eye_gaze_depth/values') and \
+                'eye_gaze_depth' not in draw.dropped:
 
-                    raw_d = torch.from_numpy(f[depth_key][frame_idx]).float()
+                    raw_d = torch.from_numpy(reads.row('eye_gaze_depth/values')).float()
                     raw_d = self.depth_normalize(raw_d).to(dtype=torch.bfloat16)
-                    
-                    # Filter gaze depth data based on ego_indices
-                    valid_indices = [idx for idx in range(raw_d.shape[0]) if idx + ego_range[0] in ego_indices]
-                    valid_d = raw_d[valid_indices]
-
-                    # Reorder to match ego_source_names
-                    ordered_indices = [
-                        valid_indices.index(idx) for idx in valid_indices
-                        if idx + ego_range[0] in ego_indices and ego_indices.index(idx + ego_range[0]) < len(ego_source_names)
-                    ]
-                    ordered_d = valid_d[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.bfloat16)
+
+                    # one row per ego camera of the take, as many as there are ego views
+                    rows = torch.from_numpy(ego_rows(ego_indices[:len(ego_source_names)], raw_d.shape[0]))
 
                     modality_data['eye_gaze_depth'] = {
-                        'data': ordered_d
+                        'data': raw_d[rows]
                     }
 
             # --- Hand tracking ---
             if 'hand_tracking' in available_modalities:
-                hand_key = f'{path}/hand_tracking/positions'
-                if "hand" in self.data_args.egocentric_features and hand_key in f and \
-                (not self.do_multimodal_augment or random.random() > self.multimodal_drop_prop):
+                if take.has('hand_tracking/positions') and \
+                'hand_tracking' not in draw.dropped:
 
-                    raw_h = torch.from_numpy(f[hand_key][frame_idx][:, 1:]).float()
+                    raw_h = torch.from_numpy(reads.row('hand_tracking/positions')[:, 1:]).float()
                     mask = torch.isnan(raw_h).any(dim=-1)
                     raw_h = torch.nan_to_num(raw_h, nan=0.0)
                     raw_h = self.hand_normalize(raw_h).to(dtype=torch.bfloat16)
-                    camera_ids = torch.arange(raw_h.shape[0]).long()
-
-                    # Filter hand tracking data based on ego_indices
-                    valid_indices = [idx for idx in range(raw_h.shape[0]) if idx + ego_range[0] in ego_indices]
-                    valid_h = raw_h[valid_indices]
-                    valid_mask = mask[valid_indices]
-                    valid_camera_ids = camera_ids[valid_indices]
-                    # Reorder to match ego_source_names
-                    ordered_indices = []
-                    for name in ego_source_names:
-                        for idx, cam_idx in enumerate(valid_camera_ids):
-                            if cam_idx + ego_range[0] == ego_indices[ego_source_names.index(name)]:
-                                ordered_indices.append(idx)
-                                break
-                    
-                    ordered_h = valid_h[ordered_indices] if ordered_indices else torch.zeros((0, raw_h.shape[1]), dtype=torch.bfloat16)
-                    ordered_mask = valid_mask[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.bool)
-                    ordered_camera_ids = valid_camera_ids[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.long)
+
+                    rows = torch.from_numpy(ego_rows(ego_indices[:len(ego_source_names)], raw_h.shape[0]))
 
                     modality_data['hand_tracking'] = {
-                        'data': ordered_h,
-                        'mask': ordered_mask,
-                        'camera_ids': ordered_camera_ids
+                        'data': raw_h[rows],
+                        'mask': mask[rows],
+                        'camera_ids': rows
                     }
                 
            # --- Point cloud --- 
             if 'point_cloud' in available_modalities:
-                points_key = f'{path}/point_cloud/coordinates'
-                colors_key = f'{path}/point_cloud/colors'
-                if "point_cloud" in self.data_args.exocentric_features and points_key in f and \
-                (not self.do_multimodal_augment or random.random() > self.multimodal_drop_prop):
+                if take.has('point_cloud/coordinates') and \
+                'point_cloud' not in draw.dropped:
                     # 1) load coords (in meters) and colors (0–255)
-                    coords = np.asarray(f[points_key][frame_idx])
-                    colors = np.asarray(f[colors_key][frame_idx])  # shape=(N,3), dtype=uint8
+                    coords = np.asarray(reads.row('point_cloud/coordinates'))
+                    colors = np.asarray(reads.row('point_cloud/colors'))  # shape=(N,3), dtype=uint8
                     pts6   = np.concatenate([coords, colors], axis=1)
                     points_data = torch.from_numpy(pts6)
                     modality_data['point_cloud'] = {
@@ -1394,16 +1381,47 @@ class LazySupervisedDataset(Dataset):
             
             # --- Audio ---
             if 'audio' in available_modalities:
-                audio_key = f'{path}/audio/snippets'
-                if "audio" in self.data_args.exocentric_features and audio_key in f and \
-                (not self.do_multimodal_augment or random.random() > self.multimodal_drop_prop):
-
-                    raw_a = torch.from_numpy(f[audio_key][frame_idx]).float()
-                    raw_a = self.audio_normalize(raw_a).to(dtype=torch.bfloat16)
-                    raw_a = raw_a.unsqueeze(0)  # batch dim
-                    raw_a = self.audio_processor(raw_a)
+                if has_audio(take) and \
+                'audio' not in draw.dropped:
+
+                    raw_a = load_audio_features(reads, take, self.audio_normalize, self.audio_processor)
                     modality_data['audio'] = {'data': raw_a}
-    
+
+            has_image = len(ego_source_ids) > 0 or len(exo_source_ids) > 0
+
+            # --- View selection on source ids/names only, drawn after the modality drops as before ---
+            if not is_egoexor:
+                # we do not utilize dual branch modal, instead process all available modalities from single exocentric branch
+                combined_exo_source_ids = ego_source_ids + exo_source_ids
+                combined_exo_source_names = ego_source_names + exo_source_names
+
+                # randomly select 7 images from the combined list
+                max_images = min(7, len(combined_exo_source_ids))  # Cap at 5 images
+                num_to_keep = draw.rng.randint(2, max_images)  # Randomly choose between 2 and max_images
+                kept_indices = draw.rng.sample(range(len(combined_exo_source_ids)), num_to_keep)  # Randomly select num_to_keep indices
+                combined_exo_source_names = [combined_exo_source_names[i] for i in kept_indices]
+                combined_exo_source_ids = [combined_exo_source_ids[i] for i in kept_indices]
+                combined_is_ego = [i < len(ego_source_ids) for i in kept_indices]
+            else:
+                combined_exo_source_ids = exo_source_ids
+                combined_exo_source_names = exo_source_names
+                combined_is_ego = [False] * len(exo_source_ids)
+
+            # --- Decode and preprocess only the kept views (through the frame cache if enabled) ---
+            def read_views(cams):
+                file_cams = [cam_idx for cam_idx in cams if cam_idx not in ego_views]
+                file_rgb = dict(zip(file_cams, reads.cameras(file_cams))) if file_cams else {}
+                return [ego_views[cam_idx] if cam_idx in ego_views else file_rgb[cam_idx] for cam_idx in cams]
+
+            # ego views and the ultrasound/simstation recordings are stored BGR
+            # ego frames only go to their own branch for egoexor
+            ego_images = load_views(self.frame_transform, self.frame_cache, take, frame_idx,
+                                    ego_source_ids, [True] * len(ego_source_ids), read_views) if is_egoexor else []
+            combined_flips = [is_ego or name in BGR_EXO_SOURCES
+                              for name, is_ego in zip(combined_exo_source_names, combined_is_ego)]
+            combined_exo_images = load_views(self.frame_transform, self.frame_cache, take, frame_idx,
+                                             combined_exo_source_ids, combined_flips, read_views)
+
         sources = preprocess_multimodal(
             copy.deepcopy([e["conversations"] for e in sources]),
             self.data_args)
@@ -1411,31 +1429,10 @@ class LazySupervisedDataset(Dataset):
         data_dict = preprocess(
             sources,
             self.tokenizer,
-            has_image=len(ego_images) > 0 or len(exo_images) > 0)
+            has_image=has_image)
         if isinstance(i, int):
             data_dict = dict(input_ids=data_dict["input_ids"][0], labels=data_dict["labels"][0])
 
-
-        if not is_egoexor:
-            # we do not utilize dual branch modal, instead process all available modalities from single exocentric branch
-            combined_exo_images = ego_images + exo_images
-            combined_exo_source_ids = ego_source_ids + exo_source_ids
-            combined_exo_source_names = ego_source_names + exo_source_names
-
-            # randomly select 7 images from the combined list
-            max_images = min(7, len(combined_exo_images))  # Cap at 5 images
-            num_to_keep = random.randint(2, max_images)  # Randomly choose between 2 and max_images
-            kept_indices = random.sample(range(len(combined_exo_images)), num_to_keep)  # Randomly select num_to_keep indices
-            combined_exo_images = [combined_exo_images[i] for i in kept_indices]
-            combined_exo_source_names = [combined_exo_source_names[i] for i in kept_indices]
-            combined_exo_source_ids = [combined_exo_source_ids[i] for i in kept_indices]
-
-
-        else:
-            combined_exo_images = exo_images
-            combined_exo_source_ids = exo_source_ids
-            combined_exo_source_names = exo_source_names
-        
         if combined_exo_images:
             data_dict['exo_frames'] = torch.stack(combined_exo_images)
             data_dict['exo_source_ids'] = combined_exo_source_ids
@@ -1448,7 +1445,7 @@ class LazySupervisedDataset(Dataset):
             data_dict['ego_source_names'] = ego_source_names
             
         # Fallback zeros when truly no images and multimodal
-        if not ego_images and not exo_images and self.data_args.is_multimodal:
+        if not has_image and self.data_args.is_multimodal:
             crop_size = self.data_args.image_processor.crop_size
             zeros = torch.zeros(1, 3, crop_size['height'], crop_size['width'])
             data_dict['exo_frames']       = zeros
@@ -0,0 +1,325 @@
+"""
+Throughput of the data pipelines on an EgoExOR HDF5 file, e.g. a synthetic one.
+
+For each target it reports samples/s, the bytes read and the time per sample of every stage:
+    lazy   LazySupervisedDataset (training) + DataCollatorForSupervisedDataset
+    or     ORDataset (evaluation) + DataCollatorForORDataset
+    model  data preparation of ModelWrapper.forward (load_inputs + collate_inputs), without generation
+
+Stage times are exclusive (time in a nested stage is not counted for the enclosing one):
+    open       dataset/ModelWrapper construction and opening the HDF5 handle
+    read       h5py reads, including the chunk decompression
+    decode     uint8 views -> PIL (and frame cache lookups), load_views minus read/transform
+    transform  FrameTransform (CLIP preprocessing) and the modality normalizers
+    tokenize   conversation templates and tokenization
+    collate    the collators / ModelWrapper.collate_inputs
+    other      everything else (view selection, modality alignment, ...)
+Bytes are the decompressed bytes returned by h5py and the bytes read from files (rchar).
+A word-level tokenizer built from the samples and a CLIP image processor with the LLaVA-1.5
+settings stand in for the model's, and ModelWrapper gets a stub model, so nothing is downloaded.
+Write the file with --clap_embedding, otherwise the first audio sample loads CLAP.
+
+From the repository root, then from scene_graph_generation/:
+    python -m data.utils.synthetic_h5 --output_file /tmp/synthetic.h5 --clap_embedding
+    python -m benchmarks.dataset_throughput --hdf5_path /tmp/synthetic.h5 --num_samples 256
+"""
+import argparse
+import functools
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import h5py
+import torch
+import transformers
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from torch.utils.data import DataLoader
+
+# repository root, for the scene_graph_generation.* imports of train.py and the model
+sys.path.append(os.path.abspath('..'))
+
+from LLaVA.llava.train import train as llava_train
+from scene_graph_prediction.llava_helpers.generate_dataset_format_for_llava import generate_finetuning_samples_from_hdf5
+from scene_graph_prediction.scene_graph_helpers.dataset.or_dataset import ORDataset, DataCollatorForORDataset
+from scene_graph_prediction.scene_graph_helpers.dataset.sample_manifest import SampleManifest, SAMPLE_MANIFEST_SUFFIX, load_samples
+from scene_graph_prediction.scene_graph_helpers.model import scene_graph_prediction_model
+from scene_graph_prediction.scene_graph_helpers.model.scene_graph_prediction_model import ModelWrapper
+
+STAGES = ('open', 'read', 'decode', 'transform', 'tokenize', 'collate', 'other')
+MODALITIES = ('ego_frames', 'exo_frames', 'eye_gaze', 'eye_gaze_depth', 'hand_tracking', 'audio', 'point_cloud', 'ultrasound')
+TRANSFORMS = ('FrameTransform', 'GazeNormalize', 'GazeDepthNormalize', 'HandTrackingNormalize', 'AudioTransform')
+
+
+def read_chars():
+    """Bytes this process read from files so far (Linux), None elsewhere."""
+    try:
+        with open('/proc/self/io') as f:
+            return int(next(line for line in f if line.startswith('rchar:')).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+
+class StageTimer:
+    """Exclusive wall time per stage, the bytes returned by h5py reads and the bytes read from files."""
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.h5_bytes = 0
+        self._chars = read_chars()
+        self._stack = []
+        self._mark = time.perf_counter()
+
+    def reset(self):
+        self.seconds.clear()
+        self.h5_bytes = 0
+        self._chars = read_chars()
+
+    @property
+    def file_bytes(self):
+        return read_chars() - self._chars if self._chars is not None else float('nan')
+
+    def _switch(self):
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    @contextmanager
+    def stage(self, name):
+        self._switch()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stack.pop()
+
+    def patch(self, owner, attr, name):
+        fn = getattr(owner, attr)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        setattr(owner, attr, timed)
+
+    def count_h5_bytes(self):
+        read = h5py.Dataset.__getitem__
+
+        @functools.wraps(read)
+        def counted(ds, *args, **kwargs):
+            with self.stage('read'):
+                result = read(ds, *args, **kwargs)
+            self.h5_bytes += getattr(result, 'nbytes', 0)
+            return result
+        h5py.Dataset.__getitem__ = counted
+
+
+def loaded_modules(suffix):
+    """Every imported copy of a module (train.py imports the dataset package under a second name)."""
+    return [module for name, module in list(sys.modules.items()) if name.endswith(suffix) and module is not None]
+
+
+def instrument(timer):
+    timer.count_h5_bytes()
+    for module in loaded_modules('.dataset.hdf5_utils'):
+        timer.patch(module.H5HandlePool, '_open', 'open')
+    for module in (llava_train, scene_graph_prediction_model):
+        timer.patch(module, 'load_views', 'decode')
+        for name in TRANSFORMS:
+            timer.patch(getattr(module, name), '__call__', 'transform')
+    timer.patch(llava_train, 'preprocess', 'tokenize')
+    timer.patch(scene_graph_prediction_model, 'tokenizer_image_token', 'tokenize')
+
+
+def close_h5_handles():
+    """Start every target with cold HDF5 handles (the OS page cache stays warm)."""
+    for module in loaded_modules('.dataset.hdf5_utils'):
+        module.get_h5_pool().close()
+
+
+def stub_tokenizer(texts, model_max_length=2048):
+    """Word-level tokenizer over the words of `texts`, with the special tokens of the LLaVA (LLaMA) tokenizer."""
+    vocab = {'<unk>': 0, '<s>': 1, '</s>': 2, '<pad>': 3}
+    pre_tokenizer = pre_tokenizers.Whitespace()
+    for text in texts:
+        for word, _ in pre_tokenizer.pre_tokenize_str(text):
+            vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizer
+    tokenizer.post_processor = processors.TemplateProcessing(single='<s> $A', special_tokens=[('<s>', 1)])
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', unk_token='<unk>', pad_token='<pad>',
+        model_max_length=model_max_length, padding_side='right')
+
+
+def stub_image_processor():
+    """CLIP preprocessing of LLaVA-1.5 (openai/clip-vit-large-patch14-336), without the download."""
+    return transformers.CLIPImageProcessor(size={'shortest_edge': 336}, crop_size={'height': 336, 'width': 336})
+
+
+class StubModel(torch.nn.Module):
+    """ModelWrapper only needs the config and the device of the model to prepare its inputs."""
+    def __init__(self):
+        super().__init__()
+        self.config = SimpleNamespace()
+        self.anchor = torch.nn.Parameter(torch.zeros(1), requires_grad=False)
+
+    @property
+    def device(self):
+        return self.anchor.device
+
+
+def make_model_wrapper(args, tokenizer, image_processor, modality_plan):
+    def load_pretrained_model(*_, **__):
+        return tokenizer, StubModel(), image_processor, tokenizer.model_max_length
+
+    scene_graph_prediction_model.load_pretrained_model = load_pretrained_model
+    return ModelWrapper(hdf5_path=args.hdf5_path, dataset_name=args.dataset_name, relationNames=[], classNames=[],
+                        model_path='synthetic', hdf5_rdcc_nbytes=args.hdf5_rdcc_nbytes,
+                        frame_cache_dir=args.frame_cache_dir, modality_plan=modality_plan,
+                        take_cache_bytes=args.take_cache_bytes)
+
+
+def make_samples(args, output_dir):
+    """Manifest of every frame of the split with all modalities enabled (no dropout), or --data_path."""
+    if args.data_path is not None:
+        return args.data_path
+    config = {'modalities': {modality: {'enabled': True} for modality in MODALITIES}}
+    samples, _ = generate_finetuning_samples_from_hdf5(args.hdf5_path, args.split, config, None, None,
+                                                       n_permutations=1, modality_dropout_prob=0, reduce_ratio=1)
+    path = os.path.join(output_dir, f'{args.split}{SAMPLE_MANIFEST_SUFFIX}')
+    SampleManifest.from_samples(samples).save(path)
+    return path
+
+
+def batches(order, batch_size):
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def run_lazy(args, timer, data_args, tokenizer, order):
+    with timer.stage('open'):
+        dataset = llava_train.LazySupervisedDataset(data_path=args.manifest, hdf5_path=args.hdf5_path,
+                                                    tokenizer=tokenizer, data_args=data_args)
+    collator = llava_train.DataCollatorForSupervisedDataset(tokenizer=tokenizer, data_args=data_args)
+    for indices in batches(order, args.batch_size):
+        with timer.stage('other'):
+            instances = dataset.__getitems__(indices)
+            with timer.stage('collate'):
+                collator(instances)
+    return dataset, collator
+
+
+def run_or(args, timer, data_args, tokenizer, order):
+    with timer.stage('open'):
+        dataset = ORDataset(data_path=args.manifest, hdf5_path=args.hdf5_path, data_args=data_args)
+    collator = DataCollatorForORDataset(data_args)
+    for indices in batches(order, args.batch_size):
+        with timer.stage('other'):
+            instances = [dataset[i] for i in indices]
+            with timer.stage('collate'):
+                collator(instances)
+    return dataset, collator
+
+
+def run_model(args, timer, data_args, tokenizer, order):
+    # the ORDataset batches are loaded up front and not timed
+    dataset = ORDataset(data_path=args.manifest, hdf5_path=args.hdf5_path, data_args=data_args)
+    collator = DataCollatorForORDataset(data_args)
+    inputs = [collator([dataset[i] for i in indices]) for indices in batches(order, args.batch_size)]
+    close_h5_handles()
+    timer.reset()
+
+    with timer.stage('open'):
+        model = make_model_wrapper(args, tokenizer, data_args.image_processor, dataset.modality_plan)
+    for batch in inputs:
+        with timer.stage('other'):
+            outputs = model.load_inputs(batch)
+            with timer.stage('collate'):
+                model.collate_inputs(outputs)
+    # no DataLoader to measure, the wrapper is returned for its take cache statistics
+    return model, None
+
+
+TARGETS = {'lazy': run_lazy, 'or': run_or, 'model': run_model}
+
+
+def loader_samples_per_second(dataset, collator, order, batch_size, num_workers):
+    """End-to-end samples/s of a DataLoader with `num_workers` workers over `order` (no stage breakdown)."""
+    loader = DataLoader(dataset, batch_size=batch_size, sampler=order, num_workers=num_workers,
+                        collate_fn=collator, persistent_workers=False)
+    start = time.perf_counter()
+    for _ in loader:
+        pass
+    return len(order) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--hdf5_path', type=str, required=True, help='EgoExOR HDF5 file (data/utils/synthetic_h5.py)')
+    parser.add_argument('--data_path', type=str, default=None, help='Sample manifest/JSON (all frames of --split if not set)')
+    parser.add_argument('--split', type=str, default='train', choices=['train', 'validation', 'test'])
+    parser.add_argument('--targets', type=str, nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--num_samples', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--shuffle', action='store_true', help='Random sample order instead of take/frame order')
+    parser.add_argument('--dataset_name', type=str, default='egoexor', choices=['egoexor', '4dor', 'mmor'])
+    parser.add_argument('--hdf5_rdcc_nbytes', type=int, default=llava_train.DEFAULT_RDCC_NBYTES)
+    parser.add_argument('--frame_cache_dir', type=str, default=None)
+    parser.add_argument('--take_cache_bytes', type=int, default=0, help='Budget of the whole-take gaze/hand cache (0 disables)')
+    parser.add_argument('--batched_reads', action='store_true', help='LazySupervisedDataset.__getitems__ batched reads')
+    parser.add_argument('--tokenizer', type=str, default=None, help='Real tokenizer (e.g. liuhaotian/llava-v1.5-7b) instead of the stub')
+    parser.add_argument('--num_workers', type=int, default=0, help='Also measure a DataLoader with this many workers')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        args.manifest = make_samples(args, output_dir)
+        manifest = load_samples(args.manifest)
+        order = list(range(len(manifest)))
+        if args.shuffle:
+            random.Random(args.seed).shuffle(order)
+        order = order[:args.num_samples]
+
+        if args.tokenizer is not None:
+            tokenizer = transformers.AutoTokenizer.from_pretrained(args.tokenizer, model_max_length=2048,
+                                                                   padding_side='right', use_fast=False)
+        else:
+            tokenizer = stub_tokenizer(turn['value'] for i in order for turn in manifest[i]['conversations'])
+        data_args = llava_train.DataArguments(data_path=args.manifest, hdf5_path=args.hdf5_path,
+                                              hdf5_rdcc_nbytes=args.hdf5_rdcc_nbytes, frame_cache_dir=args.frame_cache_dir,
+                                              take_cache_bytes=args.take_cache_bytes,
+                                              batched_reads=args.batched_reads, is_multimodal=True,
+                                              dataset_name=args.dataset_name)
+        data_args.image_processor = stub_image_processor()
+        data_args.mm_use_im_start_end = False
+
+        timer = StageTimer()
+        instrument(timer)
+        print(f'{len(order)} samples of {args.hdf5_path}, batch size {args.batch_size}')
+        print(f'{"target":<8}{"samples/s":>10}{"MB h5/s":>9}{"MB file/s":>10}'
+              + ''.join(f'{stage:>10}' for stage in STAGES) + '   (ms per sample)')
+        for target in args.targets:
+            random.seed(args.seed)
+            torch.manual_seed(args.seed)
+            close_h5_handles()
+            timer.reset()
+            dataset, collator = TARGETS[target](args, timer, data_args, tokenizer, order)
+            seconds = sum(timer.seconds.values())
+            print(f'{target:<8}{len(order) / seconds:>10.1f}{timer.h5_bytes / seconds / 2 ** 20:>9.1f}'
+                  f'{timer.file_bytes / seconds / 2 ** 20:>10.1f}'
+                  + ''.join(f'{timer.seconds[stage] * 1000 / len(order):>10.2f}' for stage in STAGES))
+            take_cache = getattr(dataset, 'take_cache', None)
+            if take_cache is not None:
+                print(f'{"":<8}take cache: {take_cache.stats()}')
+            if args.num_workers > 0 and collator is not None:
+                samples_per_second = loader_samples_per_second(dataset, collator, order, args.batch_size, args.num_workers)
+                print(f'{"":<8}{samples_per_second:>10.1f} samples/s with {args.num_workers} DataLoader workers')
+
+
+if __name__ == '__main__':
+    main()
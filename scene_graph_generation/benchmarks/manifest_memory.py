@@ -0,0 +1,139 @@
+"""
+Memory-growth regression benchmark for the sample table of the training dataset.
+
+Builds a synthetic sample list (500k samples by default), forks DataLoader-like workers
+and lets each of them read every sample once, as an epoch would. It reports how much
+private memory each worker gains while doing so (pages copied on write), for the old
+list-of-dicts table and for the SampleManifest used by the datasets.
+
+Linux only (reads /proc/self/smaps_rollup). Run from scene_graph_generation/:
+    python -m benchmarks.manifest_memory --num_samples 500000 --num_workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from scene_graph_prediction.llava_helpers.scene_graph_templates import SCENE_GRAPH_PROMPT
+from scene_graph_prediction.scene_graph_helpers.dataset.sample_manifest import (
+    MODALITY_BITS, SampleManifest, SAMPLE_MANIFEST_SUFFIX
+)
+
+ENTITIES = ['head surgeon', 'assistant', 'patient', 'operating table', 'scalpel', 'ultrasound probe', 'needle']
+PREDICATES = ['holding', 'close to', 'lying on', 'cutting', 'scanning', 'touching']
+
+
+def private_mb() -> float:
+    """
+    Private anonymous memory of this process in MB: heap growth and pages copied on write.
+    Memory-mapped manifest files are (shared) page cache and are not counted.
+    """
+    total_kb = mapping_dirty_kb = 0
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            if line.startswith('Private_Dirty:'):
+                mapping_dirty_kb = int(line.split()[1])
+            elif line.startswith('Anonymous:') and int(line.split()[1]) > 0:
+                total_kb += mapping_dirty_kb
+    return total_kb / 1024
+
+
+def synthetic_samples(num_samples, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for i in range(num_samples):
+        surgery_type = rng.choice(['MISS', 'Ultrasound'])
+        procedure_id, take_id, frame_idx = rng.randint(1, 20), rng.randint(1, 6), rng.randint(0, 5000)
+        triplets = [f'{rng.choice(ENTITIES)},{rng.choice(ENTITIES)},{rng.choice(PREDICATES)}'
+                    for _ in range(rng.randint(1, 12))]
+        samples.append({
+            'id': f'{surgery_type}_{procedure_id}_{take_id}_{frame_idx}_{i % 4}',
+            'timepoint': frame_idx,
+            'hdf5_indices': {
+                'surgery_type': surgery_type,
+                'procedure_id': procedure_id,
+                'take_id': take_id,
+                'frame_idx': frame_idx,
+                'available_modalities': rng.sample(MODALITY_BITS, rng.randint(1, len(MODALITY_BITS))),
+            },
+            'conversations': [
+                {'from': 'human', 'value': f"<image>\n{SCENE_GRAPH_PROMPT}"},
+                {'from': 'gpt', 'value': '<SG> ' + '; '.join(triplets) + ' </SG>'},
+            ],
+        })
+    return samples
+
+
+def _worker(table, result_queue):
+    before = private_mb()
+    # what LazySupervisedDataset.__getitem__ touches per sample
+    checksum = 0
+    for i in range(len(table)):
+        sample = table[i]
+        checksum += sample['hdf5_indices']['frame_idx'] + len(sample['conversations'][1]['value'])
+    result_queue.put(private_mb() - before)
+
+
+def measure(table, num_workers):
+    """Per-worker private memory growth (MB) over one pass of forked workers."""
+    ctx = multiprocessing.get_context('fork')
+    result_queue = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(table, result_queue)) for _ in range(num_workers)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    growth = [result_queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return growth, time.time() - start
+
+
+def _measure_manifest(manifest_path, num_workers, result_queue):
+    # runs in a fresh process, like a training run that opens the manifest from disk
+    result_queue.put(measure(SampleManifest.load(manifest_path), num_workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num_samples', type=int, default=500_000)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--max_growth_mb', type=float, default=64.0,
+                        help='Fail if a worker grows by more than this with the manifest')
+    parser.add_argument('--skip_list', action='store_true', help='Only measure the manifest')
+    args = parser.parse_args()
+
+    start = time.time()
+    samples = synthetic_samples(args.num_samples)
+    print(f'Built {len(samples)} synthetic samples in {time.time() - start:.1f}s')
+
+    tmp_dir = tempfile.mkdtemp(prefix='manifest_memory_')
+    try:
+        if not args.skip_list:
+            growth, seconds = measure(samples, args.num_workers)
+            print(f'list of dicts : max worker growth {max(growth):8.1f} MB, pass {seconds:.1f}s')
+
+        manifest_path = os.path.join(tmp_dir, f'bench{SAMPLE_MANIFEST_SUFFIX}')
+        SampleManifest.from_samples(samples).save(manifest_path)
+        del samples
+        ctx = multiprocessing.get_context('spawn')
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=_measure_manifest, args=(manifest_path, args.num_workers, result_queue))
+        process.start()
+        growth, seconds = result_queue.get()
+        process.join()
+        print(f'SampleManifest: max worker growth {max(growth):8.1f} MB, pass {seconds:.1f}s')
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if max(growth) > args.max_growth_mb:
+        print(f'FAIL: worker memory grew by more than {args.max_growth_mb} MB with the manifest')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
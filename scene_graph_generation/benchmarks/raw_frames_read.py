@@ -0,0 +1,180 @@
+"""
+Random camera-view reads from the HDF5 file, its raw frame export, its JPEG export and its
+video export.
+
+All backends serve the same (take, frame, cameras) reads through read_cameras, and every
+view is reduced once (`max()`), so the pages of the raw export are actually read and both
+pay the same compute. The HDF5 reads include the chunk decompression; the raw reads are
+page faults on the memory-mapped file. With --cold, the page cache of both files is
+dropped first (posix_fadvise, Linux), otherwise the second pass of a small file is served
+from memory. The video export is decoded per GOP (cached per process), so --sequential
+reads show the effect of the GOP cache; its footprint and the compressed bytes read per
+read are reported next to the raw export's. The JPEG export decodes every view at reduced
+scale (see jpeg_frames.py), so its views, and MB/s, are smaller. Every export is also
+checked against the HDF5 views (view shapes, blank views read back as zeros, mean error).
+
+From the repository root, then from scene_graph_generation/:
+    python -m data.utils.synthetic_h5 --output_file /tmp/synthetic.h5 --num_frames 256
+    python -m data.utils.export_raw_frames --hdf5_path /tmp/synthetic.h5
+    python -m data.utils.export_jpeg_frames --hdf5_path /tmp/synthetic.h5    # optional
+    python -m data.utils.export_video_frames --hdf5_path /tmp/synthetic.h5   # optional, needs PyAV
+    python -m benchmarks.raw_frames_read --hdf5_path /tmp/synthetic.h5 --num_reads 512 --cold
+"""
+import argparse
+import os
+import random
+import time
+
+import h5py
+import numpy as np
+
+from scene_graph_prediction.scene_graph_helpers.dataset.hdf5_utils import DEFAULT_RDCC_NBYTES, read_cameras
+from scene_graph_prediction.scene_graph_helpers.dataset.jpeg_frames import JPEG_FRAMES_SUFFIX, JpegFrameStore
+from scene_graph_prediction.scene_graph_helpers.dataset.raw_frames import RAW_FRAMES_SUFFIX, RawFrameStore
+from scene_graph_prediction.scene_graph_helpers.dataset.video_frames import VIDEO_FRAMES_SUFFIX, VideoFrameStore, av
+
+
+def drop_page_cache(path):
+    """Evict a file from the page cache (best effort)."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def make_reads(headers, num_reads, num_cameras, sequential, seed):
+    """(take, frame, cameras) of every read: random frames and cameras, or consecutive frames of each take."""
+    rng = random.Random(seed)
+    takes = sorted(headers)
+    reads = []
+    while len(reads) < num_reads:
+        take = rng.choice(takes)
+        num_frames, take_cameras = headers[take]['shape'][:2]
+        frames = range(num_frames) if sequential else [rng.randrange(num_frames)]
+        for frame in frames:
+            count = min(num_cameras or take_cameras, take_cameras)
+            reads.append((take, frame, sorted(rng.sample(range(take_cameras), count))))
+    return reads[:num_reads]
+
+
+def run(frames_of, reads):
+    """Seconds and bytes of all reads, each view reduced once."""
+    nbytes = 0
+    start = time.perf_counter()
+    for take, frame, cams in reads:
+        for view in read_cameras(frames_of(take), frame, cams):
+            view.max()
+            nbytes += view.nbytes
+    return time.perf_counter() - start, nbytes
+
+
+def downscale(view, height, width):
+    """Block mean of a uint8 view [H, W, 3] to [height, width, 3] (edge blocks are partial)."""
+    scale_h, scale_w = -(-view.shape[0] // height), -(-view.shape[1] // width)
+    if (scale_h, scale_w) == (1, 1):
+        return view.astype(np.float64)
+    padded = np.pad(view.astype(np.float64), ((0, height * scale_h - view.shape[0]),
+                                              (0, width * scale_w - view.shape[1]), (0, 0)), mode='edge')
+    return padded.reshape(height, scale_h, width, scale_w, 3).mean(axis=(1, 3))
+
+
+def check_views(f, frames_of, reads, num_checks=8):
+    """
+    Round trip of a backend against the HDF5 file: every view of the first reads must have
+    the backend's shape, blank views must stay exactly zero, and the mean absolute error
+    against the HDF5 view (block-averaged to the backend's size) is returned.
+    """
+    errors = []
+    for take, frame, cams in reads[:num_checks]:
+        frames = frames_of(take)
+        for view, reference in zip(read_cameras(frames, frame, cams), read_cameras(f[f'{take}/frames/rgb'], frame, cams)):
+            if view.shape != tuple(frames.shape[2:]):
+                raise AssertionError(f'{take} frame {frame}: view of shape {view.shape}, expected {frames.shape[2:]}')
+            if not reference.any():
+                if view.any():
+                    raise AssertionError(f'{take} frame {frame}: a blank view is not read back as zeros')
+                continue
+            errors.append(np.abs(view - downscale(reference, *view.shape[:2])).mean())
+    return float(np.mean(errors)) if errors else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--hdf5_path', type=str, required=True)
+    parser.add_argument('--raw_dir', type=str, default=None, help=f'Raw export (default: <hdf5_path>{RAW_FRAMES_SUFFIX})')
+    parser.add_argument('--jpeg_dir', type=str, default=None, help=f'JPEG export (default: <hdf5_path>{JPEG_FRAMES_SUFFIX})')
+    parser.add_argument('--video_dir', type=str, default=None, help=f'Video export (default: <hdf5_path>{VIDEO_FRAMES_SUFFIX})')
+    parser.add_argument('--num_reads', type=int, default=512)
+    parser.add_argument('--num_cameras', type=int, default=0, help='Random cameras per read (0: all)')
+    parser.add_argument('--sequential', action='store_true', help='Consecutive frames of a take instead of random frames')
+    parser.add_argument('--cold', action='store_true', help='Drop the page cache of both files before each backend')
+    parser.add_argument('--hdf5_rdcc_nbytes', type=int, default=DEFAULT_RDCC_NBYTES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stores, files = {}, {}
+    raw_root = args.raw_dir or args.hdf5_path + RAW_FRAMES_SUFFIX
+    if os.path.isdir(raw_root):
+        stores['raw'] = RawFrameStore(raw_root, hdf5_path=args.hdf5_path)
+        files['raw'] = [os.path.join(raw_root, header['file']) for header in stores['raw'].headers.values()]
+    jpeg_root = args.jpeg_dir or args.hdf5_path + JPEG_FRAMES_SUFFIX
+    if os.path.isdir(jpeg_root):
+        try:
+            stores['jpeg'] = JpegFrameStore(jpeg_root, hdf5_path=args.hdf5_path)
+            files['jpeg'] = [os.path.join(jpeg_root, header['file']) for header in stores['jpeg'].headers.values()]
+        except ImportError as e:
+            print(f'Skipping the JPEG export: {e}')
+    video_root = args.video_dir or args.hdf5_path + VIDEO_FRAMES_SUFFIX
+    if os.path.isdir(video_root) and av is not None:
+        stores['video'] = VideoFrameStore(video_root, hdf5_path=args.hdf5_path)
+        files['video'] = [os.path.join(video_root, camera['file']) for header in stores['video'].headers.values()
+                          for camera in header['cameras'].values()]
+    stores = {backend: store for backend, store in stores.items() if len(store)}
+    if not stores:
+        raise SystemExit(f'No up-to-date export of {args.hdf5_path}, run data/utils/export_raw_frames.py, '
+                         f'data/utils/export_jpeg_frames.py or data/utils/export_video_frames.py')
+    # reads of the takes every export has
+    takes = set.intersection(*(set(store.headers) for store in stores.values()))
+    first = next(iter(stores.values()))
+    reads = make_reads({take: first.headers[take] for take in takes}, args.num_reads, args.num_cameras,
+                       args.sequential, args.seed)
+
+    print(f'{len(reads)} reads of {len(takes)} takes, {"sequential" if args.sequential else "random"} frames'
+          f'{" (cold page cache)" if args.cold else ""}')
+    print(f'{"backend":<8}{"ms/read":>10}{"MB/s":>10}{"disk GB":>10}{"disk KB/read":>14}')
+    for backend in ['hdf5'] + list(stores):
+        if args.cold:
+            for path in [args.hdf5_path] + sum(files.values(), []):
+                drop_page_cache(path)
+        if backend == 'hdf5':
+            with h5py.File(args.hdf5_path, 'r', rdcc_nbytes=args.hdf5_rdcc_nbytes) as f:
+                seconds, nbytes = run(lambda take: f[f'{take}/frames/rgb'], reads)
+            footprint, disk_bytes = os.path.getsize(args.hdf5_path), None
+        else:
+            seconds, nbytes = run(stores[backend].frames, reads)
+            footprint = sum(os.path.getsize(path) for path in files[backend])
+            # raw reads are the views themselves, JPEG and video reads the compressed bytes
+            disk_bytes = nbytes if backend == 'raw' else stores[backend].compressed_bytes
+        per_read = f'{disk_bytes / len(reads) / 1024:>14.1f}' if disk_bytes is not None else f'{"-":>14}'
+        print(f'{backend:<8}{seconds * 1000 / len(reads):>10.3f}{nbytes / seconds / 2 ** 20:>10.1f}'
+              f'{footprint / 1024 ** 3:>10.3f}{per_read}')
+
+    with h5py.File(args.hdf5_path, 'r') as f:
+        for backend, store in stores.items():
+            print(f'{backend} round trip, mean abs error vs HDF5 (downscaled to the view size): '
+                  f'{check_views(f, store.frames, reads):.2f}')
+    if 'raw' in stores:
+        store = stores['raw']
+        view = read_cameras(store.frames(reads[0][0]), reads[0][1], reads[0][2][:1])[0]
+        print(f'raw views share the mapped pages (zero-copy): {np.shares_memory(view, store.frames(reads[0][0]))}')
+    if 'jpeg' in stores:
+        print(f'jpeg decodes: {stores["jpeg"].stats()}')
+    if 'video' in stores:
+        print(f'video GOP cache: {stores["video"].stats()}')
+
+
+if __name__ == '__main__':
+    main()
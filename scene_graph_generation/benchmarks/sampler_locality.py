@@ -0,0 +1,89 @@
+"""
+Bytes read per sample for the random sampler and for BlockShuffleSampler.
+
+Replays the sample order of each sampler against a simulated per-worker HDF5 chunk
+cache (LRU, `--cache_bytes`, like the rdcc of the per-worker handle). Every sample reads
+the chunk that holds its frame; a chunk covers `--frames_per_chunk` frames of a take.
+Batches are dealt to the DataLoader workers round-robin, as torch does.
+
+Run from scene_graph_generation/, on a sample manifest/JSON or on synthetic takes:
+    python -m benchmarks.sampler_locality --data_path data/llava_samples/train.samples
+    python -m benchmarks.sampler_locality --num_takes 60 --frames_per_take 3000
+"""
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from LLaVA.llava.train.llava_trainer import get_block_shuffled_indices
+from scene_graph_prediction.scene_graph_helpers.dataset.sample_manifest import load_samples
+
+
+def simulate(order, takes, frames, frames_per_chunk, chunk_bytes, cache_bytes, batch_size, num_workers):
+    """Bytes read per sample when `order` is served by `num_workers` workers with a chunk LRU each."""
+    capacity = max(cache_bytes // chunk_bytes, 1)
+    caches = [OrderedDict() for _ in range(num_workers)]
+    bytes_read = 0
+    for position, index in enumerate(order):
+        cache = caches[(position // batch_size) % num_workers]
+        key = (int(takes[index]), int(frames[index]) // frames_per_chunk)
+        if key in cache:
+            cache.move_to_end(key)
+            continue
+        bytes_read += chunk_bytes
+        cache[key] = True
+        if len(cache) > capacity:
+            cache.popitem(last=False)
+    return bytes_read / max(len(order), 1)
+
+
+def synthetic_locations(num_takes, frames_per_take, permutations, subsample, seed=0):
+    rng = np.random.default_rng(seed)
+    takes, frames = [], []
+    for take in range(num_takes):
+        take_frames = np.flatnonzero(rng.random(frames_per_take) < subsample)
+        takes.append(np.repeat(take, len(take_frames) * permutations))
+        frames.append(np.repeat(take_frames, permutations))
+    return np.concatenate(takes), np.concatenate(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--data_path', type=str, default=None, help='Sample manifest or JSON (synthetic takes if not set)')
+    parser.add_argument('--num_takes', type=int, default=60)
+    parser.add_argument('--frames_per_take', type=int, default=3000)
+    parser.add_argument('--permutations', type=int, default=4, help='Samples per frame (synthetic)')
+    parser.add_argument('--subsample', type=float, default=0.5, help='Fraction of frames with samples (synthetic)')
+    parser.add_argument('--frames_per_chunk', type=int, default=8)
+    parser.add_argument('--chunk_bytes', type=int, default=8 * 1024 * 1024, help='Stored size of one chunk')
+    parser.add_argument('--cache_bytes', type=int, default=64 * 1024 * 1024, help='Chunk cache per worker')
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--block_sizes', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    if args.data_path is not None:
+        manifest = load_samples(args.data_path)
+        takes, frames = manifest.index['take'], manifest.index['frame_idx']
+    else:
+        takes, frames = synthetic_locations(args.num_takes, args.frames_per_take, args.permutations, args.subsample)
+    print(f'{len(takes)} samples, {len(np.unique(takes))} takes')
+
+    def report(name, order):
+        per_sample = simulate(order, takes, frames, args.frames_per_chunk, args.chunk_bytes, args.cache_bytes,
+                              args.batch_size, args.num_workers)
+        print(f'{name:<32} {per_sample / 2 ** 20:10.2f} MB read per sample')
+
+    generator = torch.Generator().manual_seed(0)
+    report('random (RandomSampler)', torch.randperm(len(takes), generator=generator).tolist())
+    for block_size in args.block_sizes:
+        for window in args.windows:
+            order = get_block_shuffled_indices(takes, frames, block_size, window, generator=generator)
+            report(f'block {block_size:>4} window {window:>3}', order)
+    report('take/frame order (no shuffle)', get_block_shuffled_indices(takes, frames, 1, shuffle=False))
+
+
+if __name__ == '__main__':
+    main()
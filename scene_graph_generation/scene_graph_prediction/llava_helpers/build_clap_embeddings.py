@@ -0,0 +1,70 @@
+"""
+Precompute the frozen CLAP audio features of every take and store them as
+`audio/clap_embedding` ([num_frames, 512], float16) next to `audio/snippets`.
+
+The training dataset and ModelWrapper read this dataset when it exists and only load CLAP
+for takes without it. Run from scene_graph_generation/:
+    python -m scene_graph_prediction.llava_helpers.build_clap_embeddings --hdf5_path ...
+"""
+import argparse
+
+import h5py
+import torch
+from tqdm import tqdm
+
+from scene_graph_prediction.scene_graph_helpers.dataset.audio_embedding import (
+    CLAP_EMBEDDING_DIM, CLAP_EMBEDDING_KEY, CLAP_MODEL_NAME, embed_snippets
+)
+from scene_graph_prediction.scene_graph_helpers.dataset.take_index import TakeIndex
+from scene_graph_prediction.scene_graph_helpers.model.input_transformation import AudioProcessor, AudioTransform
+
+
+def build_clap_embeddings(hdf5_path, batch_size=64, overwrite=False, device='cpu', take_index_path=None):
+    take_index = TakeIndex.load(hdf5_path, sidecar_path=take_index_path)
+    audio_normalize = AudioTransform()
+    audio_processor = AudioProcessor(model_name=CLAP_MODEL_NAME, d_model=1024, clap_hidden_size=CLAP_EMBEDDING_DIM)
+    audio_processor.clap_model.to(device)
+
+    written = 0
+    with h5py.File(hdf5_path, 'a') as f:
+        for path, take in tqdm(sorted(take_index.takes.items()), desc='Takes'):
+            if not take.has('audio/snippets'):
+                continue
+            if take.has(CLAP_EMBEDDING_KEY):
+                if not overwrite:
+                    continue
+                del f[f'{path}/{CLAP_EMBEDDING_KEY}']
+
+            snippets_ds = f[f'{path}/audio/snippets']
+            num_frames = snippets_ds.shape[0]
+            embedding_ds = f[path].create_dataset(
+                CLAP_EMBEDDING_KEY, shape=(num_frames, CLAP_EMBEDDING_DIM), dtype='float16',
+                chunks=(min(max(num_frames, 1), 256), CLAP_EMBEDDING_DIM),
+            )
+            for start in range(0, num_frames, batch_size):
+                stop = min(start + batch_size, num_frames)
+                snippets = snippets_ds[start:stop]
+                with torch.no_grad():
+                    embedding_ds[start:stop] = embed_snippets(
+                        snippets, audio_normalize, lambda audio: audio_processor(audio.to(device)))
+            written += 1
+
+    # the new datasets change the file, refresh the take index sidecar right away
+    TakeIndex.load(hdf5_path, sidecar_path=take_index_path, rebuild=True)
+    print(f'Wrote {CLAP_EMBEDDING_KEY} for {written} takes of {hdf5_path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--hdf5_path', type=str, required=True, help='Path to EgoExOR HDF5 file (modified in place)')
+    parser.add_argument('--batch_size', type=int, default=64, help='Frames embedded per CLAP forward pass')
+    parser.add_argument('--overwrite', action='store_true', help='Recompute takes that already have embeddings')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to run CLAP on')
+    parser.add_argument('--take_index_path', type=str, default=None, help='Optional take index sidecar')
+    args = parser.parse_args()
+
+    build_clap_embeddings(args.hdf5_path, args.batch_size, args.overwrite, args.device, args.take_index_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Fill the on-disk frame cache (scene_graph_helpers/dataset/frame_cache.py) ahead of training
+or evaluation, so the first epoch does not pay for decoding and CLIP preprocessing.
+
+Run from scene_graph_generation/:
+    python -m scene_graph_prediction.llava_helpers.build_frame_cache --hdf5_path ... --cache_dir ... --split train --mode train
+"""
+import argparse
+from collections import defaultdict
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+from transformers import CLIPImageProcessor
+
+from scene_graph_prediction.llava_helpers.generate_dataset_format_for_llava import read_split_indices
+from scene_graph_prediction.scene_graph_helpers.dataset.dataset_utils import EGO_SOURCES
+from scene_graph_prediction.scene_graph_helpers.dataset.frame_cache import FrameCache, STORAGE_DTYPES
+from scene_graph_prediction.scene_graph_helpers.dataset.hdf5_utils import read_cameras
+from scene_graph_prediction.scene_graph_helpers.dataset.raw_frames import open_frames
+from scene_graph_prediction.scene_graph_helpers.dataset.take_index import TakeIndex, take_path
+from scene_graph_prediction.scene_graph_helpers.model.input_transformation import FrameTransform
+
+
+def view_flip(camera_name, mode):
+    """Whether the loader of `mode` feeds this camera with flipped channels."""
+    if mode == 'eval':
+        # ModelWrapper flips every view
+        return True
+    # LazySupervisedDataset flips ego views and the screen recordings
+    return camera_name in EGO_SOURCES or camera_name in ("ultrasound", "simstation")
+
+
+def build_frame_cache(hdf5_path, cache_dir, split, mode, vision_tower, storage_dtype, take_index_path=None):
+    processor = CLIPImageProcessor.from_pretrained(vision_tower)
+    frame_cache = FrameCache(cache_dir, FrameTransform(processor), storage_dtype=storage_dtype, hdf5_path=hdf5_path)
+    take_index = TakeIndex.load(hdf5_path, sidecar_path=take_index_path)
+
+    with h5py.File(hdf5_path, 'r') as f:
+        frames_per_take = defaultdict(set)
+        for surgery_type, procedure_id, take_id, frame_id in read_split_indices(f, split):
+            frames_per_take[take_path(surgery_type, procedure_id, take_id)].add(int(frame_id))
+
+        skipped_blank = 0
+        for path, frame_ids in tqdm(sorted(frames_per_take.items()), desc='Takes'):
+            take = take_index[path]
+            if not take.has('frames/rgb'):
+                continue
+            # the backend the loaders read (an export if there is one), the cache is keyed by it
+            frame_ds = open_frames(f, path)
+            cams = list(range(take.num_cameras))
+            flips = [view_flip(take.camera_name(cam_idx), mode) for cam_idx in cams]
+            for frame_idx in sorted(frame_ids):
+                missing = [i for i in cams if not frame_cache.contains(take, frame_idx, cams[i], flips[i])]
+                if not missing:
+                    continue
+                for i, img_np in zip(missing, read_cameras(frame_ds, frame_idx, [cams[i] for i in missing])):
+                    # blank views are never cached, a filled slot means the view is non-blank
+                    if not img_np.any():
+                        skipped_blank += 1
+                        continue
+                    frame_cache.put(take, frame_idx, cams[i], flips[i], np.ascontiguousarray(img_np))
+
+    print(f'Frame cache {frame_cache.root}: {len(frames_per_take)} takes, {skipped_blank} blank views skipped')
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--hdf5_path', type=str, required=True, help='Path to EgoExOR HDF5 file')
+    parser.add_argument('--cache_dir', type=str, required=True, help='Root directory of the frame cache')
+    parser.add_argument('--split', type=str, default='train', help='Split whose frames are cached')
+    parser.add_argument('--mode', type=str, default='train', choices=['train', 'eval'],
+                        help='Loader the cache is built for (decides which views are channel-flipped)')
+    parser.add_argument('--vision_tower', type=str, default='openai/clip-vit-large-patch14-336',
+                        help='Name or path of the CLIP image processor')
+    parser.add_argument('--storage_dtype', type=str, default='bfloat16', choices=list(STORAGE_DTYPES))
+    parser.add_argument('--take_index_path', type=str, default=None, help='Optional take index sidecar')
+    args = parser.parse_args()
+
+    build_frame_cache(args.hdf5_path, args.cache_dir, args.split, args.mode, args.vision_tower,
+                      args.storage_dtype, args.take_index_path)
+
+
+if __name__ == '__main__':
+    main()
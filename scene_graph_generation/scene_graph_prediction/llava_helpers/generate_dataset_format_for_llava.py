@@ -23,6 +23,10 @@ from scene_graph_prediction.scene_graph_helpers.dataset.dataset_utils import (
     EGO_SOURCES, EXTERNAL_PATTERN, EXO_SOURCES, ROBOT_SOURCES,
     reversed_entity_synonyms, reversed_relation_synonyms
 )
+from scene_graph_prediction.scene_graph_helpers.dataset.take_index import TakeIndex
+from scene_graph_prediction.scene_graph_helpers.dataset.sample_manifest import SampleManifest, SAMPLE_MANIFEST_SUFFIX
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../"))
+from data.utils.annotation_index import TakeAnnotations
 
 warnings.filterwarnings('ignore')
 
@@ -58,6 +62,23 @@ def apply_template(scene_graph, timepoint, sample_id, hdf5_indices):
     }
     return sample
 
+def read_split_indices(f, split):
+    """
+    Read `splits/<split>` column by column as NumPy arrays.
+
+    Returns the same list of (surgery_type, procedure_id, take_id, frame_id) tuples as
+    decoding every row, but each distinct surgery type is decoded only once.
+    """
+    split_ds = f[f'splits/{split}']
+    surgery_types = split_ds.fields('surgery_type')[()]
+    procedure_ids = split_ds.fields('procedure_id')[()]
+    take_ids = split_ds.fields('take_id')[()]
+    frame_ids = split_ds.fields('frame_id')[()]
+
+    unique_types, type_codes = np.unique(surgery_types, return_inverse=True)
+    names = np.array([t.decode('utf-8') if isinstance(t, bytes) else str(t) for t in unique_types], dtype=object)
+    return list(zip(names[type_codes].tolist(), procedure_ids, take_ids, frame_ids))
+
 def generate_finetuning_samples_from_hdf5(
     hdf5_path,
     split,
@@ -75,18 +96,11 @@ def generate_finetuning_samples_from_hdf5(
         mod for mod, settings in config['modalities'].items() if settings.get('enabled', False)
     }
 
+    take_index = TakeIndex.load(hdf5_path)
+
     with h5py.File(hdf5_path, 'r') as f:
         # Load split indices
-        split_data = f[f'splits/{split}'][()]
-        indices = [
-            (
-                item['surgery_type'].decode('utf-8'),
-                item['procedure_id'],
-                item['take_id'],
-                item['frame_id'],
-            )
-            for item in split_data
-        ]
+        indices = read_split_indices(f, split)
         if split in ["validation", "test"]:
             num_samples = len(indices) // reduce_ratio   # integer division
             # (optional) for reproducibility
@@ -97,22 +111,16 @@ def generate_finetuning_samples_from_hdf5(
             indices = selected_indices
 
         missing_triplets = []
+        take_annotations = {}
 
         for surgery_type, procedure_id, take_id, frame_idx in tqdm(
             indices, desc='Generating samples'
         ):
             path = f"data/{surgery_type}/{procedure_id}/take/{take_id}"
+            take = take_index[path]
 
-            # Read sources via attributes
-            sources = []
-            sg_path = f"{path}/sources"
-            if sg_path in f:
-                sg = f[sg_path]
-                count = sg.attrs.get('source_count', 0)
-                for i in range(count):
-                    raw = sg.attrs.get(f"source_{i}")
-                    name = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else str(raw)
-                    sources.append(name)
+            # Source names come from the take index
+            sources = [name for name in take.camera_names if name is not None]
 
             # Determine source flags
             has_ego = any(src in EGO_SOURCES for src in sources)
@@ -125,39 +133,46 @@ def generate_finetuning_samples_from_hdf5(
 
             # Ego-based modalities
             if has_ego:
-                if 'ego_frames' in enabled_modalities and 'frames' in f[f'{path}']:
+                if 'ego_frames' in enabled_modalities and take.has('frames'):
                     # always include ego images later apply image dropout 
                     available_modalities.add('ego_frames')
                 for mod in ('eye_gaze', 'eye_gaze_depth', 'hand_tracking', 'audio'):
-                    if mod in enabled_modalities and mod in f[f'{path}']:
+                    if mod in enabled_modalities and take.has(mod):
                         if random.random() >= modality_dropout_prob:
                             available_modalities.add(mod)
 
             # Exo frames for OR light, microscope, simstation, or external
-            if has_exo and 'exo_frames' in enabled_modalities and 'frames' in f[f'{path}']:
+            if has_exo and 'exo_frames' in enabled_modalities and take.has('frames'):
                 # always include exo images later apply image dropout
                 available_modalities.add('exo_frames')
 
             # Ultrasoun screen recordings 
-            if has_robot and "ultrasound" in enabled_modalities and "frames" in f[f'{path}']:
+            if has_robot and "ultrasound" in enabled_modalities and take.has("frames"):
                 if random.random() >= modality_dropout_prob:
                     available_modalities.add('ultrasound')
 
             # Point cloud for external cameras
-            if has_external and 'point_cloud' in enabled_modalities and 'point_cloud' in f[f'{path}']:
+            if has_external and 'point_cloud' in enabled_modalities and take.has('point_cloud'):
                 if random.random() >= modality_dropout_prob:
                     available_modalities.add('point_cloud')
 
-            # Load annotations
+            # Load annotations, from the packed annotation index when the take has one
             annotation_path = f"{path}/annotations/frame_{frame_idx}/rel_annotations"
-            if annotation_path not in f:
+            if path not in take_annotations:
+                take_annotations[path] = TakeAnnotations.load(f[path], fallback=False)
+            if take_annotations[path] is not None:
+                rows = take_annotations[path].frame_strings(frame_idx)
+            elif annotation_path in f:
+                # Parse byte-string like b'head_surgeon holding scalpel'
+                rows = [[x.decode('utf-8') for x in triplet] for triplet in f[annotation_path]]
+            else:
+                rows = None
+            if rows is None:
                 missing_triplets.append(annotation_path)
                 continue
             
             triplets = []
-            for triplet in f[annotation_path]:
-                # Parse byte-string like b'head_surgeon holding scalpel'
-                parts = [x.decode('utf-8') for x in triplet]
+            for parts in rows:
                 if len(parts) >= 3:  # Ensure we have at least subject, predciate, object
                     # If there are more than 3 parts, assume the middle is the predicate
                     if len(parts) > 3:
@@ -174,7 +189,7 @@ def generate_finetuning_samples_from_hdf5(
                     triplets.append((sub, obj, pred))
 
                 else:
-                    print(f"Warning: Malformed triplet '{triplet}' in {annotation_path}") 
+                    print(f"Warning: Malformed triplet '{parts}' in {annotation_path}") 
 
             # Prepare sample metadata
             sample_prefix = f"{surgery_type}_{procedure_id}_{take_id}_{frame_idx}"
@@ -203,6 +218,7 @@ def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--hdf5_path', type=str, default=None, help='Path to EgoExOR HDF5 file')
     parser.add_argument('--dataset_name', type=str, default=None, help='Path to config file')
+    parser.add_argument('--write_json', action='store_true', help='Also write the samples as a (large) JSON file')
     args = parser.parse_args()
     pl.seed_everything(42, workers=True)
     config = config_loader(args.dataset_name)
@@ -255,8 +271,11 @@ def main():
 
     shuffle(samples)
 
-    with open(f'{output_dir}/{NAME}.json', 'w') as f:
-        json.dump(samples, f, indent=4)
+    # columnar manifest, pass its directory as --data_path
+    SampleManifest.from_samples(samples).save(f'{output_dir}/{NAME}{SAMPLE_MANIFEST_SUFFIX}')
+    if args.write_json:
+        with open(f'{output_dir}/{NAME}.json', 'w') as f:
+            json.dump(samples, f, indent=4)
 
     with open(f'{output_dir}/{config["output"]["token_freq_filename"].format(n_perm=N_PERM)}', 'w') as f:
         json.dump(token_freq, f, indent=4)
@@ -15,7 +15,7 @@ from types import SimpleNamespace
 import json_tricks as json  # Allows to load integers etc. correctly
 import pytorch_lightning as pl
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, SequentialSampler
 
 # Adjust path relative to the current working directory
 project_root = os.path.abspath(os.path.join(os.getcwd(), "../../"))
@@ -23,7 +23,9 @@ sys.path.append(project_root)
 sys.path.append("../scene_graph_generation/LLaVA")
 
 from scene_graph_prediction.scene_graph_helpers.dataset.or_dataset import ORDataset, DataCollatorForORDataset
+from scene_graph_prediction.scene_graph_helpers.dataset.read_ahead import DEFAULT_READ_AHEAD_BYTES, ReadAhead
 from scene_graph_prediction.scene_graph_helpers.model.scene_graph_prediction_model import ModelWrapper
+from LLaVA.llava.train.llava_trainer import BlockShuffleSampler
 from scene_graph_generation.helpers.config_utils import ConfigManager
 from scene_graph_prediction.utils.util import read_classes, read_relationships
 
@@ -74,6 +76,31 @@ def update_checkpoint_data(file_path, model_name, checkpoint_id, wandb_run_id=No
         json.dump(data, file)
 
 
+def eval_read_ahead(dataset, config):
+    """ReadAhead of the ModelWrapper reads of `dataset` if the config enables it (read_ahead_samples > 0)."""
+    depth = getattr(config, "read_ahead_samples", 0)
+    if not depth:
+        return None
+    return ReadAhead(dataset.read_plan, len(dataset), depth=depth,
+                     num_threads=getattr(config, "read_ahead_threads", 2),
+                     max_bytes=getattr(config, "read_ahead_bytes", DEFAULT_READ_AHEAD_BYTES))
+
+
+def eval_sampler(dataset, config, read_ahead=None):
+    """
+    Read the eval samples ordered by take and frame (better HDF5 cache reuse) if the config asks for it.
+    With a read-ahead, the order of each pass is published to it.
+    """
+    sampler = None
+    if getattr(config, "eval_locality_order", False):
+        takes, frames = dataset.sample_locations
+        sampler = BlockShuffleSampler(takes, frames, block_size=1, shuffle=False)
+    if read_ahead is not None:
+        sampler = read_ahead.sampler(sampler if sampler is not None else SequentialSampler(dataset),
+                                     batch_size=config.batch_size)
+    return sampler
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--config', type=str, default='example.json', help='configuration file name. Relative path under given path')
@@ -133,10 +160,12 @@ def main():
             data_args=config,
             split="test"
         )
+        read_ahead = eval_read_ahead(eval_dataset, config)
         eval_loader = DataLoader(
             eval_dataset,
             batch_size=config.batch_size,
             shuffle=False,
+            sampler=eval_sampler(eval_dataset, config, read_ahead),
             num_workers=4,
             pin_memory=True,
             collate_fn=DataCollatorForORDataset(config)
@@ -150,8 +179,17 @@ def main():
                     temporality=config.temporality,
                     mv_type = "learned",
                     device = device,
-                    device_map = device_map
+                    device_map = device_map,
+                    hdf5_rdcc_nbytes = getattr(config, "hdf5_rdcc_nbytes", None),
+                    frame_cache_dir = getattr(config, "frame_cache_dir", None),
+                    frame_cache_dtype = getattr(config, "frame_cache_dtype", "bfloat16"),
+                    modality_plan = eval_dataset.modality_plan,
+                    take_cache_bytes = getattr(config, "take_cache_bytes", 0),
+                    take_index_path = getattr(config, "take_index_path", None)
                 )
+        eval_dataset.frame_cache = model.frame_cache
+        eval_dataset.take_cache = model.take_cache
+        model.read_ahead = read_ahead
         model.validate(eval_loader, limit_val_batches=None)
 
     elif mode == "eval_all":
@@ -170,6 +208,7 @@ def main():
             data_args=config,
             split="test"
         )
+        read_ahead = eval_read_ahead(eval_dataset, config)
 
         # always eval last checkpoint
         checkpoints = sorted(list(model_path.glob('checkpoint-*')), key=lambda x: int(str(x).split('-')[-1]))
@@ -198,6 +237,7 @@ def main():
                 eval_dataset,
                 batch_size=config.batch_size,
                 shuffle=False,
+                sampler=eval_sampler(eval_dataset, config, read_ahead),
                 num_workers=4,
                 pin_memory=True,
                 collate_fn=DataCollatorForORDataset(config)
@@ -210,8 +250,17 @@ def main():
                     temporality=config.temporality,
                     mv_type = "learned",
                     device = device,
-                    device_map = device_map
+                    device_map = device_map,
+                    hdf5_rdcc_nbytes = getattr(config, "hdf5_rdcc_nbytes", None),
+                    frame_cache_dir = getattr(config, "frame_cache_dir", None),
+                    frame_cache_dtype = getattr(config, "frame_cache_dtype", "bfloat16"),
+                    modality_plan = eval_dataset.modality_plan,
+                    take_cache_bytes = getattr(config, "take_cache_bytes", 0),
+                    take_index_path = getattr(config, "take_index_path", None)
                 )
+            eval_dataset.frame_cache = model.frame_cache
+            eval_dataset.take_cache = model.take_cache
+            model.read_ahead = read_ahead
             
             model.validate(eval_loader, logging_information={'split': 'val', "logger": logger, 
                                                              "checkpoint_id": checkpoint_id})
@@ -232,10 +281,12 @@ def main():
             data_args=config,
             split=infer_split
         )
+        read_ahead = eval_read_ahead(eval_dataset, config)
         eval_loader = DataLoader(
             eval_dataset,
             batch_size=config.batch_size,
             shuffle=False,
+            sampler=eval_sampler(eval_dataset, config, read_ahead),
             num_workers=4,
             pin_memory=True,
             collate_fn=DataCollatorForORDataset(config)
@@ -249,8 +300,17 @@ def main():
                     temporality=config.temporality,
                     mv_type = "learned",
                     device = device,
-                    device_map = device_map
+                    device_map = device_map,
+                    hdf5_rdcc_nbytes = getattr(config, "hdf5_rdcc_nbytes", None),
+                    frame_cache_dir = getattr(config, "frame_cache_dir", None),
+                    frame_cache_dtype = getattr(config, "frame_cache_dtype", "bfloat16"),
+                    modality_plan = eval_dataset.modality_plan,
+                    take_cache_bytes = getattr(config, "take_cache_bytes", 0),
+                    take_index_path = getattr(config, "take_index_path", None)
                 )
+        eval_dataset.frame_cache = model.frame_cache
+        eval_dataset.take_cache = model.take_cache
+        model.read_ahead = read_ahead
         results = model.infer(eval_loader)
         # results should be batch scan id -> list of relations
         output_name = f'scan_relations_{name}_{infer_split}.json'
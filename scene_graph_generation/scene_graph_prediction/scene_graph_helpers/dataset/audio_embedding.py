@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+# Frozen CLAP audio features of every frame, written offline by llava_helpers/build_clap_embeddings.py
+CLAP_EMBEDDING_KEY = 'audio/clap_embedding'
+CLAP_MODEL_NAME = 'laion/larger_clap_general'
+CLAP_EMBEDDING_DIM = 512
+
+
+class LazyAudioProcessor:
+    """
+    Builds the CLAP AudioProcessor on first use.
+
+    Loaders only need CLAP for takes without a stored `audio/clap_embedding`, so a file with
+    precomputed embeddings never loads the model (neither in the main process nor in the
+    DataLoader workers). `factory` must be picklable (e.g. a class or functools.partial).
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self._processor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_processor'] = None
+        return state
+
+    @property
+    def loaded(self) -> bool:
+        return self._processor is not None
+
+    def __call__(self, audio: torch.Tensor) -> torch.Tensor:
+        if self._processor is None:
+            self._processor = self.factory()
+        return self._processor(audio)
+
+
+def has_audio(take) -> bool:
+    return take.has(CLAP_EMBEDDING_KEY) or take.has('audio/snippets')
+
+
+def load_audio_features(reads, take, audio_normalize, audio_processor) -> torch.Tensor:
+    """
+    CLAP features [1, 512] of the frame of `reads` (a FrameReads): read from the stored
+    embedding when the take has one, otherwise computed from the raw snippet exactly as before.
+    """
+    if take.has(CLAP_EMBEDDING_KEY):
+        embedding = np.asarray(reads.row(CLAP_EMBEDDING_KEY), dtype=np.float32)
+        return torch.from_numpy(embedding).unsqueeze(0)
+
+    raw_a = torch.from_numpy(reads.row('audio/snippets')).float()
+    raw_a = audio_normalize(raw_a).to(dtype=torch.bfloat16)
+    return audio_processor(raw_a.unsqueeze(0))  # Add batch dim
+
+
+def embed_snippets(snippets: np.ndarray, audio_normalize, audio_processor) -> np.ndarray:
+    """CLAP features [N, 512] (float16) of a block of raw snippets [N, samples, channels]."""
+    # AudioTransform normalizes a single snippet, so apply it per frame before batching
+    batch = torch.stack([audio_normalize(torch.from_numpy(s).float()).to(dtype=torch.bfloat16) for s in snippets])
+    features = audio_processor(batch)
+    return features.float().cpu().numpy().astype(np.float16)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from .dataset_utils import GAZE_FIXATION
+
+# Alignment of the per-ego-camera modalities of a frame (eye gaze, gaze depth, hand
+# tracking) to its ego views. Each returns the rows to gather, so loaders index the
+# modality once instead of matching camera ids row by row.
+
+
+def apply_gaze_fixation(raw: np.ndarray, take) -> np.ndarray:
+    """Add the gaze-fixation offset in place to the [source_id, x, y] rows of the roles that need it in `take`."""
+    rows = np.isin(raw[:, 0].astype(np.int64), take.fixation_source_ids)
+    raw[rows, 1] += GAZE_FIXATION["x"]
+    raw[rows, 2] += GAZE_FIXATION["y"]
+    return raw
+
+
+def gaze_rows(camera_ids: np.ndarray, source_ids: np.ndarray) -> np.ndarray:
+    """
+    Row of the first gaze entry of every id of `source_ids` that has one, in the order of
+    `source_ids` (ids without a gaze entry are skipped).
+    """
+    match = np.asarray(camera_ids, dtype=np.int64)[None, :] == np.asarray(source_ids, dtype=np.int64)[:, None]
+    if match.size == 0:
+        return np.zeros((0,), dtype=np.int64)
+    return match.argmax(axis=1)[match.any(axis=1)]
+
+
+def ego_rows(cams, num_rows: int) -> np.ndarray:
+    """
+    Rows of the ego cameras `cams` in a [num_ego_cameras, ...] modality (gaze depth, hand
+    tracking), whose first row belongs to the lowest camera; rows past `num_rows` are dropped.
+    """
+    cams = np.asarray(cams, dtype=np.int64)
+    if cams.size == 0:
+        return cams
+    rows = cams - cams.min()
+    return rows[rows < num_rows]
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .raw_frames import frame_source
+
+FRAME_CACHE_VERSION = 2
+STORAGE_DTYPES = ('bfloat16', 'uint8')
+
+
+def processor_config_hash(image_processor, pad_to_square: bool = True, storage_dtype: str = 'bfloat16') -> str:
+    """
+    Hash of everything that changes a preprocessed frame: the image-processor config,
+    square padding and the storage format. A new hash means a new (empty) cache.
+    """
+    if hasattr(image_processor, 'to_dict'):
+        processor_config = image_processor.to_dict()
+    else:
+        processor_config = dict(vars(image_processor))
+    payload = {
+        'version': FRAME_CACHE_VERSION,
+        'processor': processor_config,
+        'pad_to_square': bool(pad_to_square),
+        'storage_dtype': storage_dtype,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def _take_key(take_path: str) -> str:
+    # data/<surgery_type>/<procedure_id>/take/<take_id> -> <surgery_type>_<procedure_id>_<take_id>
+    parts = take_path.strip('/').split('/')
+    return f"{parts[1]}_{parts[2]}_{parts[4]}" if len(parts) == 5 else take_path.strip('/').replace('/', '_')
+
+
+def _open_or_create(path: str, shape, dtype) -> np.memmap:
+    """Open a .npy memmap, creating it (sparse, zero-filled) if needed. Concurrent creators agree on one file."""
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape).flush()
+        try:
+            # link() fails if another worker created the file first, never replace a file in use
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    return np.load(path, mmap_mode='r+')
+
+
+class _TakeStore:
+    """Memory-mapped preprocessed views of one take: data [F, C, 3, H, W] and a filled flag [F, C]."""
+    def __init__(self, root: str, take_key: str, num_frames: int, num_cameras: int, view_shape, dtype):
+        self.data = _open_or_create(os.path.join(root, f"{take_key}.npy"),
+                                    (num_frames, num_cameras) + tuple(view_shape), dtype)
+        self.filled = _open_or_create(os.path.join(root, f"{take_key}.filled.npy"),
+                                      (num_frames, num_cameras), np.uint8)
+
+
+class FrameCache:
+    """
+    Opt-in on-disk cache of preprocessed (pad-to-square + CLIP preprocess) camera views.
+
+    Views are keyed by (surgery_type, procedure_id, take_id, frame, camera) and stored in
+    one memory-mapped .npy file per take under `<cache_dir>/<config hash>/`, either as
+    bf16 (kept as int16 bits) or as the uint8 image before rescale/normalize, which halves
+    the size and is normalized on read. Views that were fed with flipped channels are kept
+    in a separate store, so the train and eval colour handling never mix. With `hdf5_path`,
+    the file of a take is also keyed by its frame source (raw_frames.frame_source: backend,
+    HDF5 signature, export header), so views of a regenerated file or of another export
+    (e.g. reduced-scale JPEG, lossy video) are never reused.
+
+    The cache is filled lazily by the loaders (or offline with
+    llava_helpers/build_frame_cache.py). `put` only stores views with non-zero pixels, so a
+    filled slot also answers the blank-view check without reading the frame; blank views are
+    read again every time.
+    """
+    def __init__(self, cache_dir, frame_transform, storage_dtype: str = 'bfloat16', read_only: bool = False,
+                 hdf5_path=None):
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"storage_dtype must be one of {STORAGE_DTYPES}, got {storage_dtype}")
+        if getattr(frame_transform, 'augment', None) is not None:
+            raise ValueError("FrameCache cannot be used with a randomly augmenting FrameTransform")
+
+        self.frame_transform = frame_transform
+        self.processor = frame_transform.processor
+        self.pad_to_square = frame_transform.pad_to_square
+        self.storage_dtype = storage_dtype
+        self.read_only = read_only
+        self.config_hash = processor_config_hash(self.processor, self.pad_to_square, storage_dtype)
+        self.root = os.path.join(os.fspath(cache_dir), self.config_hash)
+
+        crop_size = self.processor.crop_size
+        self.view_shape = (3, crop_size['height'], crop_size['width'])
+        self.hdf5_path = os.fspath(hdf5_path) if hdf5_path is not None else None
+        self._stores: Dict[tuple, _TakeStore] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if not read_only:
+            os.makedirs(self.root, exist_ok=True)
+            config_path = os.path.join(self.root, 'config.json')
+            if not os.path.exists(config_path):
+                with open(config_path, 'w') as f:
+                    json.dump({'version': FRAME_CACHE_VERSION, 'storage_dtype': storage_dtype,
+                               'pad_to_square': self.pad_to_square, 'view_shape': self.view_shape}, f)
+
+    def __getstate__(self):
+        # memmaps are reopened lazily by each DataLoader worker
+        state = self.__dict__.copy()
+        state['_stores'] = {}
+        return state
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+    # ----------------------------------------------------------------- storage
+    def _store(self, take, flip: bool) -> Optional[_TakeStore]:
+        key = (take.path, flip)
+        store = self._stores.get(key)
+        if store is None:
+            take_key = _take_key(take.path)
+            if self.hdf5_path is not None:
+                source = json.dumps(frame_source(self.hdf5_path, take.path), sort_keys=True, default=str)
+                take_key += '.' + hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+            take_key += '.bgr' if flip else ''
+            if self.read_only and not os.path.exists(os.path.join(self.root, f"{take_key}.npy")):
+                return None
+            dtype = np.int16 if self.storage_dtype == 'bfloat16' else np.uint8
+            store = _TakeStore(self.root, take_key, take.num_frames, take.num_cameras, self.view_shape, dtype)
+            self._stores[key] = store
+        return store
+
+    def contains(self, take, frame_idx: int, cam_idx: int, flip: bool) -> bool:
+        store = self._store(take, flip)
+        return store is not None and bool(store.filled[frame_idx, cam_idx])
+
+    def _decode(self, stored: np.ndarray) -> torch.Tensor:
+        if self.storage_dtype == 'bfloat16':
+            return torch.from_numpy(np.array(stored)).view(torch.bfloat16)
+        pixel_values = torch.from_numpy(np.array(stored)).float() * self.processor.rescale_factor
+        mean = torch.tensor(self.processor.image_mean).view(-1, 1, 1)
+        std = torch.tensor(self.processor.image_std).view(-1, 1, 1)
+        return ((pixel_values - mean) / std).to(dtype=torch.bfloat16)
+
+    def _preprocess(self, img_np: np.ndarray, flip: bool):
+        """Return (tensor handed to the model, array to store)."""
+        img_pil = Image.fromarray(img_np[..., ::-1] if flip else img_np).convert('RGB')
+        if self.storage_dtype == 'bfloat16':
+            proc = self.frame_transform(img_pil)
+            return proc, proc.contiguous().view(torch.int16).numpy()
+
+        # uint8: keep the resized/cropped image, rescale and normalize are applied on read
+        if self.pad_to_square:
+            background_color = tuple(int(x * 255) for x in self.processor.image_mean)
+            img_pil = self.frame_transform.expand2square(img_pil, background_color)
+        pixels = self.processor.preprocess(img_pil, do_rescale=False, do_normalize=False,
+                                           return_tensors='np')['pixel_values'][0]
+        stored = np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+        return self._decode(stored), stored
+
+    def get(self, take, frame_idx: int, cam_idx: int, flip: bool) -> Optional[torch.Tensor]:
+        store = self._store(take, flip)
+        if store is None or not store.filled[frame_idx, cam_idx]:
+            return None
+        return self._decode(store.data[frame_idx, cam_idx])
+
+    def put(self, take, frame_idx: int, cam_idx: int, flip: bool, img_np: np.ndarray) -> torch.Tensor:
+        """Preprocess a uint8 view, store it (unless read-only or blank) and return the tensor."""
+        proc, stored = self._preprocess(img_np, flip)
+        # a filled slot stands for a non-blank view (contains() replaces the pixel check)
+        store = None if self.read_only or not img_np.any() else self._store(take, flip)
+        if store is not None:
+            store.data[frame_idx, cam_idx] = stored
+            # the flag is set only after the data is written
+            store.filled[frame_idx, cam_idx] = 1
+        return proc
+
+
+def load_views(frame_transform, frame_cache: Optional[FrameCache], take, frame_idx: int,
+               cams: Sequence[int], flips: Sequence[bool],
+               read_fn: Callable[[List[int]], Sequence[np.ndarray]]) -> List[torch.Tensor]:
+    """
+    Preprocessed tensors of the views `cams` of one frame, in order.
+
+    Without a cache every view is read with `read_fn(cams)` (uint8 [H, W, 3] each) and passed
+    through `frame_transform`, with its channels flipped where `flips` says so. With a cache,
+    only the views that miss are read, preprocessed and stored.
+    """
+    cams = [int(c) for c in cams]
+    if frame_cache is None:
+        arrays = read_fn(cams) if cams else []
+        return [frame_transform(Image.fromarray(img_np[..., ::-1] if flip else img_np).convert('RGB'))
+                for img_np, flip in zip(arrays, flips)]
+
+    views: List[Optional[torch.Tensor]] = []
+    missing = []
+    for i, (cam_idx, flip) in enumerate(zip(cams, flips)):
+        cached = frame_cache.get(take, frame_idx, cam_idx, flip)
+        views.append(cached)
+        if cached is None:
+            missing.append(i)
+    frame_cache.hits += len(cams) - len(missing)
+    frame_cache.misses += len(missing)
+
+    if missing:
+        arrays = read_fn([cams[i] for i in missing])
+        for i, img_np in zip(missing, arrays):
+            views[i] = frame_cache.put(take, frame_idx, cams[i], flips[i], img_np)
+    return views
@@ -0,0 +1,180 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import h5py
+import numpy as np
+
+try:
+    # registers the blosc/lz4 filters used by files rewritten with data/utils/rechunk_h5.py
+    import hdf5plugin  # noqa: F401
+except ImportError:
+    hdf5plugin = None
+
+# Raw-chunk cache defaults. h5py's own default (1 MiB, 521 slots) is smaller than a
+# single compressed RGB chunk of the merged file, so every read would decompress again.
+DEFAULT_RDCC_NBYTES = 64 * 1024 ** 2
+DEFAULT_RDCC_NSLOTS = 10007
+DEFAULT_RDCC_W0 = 0.75
+
+
+class H5HandlePool:
+    """
+    Process-local pool of read-only h5py handles.
+
+    A handle is opened lazily on first use and kept open for the lifetime of the
+    process, so the HDF5 metadata cache and the raw-chunk cache survive across samples.
+    The pool remembers the pid that opened its handles: after a DataLoader worker is
+    forked, the inherited handles are discarded and each worker opens its own.
+    """
+    def __init__(self, rdcc_nbytes: int = DEFAULT_RDCC_NBYTES,
+                 rdcc_nslots: int = DEFAULT_RDCC_NSLOTS,
+                 rdcc_w0: float = DEFAULT_RDCC_W0):
+        self.rdcc_nbytes = int(rdcc_nbytes)
+        self.rdcc_nslots = int(rdcc_nslots)
+        self.rdcc_w0 = float(rdcc_w0)
+        self._pid = os.getpid()
+        self._handles = {}
+
+    def get(self, path) -> h5py.File:
+        """Return the open handle of this process for `path`, opening it if needed."""
+        pid = os.getpid()
+        if pid != self._pid:
+            # Handles were opened by the parent before the fork, never reuse them.
+            self._handles = {}
+            self._pid = pid
+
+        key = os.path.abspath(os.fspath(path))
+        handle = self._handles.get(key)
+        if handle is None or not handle.id.valid:
+            handle = self._open(key)
+            # A virtual merge (merge_h5 --virtual) links its takes into the source files.
+            # HDF5 would reopen a linked file on every access, keeping it open here lets
+            # the links resolve to the already open file.
+            for source in handle.attrs.get('virtual_sources', []):
+                if isinstance(source, bytes):
+                    source = source.decode('utf-8')
+                source_key = os.path.normpath(os.path.join(os.path.dirname(key), source))
+                if source_key not in self._handles and os.path.exists(source_key):
+                    self._handles[source_key] = self._open(source_key)
+            self._handles[key] = handle
+        return handle
+
+    def _open(self, key) -> h5py.File:
+        return h5py.File(key, 'r',
+                         rdcc_nbytes=self.rdcc_nbytes,
+                         rdcc_nslots=self.rdcc_nslots,
+                         rdcc_w0=self.rdcc_w0)
+
+    @contextmanager
+    def file(self, path):
+        """Drop-in replacement for `with h5py.File(path, 'r') as f:` that does not close the handle."""
+        yield self.get(path)
+
+    def close(self):
+        if self._pid == os.getpid():
+            for handle in self._handles.values():
+                if handle.id.valid:
+                    handle.close()
+        self._handles = {}
+
+    def __getstate__(self):
+        # Handles cannot be pickled; spawned workers reopen lazily.
+        state = self.__dict__.copy()
+        state['_handles'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pid = os.getpid()
+
+
+_shared_pool = None
+
+
+def get_h5_pool(rdcc_nbytes: int = None) -> H5HandlePool:
+    """
+    Return the pool shared by every loader of this process (datasets and ModelWrapper).
+
+    Passing `rdcc_nbytes` reconfigures the shared pool; already open handles are
+    closed and reopened with the new chunk-cache size on next use.
+    """
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = H5HandlePool(rdcc_nbytes=rdcc_nbytes or DEFAULT_RDCC_NBYTES)
+    elif rdcc_nbytes is not None and int(rdcc_nbytes) != _shared_pool.rdcc_nbytes:
+        _shared_pool.close()
+        _shared_pool.rdcc_nbytes = int(rdcc_nbytes)
+    return _shared_pool
+
+
+def read_cameras(frame_ds: h5py.Dataset, frame_idx: int, cam_indices) -> np.ndarray:
+    """
+    Read only the cameras `cam_indices` of one frame from a `frames/rgb` dataset.
+
+    Contiguous camera runs are read as a single hyperslab, anything else as one
+    fancy-index read. The result keeps the dataset dtype (uint8) and follows the
+    order of `cam_indices`: shape [len(cam_indices), H, W, 3].
+    """
+    cam_indices = [int(c) for c in cam_indices]
+    if not cam_indices:
+        return np.empty((0,) + tuple(frame_ds.shape[2:]), dtype=frame_ds.dtype)
+
+    unique = sorted(set(cam_indices))
+    if unique[-1] - unique[0] + 1 == len(unique):
+        block = frame_ds[frame_idx, unique[0]:unique[-1] + 1]
+    else:
+        # h5py fancy indexing needs increasing, unique indices
+        block = frame_ds[frame_idx, unique]
+
+    if unique == cam_indices:
+        return block
+    position = {cam: i for i, cam in enumerate(unique)}
+    return block[[position[cam] for cam in cam_indices]]
+
+
+def expand_index(index, size: int) -> Tuple[List[int], bool]:
+    """
+    Positions selected by an integer, slice or sequence index along an axis of `size`, and
+    whether the axis is dropped, as h5py applies it. For frame stores that emulate the
+    `frames/rgb` dataset (jpeg_frames.py, video_frames.py).
+    """
+    if isinstance(index, (int, np.integer)):
+        position = int(index) + size if index < 0 else int(index)
+        if not 0 <= position < size:
+            raise IndexError(f"index {index} is out of bounds for axis with size {size}")
+        return [position], True
+    if isinstance(index, slice):
+        return list(range(*index.indices(size))), False
+    return [int(i) for i in index], False
+
+
+def file_signature(path) -> dict:
+    """Size and modification time of a file, as recorded by the sidecars and exports made from it."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_export_headers(root, version: int, hdf5_path=None) -> Tuple[Dict[str, dict], int]:
+    """
+    The JSON take headers of a frame export directory, keyed by take path, and the number of
+    stale ones (another layout version, or exported from another version of `hdf5_path`),
+    which are left out. Unreadable headers (a take still being exported) are skipped.
+    """
+    signature = file_signature(hdf5_path) if hdf5_path is not None else None
+    headers: Dict[str, dict] = {}
+    stale = 0
+    for name in sorted(os.listdir(root)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(root, name), 'r') as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if header.get('version') != version or (signature is not None and header.get('signature') != signature):
+            stale += 1
+            continue
+        headers[header['take']] = header
+    return headers, stale
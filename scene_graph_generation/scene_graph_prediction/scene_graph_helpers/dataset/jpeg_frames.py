@@ -0,0 +1,196 @@
+import io
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from .hdf5_utils import expand_index, load_export_headers
+
+try:
+    # libjpeg-turbo bindings (pip install PyTurboJPEG), decode at 1/2, 1/4, 1/8 scale
+    from turbojpeg import TJPF_RGB, TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+try:
+    # PIL's draft mode uses the same DCT scaling of libjpeg
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Layout written by data/utils/export_jpeg_frames.py
+JPEG_FRAMES_VERSION = 1
+JPEG_FRAMES_SUFFIX = ".jpegframes"
+# side of the images the vision tower gets (FrameTransform pads to square and resizes to it)
+DEFAULT_TARGET_SIZE = 336
+SCALES = (8, 4, 2, 1)
+
+
+def decode_scale(height: int, width: int, target_size: int) -> int:
+    """Largest DCT scale denominator that keeps the longer side at `target_size` or more."""
+    for scale in SCALES:
+        if -(-max(height, width) // scale) >= target_size:
+            return scale
+    return 1
+
+
+class JpegFrames:
+    """
+    `frames/rgb` of one take, every view decoded from its JPEG on read at 1/`scale` of the
+    stored resolution.
+
+    Indexes like the HDF5 dataset for the forms the loaders use (read_cameras and the
+    batched reads): frames, then cameras, each an integer, a slice or a list. `shape` is
+    the decoded shape, so the views are smaller than the HDF5 ones when `scale` > 1;
+    FrameTransform resizes them to the vision tower's resolution either way.
+    """
+    def __init__(self, store: "JpegFrameStore", take_path: str, header: dict):
+        self.store = store
+        self.take_path = take_path
+        num_frames, num_cameras, height, width = header['shape'][:4]
+        self.scale = decode_scale(height, width, store.target_size)
+        self.shape = (num_frames, num_cameras, -(-height // self.scale), -(-width // self.scale)) + \
+            tuple(header['shape'][4:])
+        self.dtype = np.dtype(np.uint8)
+        self.ndim = len(self.shape)
+        self.chunks = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        frames, drop_frames = expand_index(index[0], self.shape[0])
+        cams, drop_cams = expand_index(index[1], self.shape[1]) if len(index) > 1 else (list(range(self.shape[1])), False)
+        out = np.zeros((len(frames), len(cams)) + self.shape[2:], dtype=self.dtype)
+        for i, frame_idx in enumerate(frames):
+            for j, cam_idx in enumerate(cams):
+                self.store.decode(self.take_path, frame_idx, cam_idx, self.scale, out[i, j])
+        if len(index) > 2:
+            out = out[(slice(None), slice(None)) + tuple(index[2:])]
+        if drop_cams:
+            out = out[:, 0]
+        if drop_frames:
+            out = out[0]
+        return out
+
+
+class JpegFrameStore:
+    """
+    JPEG export of `frames/rgb` (data/utils/export_jpeg_frames.py): every view of a take
+    is a JPEG in one blob file, located by an offsets array [num_frames * num_cameras + 1].
+
+    `frames(take_path)` returns a JpegFrames that the loaders read like the HDF5 dataset.
+    Views are decoded at the smallest DCT scale (1/8, 1/4, 1/2) whose longer side still
+    covers `target_size`, which skips most of the inverse DCT and the colour conversion of
+    the full-resolution image. Blank views are stored with zero length and read as zeros.
+    Decodes with libjpeg-turbo (PyTurboJPEG) when installed, else with PIL.
+    """
+    def __init__(self, root, hdf5_path=None, target_size: int = DEFAULT_TARGET_SIZE):
+        if TurboJPEG is None and Image is None:
+            raise ImportError("Reading a JPEG frame export requires PyTurboJPEG or Pillow")
+        self.root = os.fspath(root)
+        self.target_size = int(target_size)
+        self.headers, self.stale = load_export_headers(self.root, JPEG_FRAMES_VERSION, hdf5_path)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._blobs: Dict[str, np.ndarray] = {}
+        self._offsets: Dict[str, np.ndarray] = {}
+        self._turbo = TurboJPEG() if TurboJPEG is not None else None
+        self.decoded_views = 0
+        self.compressed_bytes = 0
+
+    def __getstate__(self):
+        # memmaps and the libjpeg-turbo handle are opened again by every worker
+        state = self.__dict__.copy()
+        for key in ('_blobs', '_offsets', '_turbo'):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __contains__(self, take_path: str) -> bool:
+        return take_path in self.headers
+
+    def frames(self, take_path: str) -> Optional[JpegFrames]:
+        """`frames/rgb` of a take decoded on read, None if the take was not exported."""
+        header = self.headers.get(take_path)
+        return JpegFrames(self, take_path, header) if header is not None else None
+
+    def _open(self, take_path: str):
+        blob = self._blobs.get(take_path)
+        if blob is None:
+            header = self.headers[take_path]
+            path = os.path.join(self.root, header['file'])
+            # a take of blank views only has an empty blob, which cannot be mapped
+            blob = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.empty(0, dtype=np.uint8)
+            self._blobs[take_path] = blob
+            self._offsets[take_path] = np.load(os.path.join(self.root, header['offsets']))
+        return blob, self._offsets[take_path]
+
+    def decode(self, take_path: str, frame_idx: int, cam_idx: int, scale: int, out: np.ndarray):
+        """Decode one view at 1/`scale` into `out` [h, w, 3] (left as is for a blank view)."""
+        if os.getpid() != self._pid:
+            self._reset()
+        blob, offsets = self._open(take_path)
+        position = frame_idx * self.headers[take_path]['shape'][1] + cam_idx
+        start, stop = int(offsets[position]), int(offsets[position + 1])
+        if start == stop:
+            return
+        data = blob[start:stop].tobytes()
+        self.compressed_bytes += stop - start
+        self.decoded_views += 1
+        if self._turbo is not None:
+            image = self._turbo.decode(data, pixel_format=TJPF_RGB, scaling_factor=(1, scale))
+        else:
+            image = Image.open(io.BytesIO(data))
+            # draft decodes at the largest scale <= min(W // w, H // h); asking for the floored
+            # size gets exactly 1/scale (libjpeg rounds the decoded size up, like `out`)
+            width, height = image.size
+            image.draft('RGB', (max(width // scale, 1), max(height // scale, 1)))
+            image = image.convert('RGB')
+            if image.size != (out.shape[1], out.shape[0]):
+                # a size draft could not reach (e.g. a view smaller than the scale)
+                image = image.resize((out.shape[1], out.shape[0]), Image.BILINEAR)
+            image = np.asarray(image)
+        if image.shape[:2] != out.shape[:2]:
+            raise ValueError(f"{take_path} frame {frame_idx} camera {cam_idx}: decoded {image.shape[:2]}, "
+                             f"expected {out.shape[:2]}")
+        out[...] = image
+
+    def stats(self) -> dict:
+        return {'decoded_views': self.decoded_views, 'compressed_bytes': self.compressed_bytes}
+
+
+_stores: Dict[str, Optional[JpegFrameStore]] = {}
+
+
+def get_jpeg_frame_store(hdf5_path) -> Optional[JpegFrameStore]:
+    """
+    The JPEG export next to an HDF5 file (`<hdf5_path>.jpegframes`), or None if there is
+    none (or no JPEG decoder is installed). Looked up once per file and process.
+    """
+    key = os.path.abspath(os.fspath(hdf5_path))
+    if key not in _stores:
+        root = key + JPEG_FRAMES_SUFFIX
+        store = None
+        if os.path.isdir(root):
+            if TurboJPEG is None and Image is None:
+                print(f"Warning: {root} needs PyTurboJPEG or Pillow, frames are read from HDF5.")
+            else:
+                store = JpegFrameStore(root, hdf5_path=key)
+                if store.stale:
+                    print(f"Warning: {store.stale} takes of {root} were exported from another version of "
+                          f"{key} and are read from HDF5. Re-run data/utils/export_jpeg_frames.py.")
+                if not len(store):
+                    store = None
+        _stores[key] = store
+    return _stores[key]
@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, Optional, Set
+
+# Modalities whose data are camera views, always read when available
+VIEW_MODALITIES = frozenset({'ego_frames', 'exo_frames', 'ultrasound'})
+
+# Modality -> its name in the egocentric_features / exocentric_features config lists
+MODALITY_FEATURES = {
+    'eye_gaze': 'gaze',
+    'eye_gaze_depth': 'gaze_depth',
+    'hand_tracking': 'hand',
+    'point_cloud': 'point_cloud',
+    'audio': 'audio',
+}
+ALL_MODALITIES = VIEW_MODALITIES | frozenset(MODALITY_FEATURES)
+
+# Modalities kept per dataset variant (the loaders' 4dor / mmor filters)
+DATASET_MODALITIES = {
+    '4dor': frozenset({'ego_frames', 'exo_frames'}),
+    'mmor': ALL_MODALITIES - {'eye_gaze', 'eye_gaze_depth', 'hand_tracking'},
+}
+
+# Non-image modalities the model has encoders for, per dataset variant (ImageEmbeddingPooler):
+# gaze/hand encoders only for egoexor, point cloud and audio for every variant but 4dor
+MODEL_ENCODERS = {
+    'egoexor': frozenset({'eye_gaze', 'eye_gaze_depth', 'hand_tracking', 'point_cloud', 'audio'}),
+    '4dor': frozenset(),
+}
+DEFAULT_MODEL_ENCODERS = frozenset({'point_cloud', 'audio'})
+
+
+@dataclass(frozen=True)
+class ModalityPlan:
+    """
+    The modalities a run reads, decided once from the config: the dataset variant, the
+    egocentric_features / exocentric_features lists and the encoders of the model. Loaders
+    filter `available_modalities` of every sample with it before touching HDF5, so a
+    modality the model never consumes is neither read nor preprocessed.
+    """
+    modalities: FrozenSet[str]
+
+    @classmethod
+    def from_config(cls, dataset_name: str, egocentric_features: Optional[Iterable[str]] = None,
+                    exocentric_features: Optional[Iterable[str]] = None) -> "ModalityPlan":
+        """Features default to all of them when neither list is given."""
+        modalities = set(DATASET_MODALITIES.get(dataset_name, ALL_MODALITIES))
+        encoders = MODEL_ENCODERS.get(dataset_name, DEFAULT_MODEL_ENCODERS)
+        if egocentric_features is None and exocentric_features is None:
+            features = set(MODALITY_FEATURES.values())
+        else:
+            features = set(egocentric_features or ()) | set(exocentric_features or ())
+        modalities = {m for m in modalities
+                      if m in VIEW_MODALITIES or (m in encoders and MODALITY_FEATURES[m] in features)}
+        # the gaze encoder takes gaze and depth together, one without the other is never used
+        if not {'eye_gaze', 'eye_gaze_depth'} <= modalities:
+            modalities -= {'eye_gaze', 'eye_gaze_depth'}
+        return cls(frozenset(modalities))
+
+    def __contains__(self, modality: str) -> bool:
+        return modality in self.modalities
+
+    def filter(self, available_modalities: Iterable[str]) -> Set[str]:
+        """The planned subset of a sample's available modalities."""
+        return set(available_modalities) & self.modalities
@@ -1,4 +1,3 @@
-import json
 from pathlib import Path
 import random
 import os
@@ -6,21 +5,16 @@ import sys
 import torch
 import torchaudio
 import numpy as np
-import h5py
 from typing import Dict, Sequence, Any
 from PIL import Image
 from torch.utils.data import Dataset
 from dataclasses import dataclass, field
-from .dataset_utils import GAZE_FIXATION_TO_TAKE
-
-def _needs_fixation(role: str, take_path: str) -> bool:
-    """
-    Return True if the given (role, take_path) combination requires
-    the extra gaze-fixation offset.
-    """
-    takes_for_role = GAZE_FIXATION_TO_TAKE.get(role, [])
-    #print(f"Checking fixation for {role} in {take_path}")
-    return take_path in takes_for_role
+from .hdf5_utils import get_h5_pool, read_cameras
+from .take_index import TakeIndex
+from .sample_manifest import load_samples
+from .read_ahead import modality_keys, plan_cameras
+from .raw_frames import open_frames
+from .modality_plan import ModalityPlan
 
 class ORDataset(Dataset):
     """Dataset for evaluation/inference with EgoExOR HDF5 data."""
@@ -28,20 +22,54 @@ class ORDataset(Dataset):
                  data_path: str, 
                  hdf5_path: str, 
                  data_args: Any, 
-                 split: str = 'val'):
+                 split: str = 'val',
+                 frame_cache=None):
         assert split in ['val', 'test'], f"Split must be 'val' or 'test', got {split}"
         self.split = split
         self.data_path = Path(data_path)
         self.hdf5_path = hdf5_path
         self.data_args = data_args
-
-        # Load JSON data
-        with self.data_path.open() as f:
-            self.samples = json.load(f)
+        self.h5_pool = get_h5_pool(rdcc_nbytes=getattr(data_args, 'hdf5_rdcc_nbytes', None))
+        self.take_index = TakeIndex.load(hdf5_path, sidecar_path=getattr(data_args, 'take_index_path', None))
+        # FrameCache of the ModelWrapper that consumes this dataset (optional): cached views are
+        # known to be non-blank, so their pixels are not read for the blank-view check
+        self.frame_cache = frame_cache
+        # TakeArrayCache of that ModelWrapper (optional): its datasets are left out of the read plans
+        self.take_cache = None
+        # modalities of this run, shared with the ModelWrapper that reads them
+        self.modality_plan = ModalityPlan.from_config(data_args.dataset_name,
+                                                      getattr(data_args, 'egocentric_features', None),
+                                                      getattr(data_args, 'exocentric_features', None))
+
+        # Load the samples (SampleManifest directory or JSON list)
+        self.samples = load_samples(self.data_path)
 
     def __len__(self):
         return len(self.samples)
 
+    @property
+    def sample_locations(self):
+        """(take ids, frame indices) of all samples, for BlockShuffleSampler."""
+        return self.samples.index['take'], self.samples.index['frame_idx']
+
+    def read_plan(self, index: int):
+        """
+        (take path, frame, cameras, per-frame datasets) that ModelWrapper.forward may read for
+        sample `index`, for the read-ahead of the model (every eval view is read flipped).
+        """
+        hdf5_indices = self.samples[index]['hdf5_indices']
+        path = f"data/{hdf5_indices['surgery_type']}/{hdf5_indices['procedure_id']}/take/{hdf5_indices['take_id']}"
+        frame_idx = hdf5_indices['frame_idx']
+        available_modalities = self.modality_plan.filter(hdf5_indices['available_modalities'])
+        view_modalities = available_modalities & {"ego_frames", "exo_frames"}
+        take = self.take_index[path]
+        ego_indices, exo_indices = take.split_cameras(
+            self.data_args.ego_sources, self.data_args.exo_sources,
+            include_ultrasound='ultrasound' in available_modalities)
+        cams = plan_cameras(take, frame_idx, ego_indices, exo_indices, view_modalities,
+                            self.frame_cache, exo_flip=True)
+        return path, frame_idx, cams, modality_keys(take, available_modalities, self.take_cache)
+
     def _load_multimodal_data(self, sample: Dict) -> Dict:
         """Load multimodal data from HDF5 for a given sample."""
         hdf5_indices = sample['hdf5_indices']
@@ -49,19 +77,9 @@ class ORDataset(Dataset):
         procedure_id = hdf5_indices['procedure_id']
         take_id = hdf5_indices['take_id']
         frame_idx = hdf5_indices['frame_idx']
-        available_modalities = set(hdf5_indices['available_modalities'])
-
-        is_egoexor = True if self.data_args.dataset_name == "egoexor" else False
-        is_4dor = True if self.data_args.dataset_name == "4dor" else False
-        is_mmor = True if self.data_args.dataset_name == "mmor" else False
+        # Filter modalities based on dataset type, configured features and model encoders
+        available_modalities = self.modality_plan.filter(hdf5_indices['available_modalities'])
 
-
-        # Filter modalities based on dataset type
-        if is_4dor:
-            available_modalities &= {"ego_frames", "exo_frames"}
-        if is_mmor:
-            available_modalities -= {"eye_gaze", "eye_gaze_depth", "hand_tracking"}
-        
         # stack the available modalities -> they are list of list so instead make it single list
 
         path = f'data/{surgery_type}/{procedure_id}/take/{take_id}'
@@ -70,39 +88,16 @@ class ORDataset(Dataset):
         ego_source_ids,   exo_source_ids   = [], []
 
 
-        with h5py.File(self.hdf5_path, 'r') as f:
-            # -- get the source name map -- #
-            sources_path = f"{path}/sources"
-            camera_names = {}
-            ego_indices, exo_indices = [], []
-
-            if sources_path in f:
-                src_grp = f[sources_path]
-                camera_count = src_grp.attrs.get('source_count', 0)
-
-                # read each source_i --> name . RGB images sorted in the same order
-                for i in range(camera_count):
-                    key = f'source_{i}'
-                    if key in src_grp.attrs:
-                        name = src_grp.attrs[key]
-                        if isinstance(name, bytes):
-                            name = name.decode('utf-8')
-                        camera_names[i] = name
-
-                        # classify ego/exo cameras
-                        if name in self.data_args.ego_sources:
-                            ego_indices.append(i)
-                        elif name in self.data_args.exo_sources:
-                            if name == "ultrasound":
-                                # check if ultrasound listed in available modalities
-                                if 'ultrasound' in available_modalities:
-                                    exo_indices.append(i)
-                            else:
-                                exo_indices.append(i)
-            
+        with self.h5_pool.file(self.hdf5_path) as f:
+            # -- source name map and ego/exo cameras come from the take index -- #
+            take = self.take_index[path]
+            ego_indices, exo_indices = take.split_cameras(
+                self.data_args.ego_sources, self.data_args.exo_sources,
+                include_ultrasound='ultrasound' in available_modalities)
+
             if ego_indices:
                 # print the ego camera names
-                #print(f"Ego cameras in {path}: {[camera_names[i] for i in ego_indices]}")
+                #print(f"Ego cameras in {path}: {[take.camera_name(i) for i in ego_indices]}")
                 ego_range = (min(ego_indices), max(ego_indices) + 1)
             else:
                 print(f"Warning: No ego cameras found in {path}. Using default range (0, 4).")
@@ -110,41 +105,41 @@ class ORDataset(Dataset):
 
             if exo_indices:
                 # print the exo camera names
-                #print(f"Exo cameras in {path}: {[camera_names[i] for i in exo_indices]}")
+                #print(f"Exo cameras in {path}: {[take.camera_name(i) for i in exo_indices]}")
                 exo_range = (min(exo_indices), max(exo_indices) + 1)
             else:
                 print(f"Warning: No exo cameras found in {path}. Using default range (4, 9).")
                 exo_range = (4, 9)
 
 
-            # --- load RGB frames for this timestep ---
-            frame_ds = f[f'{path}/frames/rgb']
-            frame_rgb = torch.from_numpy(frame_ds[frame_idx]).float()
-            # frame_rgb shape = (n_cams, H, W, 3)
+            # --- RGB frames: only ego cameras are read (uint8), to skip blank views ---
+            frame_ds = open_frames(f, path)
+            num_cameras = frame_ds.shape[1]
 
             # --- Ego frames --- #
             if 'ego_frames' in available_modalities:
-                ego_slice = frame_rgb[ego_range[0]:ego_range[1]]
-                ego_list = [(ego_slice[j], j + ego_range[0]) for j in range(ego_slice.shape[0])]
-                for img, cam_idx in ego_list:
-                    if isinstance(img, torch.Tensor):
-                        # Assuming img is [H, W, 3], convert to numpy and then PIL
-                        if isinstance(img, torch.Tensor):
-                            if not img.any():          # all pixels zero?
-                                # print(f"Warning: All pixels are zero in {path} for camera {cam_idx}. Skipping this frame.")
-                                continue
-                        ego_source_names.append(camera_names.get(cam_idx, f"source_{cam_idx}"))
-                        ego_source_ids.append(cam_idx)
+                ego_cams = list(range(ego_range[0], min(ego_range[1], num_cameras)))
+                valid_cams = take.valid_cameras(frame_idx, ego_cams)
+                if valid_cams is not None:
+                    # the take's bitmap marks blank views, nothing needs to be read
+                    ego_cams, read_cams = valid_cams, []
+                else:
+                    read_cams = [cam_idx for cam_idx in ego_cams if self.frame_cache is None
+                                 or not self.frame_cache.contains(take, frame_idx, cam_idx, flip=True)]
+                ego_rgb = dict(zip(read_cams, read_cameras(frame_ds, frame_idx, read_cams)))
+                for cam_idx in ego_cams:
+                    img = ego_rgb.get(cam_idx)
+                    if img is not None and not img.any():          # all pixels zero?
+                        # print(f"Warning: All pixels are zero in {path} for camera {cam_idx}. Skipping this frame.")
+                        continue
+                    ego_source_names.append(take.camera_name(cam_idx))
+                    ego_source_ids.append(cam_idx)
             
-            # --- Exo frames ---
+            # --- Exo frames (names only, pixels are loaded by ModelWrapper) ---
             if 'exo_frames' in available_modalities:
-                exo_slice = frame_rgb[exo_range[0]:exo_range[1]]
-                exo_list = [(exo_slice[j], j + exo_range[0]) for j in range(exo_slice.shape[0])]
-                exo_source_names = []
-                exo_source_ids = []
-                for img, cam_idx in exo_list:
-                    exo_source_names.append(camera_names.get(cam_idx, f"source_{cam_idx}"))
-                    exo_source_ids.append(cam_idx)
+                exo_cams = list(range(exo_range[0], min(exo_range[1], num_cameras)))
+                exo_source_names = [take.camera_name(cam_idx) for cam_idx in exo_cams]
+                exo_source_ids = exo_cams
 
         
         data_dict = {}
@@ -171,6 +166,7 @@ class ORDataset(Dataset):
         multimodal_data = self._load_multimodal_data(sample)
         data_dict = {
             "sample" : sample,
+            "index" : index,
             **multimodal_data
         }
 
@@ -196,6 +192,8 @@ class DataCollatorForORDataset(object):
         batch = dict()
         if any ('sample' in instance for instance in instances):
             batch["sample"] = [instance.get('sample', []) for instance in instances]
+        if any('index' in instance for instance in instances):
+            batch["index"] = [instance.get('index') for instance in instances]
         if any('ego_source_ids' in instance for instance in instances):
             batch['ego_source_names'] = [instance.get('ego_source_names', []) for instance in instances]
             batch['ego_source_ids'] = [instance.get('ego_source_ids', []) for instance in instances]
@@ -0,0 +1,128 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from .hdf5_utils import file_signature, load_export_headers
+from .jpeg_frames import get_jpeg_frame_store
+from .video_frames import get_video_frame_store
+
+# Layout written by data/utils/export_raw_frames.py
+RAW_FRAMES_VERSION = 1
+RAW_FRAMES_SUFFIX = ".rawframes"
+
+
+class RawFrameStore:
+    """
+    Memory-mapped raw export of `frames/rgb` (data/utils/export_raw_frames.py).
+
+    `frames(take_path)` returns a read-only np.memmap view [F, C, H, W, 3] of a take that
+    indexes like the HDF5 dataset, so read_cameras and the batched reads work on it
+    unchanged. Reads are page faults instead of HDF5 chunk reads and decompression, and
+    slices of it are zero-copy (`torch.from_numpy` shares the pages). Takes whose header
+    was written for another version of the HDF5 file are left out, loaders read them from
+    HDF5.
+    """
+    def __init__(self, root, hdf5_path=None):
+        self.root = os.fspath(root)
+        self.headers, self.stale = load_export_headers(self.root, RAW_FRAMES_VERSION, hdf5_path)
+        self._frames: Dict[str, np.ndarray] = {}
+
+    def __getstate__(self):
+        # a pickled memmap would be a copy of the whole take, spawned workers map the files again
+        state = self.__dict__.copy()
+        state['_frames'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __contains__(self, take_path: str) -> bool:
+        return take_path in self.headers
+
+    def frames(self, take_path: str) -> Optional[np.ndarray]:
+        """`frames/rgb` of a take as a read-only memmap view, None if the take was not exported."""
+        frames = self._frames.get(take_path)
+        if frames is None:
+            header = self.headers.get(take_path)
+            if header is None:
+                return None
+            shape = tuple(header['shape'])
+            dtype = np.dtype(header['dtype'])
+            frame_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+            raw = np.memmap(os.path.join(self.root, header['file']), dtype=np.uint8, mode='r',
+                            shape=(max(shape[0], 1), header['frame_stride']))
+            # drop the page padding of every frame, the rows stay views of the mapping
+            frames = raw[:shape[0], :frame_bytes].view(dtype).reshape(shape)
+            self._frames[take_path] = frames
+        return frames
+
+
+_stores: Dict[str, Optional[RawFrameStore]] = {}
+
+
+def get_raw_frame_store(hdf5_path) -> Optional[RawFrameStore]:
+    """
+    The raw export next to an HDF5 file (`<hdf5_path>.rawframes`), or None if there is none.
+    Looked up once per file and process.
+    """
+    key = os.path.abspath(os.fspath(hdf5_path))
+    if key not in _stores:
+        root = key + RAW_FRAMES_SUFFIX
+        store = None
+        if os.path.isdir(root):
+            store = RawFrameStore(root, hdf5_path=key)
+            if store.stale:
+                print(f"Warning: {store.stale} takes of {root} were exported from another version of "
+                      f"{key} and are read from HDF5. Re-run data/utils/export_raw_frames.py.")
+            if not len(store):
+                store = None
+        _stores[key] = store
+    return _stores[key]
+
+
+_warned_exports = set()
+
+
+def frame_backend(hdf5_path, take_path: str):
+    """
+    (name, store) of the backend `frames/rgb` of a take is read from: the first export that
+    has the take, in the order raw, JPEG (jpeg_frames.py, decoded at reduced scale), video
+    (video_frames.py), else ('hdf5', None). If a file has more than one export, a warning
+    is printed once.
+    """
+    hdf5_path = os.path.abspath(os.fspath(hdf5_path))
+    stores = {'raw': get_raw_frame_store(hdf5_path), 'jpeg': get_jpeg_frame_store(hdf5_path),
+              'video': get_video_frame_store(hdf5_path)}
+    present = [name for name, store in stores.items() if store is not None]
+    if len(present) > 1 and hdf5_path not in _warned_exports:
+        _warned_exports.add(hdf5_path)
+        print(f"Warning: {hdf5_path} has {len(present)} frame exports ({', '.join(present)}); takes are read "
+              f"from the {present[0]} export, the others only for takes it does not have.")
+    for name, store in stores.items():
+        if store is not None and take_path in store:
+            return name, store
+    return 'hdf5', None
+
+
+def frame_source(hdf5_path, take_path: str) -> dict:
+    """
+    What the views of a take are decoded from: the backend, the signature of the HDF5 file
+    and, for an export, its header (codec, quality, ...) and decode settings. Preprocessed
+    views (FrameCache) are only reused for the same source.
+    """
+    name, store = frame_backend(hdf5_path, take_path)
+    source = {'backend': name, 'signature': file_signature(hdf5_path)}
+    if store is not None:
+        source['header'] = store.headers[take_path]
+        source['target_size'] = getattr(store, 'target_size', None)
+    return source
+
+
+def open_frames(f, take_path: str):
+    """
+    `frames/rgb` of a take from its backend (frame_backend). All backends index the same way
+    (e.g. with read_cameras).
+    """
+    _, store = frame_backend(f.filename, take_path)
+    return store.frames(take_path) if store is not None else f[f'{take_path}/frames/rgb']
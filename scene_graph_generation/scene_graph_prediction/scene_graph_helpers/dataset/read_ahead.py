@@ -0,0 +1,371 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import RawArray
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from torch.utils.data import Sampler, get_worker_info
+
+from .audio_embedding import CLAP_EMBEDDING_KEY
+from .hdf5_utils import read_cameras
+from .raw_frames import open_frames
+
+DEFAULT_READ_AHEAD_BYTES = 512 * 1024 ** 2
+
+# Per-frame datasets (relative to the take) behind each low-dimensional modality
+MODALITY_KEYS = {
+    'eye_gaze': ('eye_gaze/coordinates',),
+    'eye_gaze_depth': ('eye_gaze_depth/values',),
+    'hand_tracking': ('hand_tracking/positions',),
+    'point_cloud': ('point_cloud/coordinates', 'point_cloud/colors'),
+}
+
+# (take path, frame index, camera indices, per-frame dataset keys)
+ReadPlan = Tuple[str, int, List[int], List[str]]
+
+
+def modality_keys(take, modalities, take_cache=None) -> List[str]:
+    """
+    Per-frame datasets of the take that hold `modalities` (the audio embedding if stored,
+    else the snippets), minus the ones a TakeArrayCache serves whole.
+    """
+    keys = [key for modality in MODALITY_KEYS if modality in modalities for key in MODALITY_KEYS[modality]]
+    if 'audio' in modalities:
+        keys.append(CLAP_EMBEDDING_KEY if take.has(CLAP_EMBEDDING_KEY) else 'audio/snippets')
+    return [key for key in keys if take.has(key) and (take_cache is None or not take_cache.covers(key))]
+
+
+def exo_cameras(take, exo_indices: Sequence[int]) -> List[int]:
+    """The exo camera range of a take, with the same default as the loaders."""
+    exo_range = (min(exo_indices), max(exo_indices) + 1) if exo_indices else (4, 9)
+    return list(range(exo_range[0], min(exo_range[1], take.num_cameras)))
+
+
+def plan_cameras(take, frame_idx: int, ego_indices: Sequence[int], exo_indices: Sequence[int], modalities,
+                 frame_cache=None, exo_flip: Union[None, bool, Sequence[bool]] = None,
+                 exo_cams: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    Cameras of a frame a loader may read: the ego camera range and the exo cameras (`exo_cams`
+    if the loader drew them already, else the exo range) minus the views already in the frame
+    cache and the ego views the take's bitmap marks blank. Ego views are always cached flipped;
+    exo views are only checked if their flip is known (`exo_flip`, one for all of them or one
+    per camera of `exo_cams`).
+    """
+    ego_range = (min(ego_indices), max(ego_indices) + 1) if ego_indices else (0, 4)
+    cams = {}
+    if 'ego_frames' in modalities:
+        ego_cams = list(range(ego_range[0], min(ego_range[1], take.num_cameras)))
+        valid_cams = take.valid_cameras(frame_idx, ego_cams)
+        cams.update((cam_idx, True) for cam_idx in (ego_cams if valid_cams is None else valid_cams))
+    if 'exo_frames' in modalities:
+        exo_cams = exo_cameras(take, exo_indices) if exo_cams is None else list(exo_cams)
+        flips = exo_flip if isinstance(exo_flip, (list, tuple)) else [exo_flip] * len(exo_cams)
+        cams.update((cam_idx, flip) for cam_idx, flip in zip(exo_cams, flips) if cam_idx not in cams)
+    if frame_cache is not None:
+        return sorted(cam_idx for cam_idx, flip in cams.items()
+                      if flip is None or not frame_cache.contains(take, frame_idx, cam_idx, flip=flip))
+    return sorted(cams)
+
+
+class FrameReads:
+    """
+    The HDF5 reads of one frame of a take. Arrays prefetched by ReadAhead are served from
+    memory, rows of the datasets a TakeArrayCache holds come from the whole-take arrays, and
+    anything else is read from the file on demand, so the loaders use the same calls with
+    and without a read-ahead.
+    """
+    def __init__(self, f, path: str, frame_idx: int, views: Optional[Dict[int, np.ndarray]] = None,
+                 rows: Optional[Dict[str, np.ndarray]] = None, take_cache=None):
+        self.f = f
+        self.path = path
+        self.frame_idx = frame_idx
+        self.views = views or {}
+        self.rows = rows or {}
+        self.take_cache = take_cache
+        self._frame_ds = None
+
+    @property
+    def frame_ds(self):
+        if self._frame_ds is None:
+            # the raw export of the take if there is one, the HDF5 dataset otherwise
+            self._frame_ds = open_frames(self.f, self.path)
+        return self._frame_ds
+
+    def cameras(self, cams: Sequence[int]) -> List[np.ndarray]:
+        """uint8 views [H, W, 3] of the cameras `cams`, in order."""
+        cams = [int(c) for c in cams]
+        missing = [c for c in cams if c not in self.views]
+        read = dict(zip(missing, read_cameras(self.frame_ds, self.frame_idx, missing))) if missing else {}
+        return [self.views[c] if c in self.views else read[c] for c in cams]
+
+    def row(self, key: str) -> np.ndarray:
+        """Row `frame_idx` of the take dataset `key`. Always a private array, callers may modify it."""
+        if key in self.rows:
+            return self.rows[key].copy()
+        if self.take_cache is not None:
+            row = self.take_cache.row(self.f, self.path, key, self.frame_idx)
+            if row is not None:
+                return row
+        return self.f[f'{self.path}/{key}'][self.frame_idx]
+
+
+def _read_rows(ds, frames: List[int], *index):
+    """ds[frames, *index] for sorted, unique frames: one hyperslab if they are consecutive, else one fancy-index read."""
+    if frames[-1] - frames[0] + 1 == len(frames):
+        return ds[(slice(frames[0], frames[-1] + 1),) + index]
+    return ds[(frames,) + index]
+
+
+def read_batch(f, plans: Sequence[ReadPlan]) -> Dict[tuple, Tuple[dict, dict]]:
+    """
+    The reads of several samples at once, as {(take path, frame): (views, rows)} for FrameReads.
+
+    Plans are grouped by take and their frames sorted. Per take, the camera views are one
+    read of the frames over the span of the requested cameras, and every per-frame dataset
+    is one read of the frames that need it.
+    """
+    by_take: Dict[str, Dict[int, Tuple[set, set]]] = {}
+    for path, frame_idx, cams, keys in plans:
+        frame_cams, frame_keys = by_take.setdefault(path, {}).setdefault(int(frame_idx), (set(), set()))
+        frame_cams.update(int(c) for c in cams)
+        frame_keys.update(keys)
+
+    result = {}
+    for path, frames in by_take.items():
+        frame_list = sorted(frames)
+        views = {frame: {} for frame in frame_list}
+        rows = {frame: {} for frame in frame_list}
+
+        all_cams = set().union(*(frame_cams for frame_cams, _ in frames.values()))
+        if all_cams:
+            low, high = min(all_cams), max(all_cams) + 1
+            block = _read_rows(open_frames(f, path), frame_list, slice(low, high))
+            for row, frame in enumerate(frame_list):
+                views[frame] = {cam: block[row, cam - low] for cam in frames[frame][0]}
+
+        for key in sorted(set().union(*(frame_keys for _, frame_keys in frames.values()))):
+            key_frames = [frame for frame in frame_list if key in frames[frame][1]]
+            block = _read_rows(f[f'{path}/{key}'], key_frames)
+            for row, frame in enumerate(key_frames):
+                rows[frame][key] = block[row]
+
+        for frame in frame_list:
+            result[(path, frame)] = (views[frame], rows[frame])
+    return result
+
+
+class _Entry:
+    __slots__ = ('future', 'uses', 'last_position')
+
+    def __init__(self, future):
+        self.future = future
+        self.uses = 0
+        self.last_position = -1
+
+
+def _read_frame(f, path: str, frame_idx: int, cams: List[int], keys: List[str]):
+    views = dict(zip(cams, read_cameras(open_frames(f, path), frame_idx, cams))) if cams else {}
+    rows = {key: f[f'{path}/{key}'][frame_idx] for key in keys}
+    nbytes = sum(view.nbytes for view in views.values()) + sum(row.nbytes for row in rows.values())
+    return views, rows, nbytes
+
+
+class ReadAhead:
+    """
+    Background read-ahead of the HDF5 reads of upcoming samples.
+
+    `ReadAheadSampler` publishes the order of every epoch (in shared memory, so forked
+    DataLoader workers see it). When a sample is requested, the consumer looks up its
+    position and submits the reads of the samples it will get next to a small thread pool:
+    the rest of its batch, then every `num_workers * num_replicas`-th batch, as torch and
+    accelerate deal them out. `read_plan(index)` says what a sample reads. Reads are keyed
+    by (take, frame), so the permutations of a frame share one read.
+
+    At most `depth` frames and about `max_bytes` are buffered per consumer. A wrong guess
+    only costs a wasted read: samples that were not prefetched are read synchronously.
+    h5py serializes HDF5 calls but releases the GIL while reading, so the threads overlap
+    I/O with the consumer's preprocessing (or generation) rather than with each other.
+    """
+    def __init__(self, read_plan: Callable[[int], ReadPlan], num_samples: int, depth: int = 16,
+                 num_threads: int = 2, max_bytes: int = DEFAULT_READ_AHEAD_BYTES):
+        self.read_plan = read_plan
+        self.num_samples = int(num_samples)
+        self.depth = int(depth)
+        self.num_threads = int(num_threads)
+        self.max_bytes = int(max_bytes)
+        # order and position of every sample of the current epoch; layout = generation, length, batch size, replicas
+        self._order = RawArray('q', max(self.num_samples, 1))
+        self._positions = RawArray('q', max(self.num_samples, 1))
+        self._layout = RawArray('q', 4)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._executor = None
+        self._entries: Dict[tuple, _Entry] = {}
+        self._generation = 0
+        self._horizon = -1
+        self._entry_nbytes = 0
+        self.hits = 0       # read was complete when the sample was requested
+        self.waits = 0      # read was still in flight
+        self.misses = 0     # read was not scheduled, done synchronously
+        self.wasted = 0     # frames read but never requested
+
+    def __getstate__(self):
+        # threads and buffers are per process, spawned workers start empty
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_entries'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _check_process(self):
+        if os.getpid() != self._pid:
+            # forked DataLoader worker: the parent's threads do not exist here
+            self._reset()
+
+    # ------------------------------------------------------------------ order
+    def publish(self, order: Sequence[int], batch_size: int = 1, num_replicas: int = 1) -> None:
+        """Announce the sample order of the coming epoch (main process, before the workers get indices)."""
+        order = np.asarray(order, dtype=np.int64)[:self.num_samples]
+        np.frombuffer(self._order, dtype=np.int64)[:len(order)] = order
+        positions = np.frombuffer(self._positions, dtype=np.int64)
+        positions[:] = -1
+        positions[order] = np.arange(len(order))
+        # the generation is bumped last, consumers only use a layout whose order is written
+        self._layout[1], self._layout[2], self._layout[3] = len(order), max(int(batch_size), 1), max(int(num_replicas), 1)
+        self._layout[0] += 1
+
+    @staticmethod
+    def _upcoming(position: int, length: int, batch_size: int, step: int):
+        """Positions this consumer gets after `position`: the rest of its batch, then every `step`-th batch."""
+        batch = position // batch_size
+        next_position = position + 1
+        while next_position < length:
+            if next_position % batch_size == 0:
+                batch += step
+                next_position = batch * batch_size
+                if next_position >= length:
+                    return
+            yield next_position
+            next_position += 1
+
+    # --------------------------------------------------------------- buffering
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix='read_ahead')
+        return self._executor
+
+    def buffered_bytes(self) -> int:
+        total = 0
+        for entry in self._entries.values():
+            if entry.future.done() and entry.future.exception() is None:
+                total += entry.future.result()[2]
+            else:
+                total += self._entry_nbytes
+        return total
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        if not entry.future.cancel():
+            self.wasted += 1
+
+    def _schedule(self, f, position: int, length: int, batch_size: int, num_replicas: int):
+        # entries predicted for positions this consumer has passed will not be requested anymore
+        for key in [key for key, entry in self._entries.items() if entry.last_position < position]:
+            self._drop(key)
+
+        worker_info = get_worker_info()
+        step = (worker_info.num_workers if worker_info is not None else 1) * num_replicas
+        order = np.frombuffer(self._order, dtype=np.int64)
+        for upcoming in self._upcoming(position, length, batch_size, step):
+            if len(self._entries) >= self.depth or self.buffered_bytes() >= self.max_bytes:
+                break
+            if upcoming <= self._horizon:
+                continue
+            self._horizon = upcoming
+            path, frame_idx, cams, keys = self.read_plan(int(order[upcoming]))
+            key = (path, int(frame_idx))
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(
+                    self._pool().submit(_read_frame, f, path, int(frame_idx), list(cams), list(keys)))
+            entry.uses += 1
+            entry.last_position = upcoming
+
+    def reads(self, f, path: str, frame_idx: int, index: int, take_cache=None) -> FrameReads:
+        """
+        The reads of sample `index` (frame `frame_idx` of take `path`), prefetched if it was
+        scheduled, and schedule the samples that follow it. `take_cache` is passed on to the
+        FrameReads.
+        """
+        self._check_process()
+        generation, length, batch_size, num_replicas = self._layout[:]
+        if generation != self._generation:
+            for key in list(self._entries):
+                self._drop(key)
+            self._generation = generation
+            self._horizon = -1
+
+        key = (path, int(frame_idx))
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.uses -= 1
+            if entry.uses <= 0:
+                del self._entries[key]
+
+        position = self._positions[index] if generation and 0 <= index < self.num_samples else -1
+        if position >= 0:
+            # submit the next reads before waiting for this one
+            self._schedule(f, position, length, batch_size, num_replicas)
+
+        if entry is None:
+            self.misses += 1
+            return FrameReads(f, path, frame_idx, take_cache=take_cache)
+        if entry.future.done():
+            self.hits += 1
+        else:
+            self.waits += 1
+        views, rows, nbytes = entry.future.result()
+        self._entry_nbytes = nbytes
+        return FrameReads(f, path, frame_idx, views, rows, take_cache=take_cache)
+
+    def sampler(self, sampler, batch_size: int = 1, num_replicas: int = 1) -> "ReadAheadSampler":
+        """`sampler`, publishing its order to this read-ahead (DataLoader batch size and number of ranks)."""
+        return ReadAheadSampler(sampler, [self], batch_size=batch_size, num_replicas=num_replicas)
+
+    # ----------------------------------------------------------------- metrics
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.waits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'waits': self.waits, 'misses': self.misses, 'wasted': self.wasted,
+                'hit_rate': self.hit_rate, 'buffered_bytes': self.buffered_bytes()}
+
+
+class ReadAheadSampler(Sampler):
+    """Wraps a sampler and publishes the order of every epoch to `read_aheads` before yielding it."""
+    def __init__(self, sampler, read_aheads: Sequence[ReadAhead], batch_size: int = 1, num_replicas: int = 1):
+        self.sampler = sampler
+        self.read_aheads = list(read_aheads)
+        self.batch_size = batch_size
+        self.num_replicas = num_replicas
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def set_epoch(self, epoch):
+        if hasattr(self.sampler, 'set_epoch'):
+            self.sampler.set_epoch(epoch)
+
+    def __iter__(self):
+        # the same draws as iterating the sampler directly, the order is only materialized first
+        order = [int(index) for index in self.sampler]
+        for read_ahead in self.read_aheads:
+            read_ahead.publish(order, self.batch_size, self.num_replicas)
+        return iter(order)
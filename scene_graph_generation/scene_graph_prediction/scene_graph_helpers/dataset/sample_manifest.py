@@ -0,0 +1,238 @@
+import json
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from .hdf5_utils import file_signature
+
+SAMPLE_MANIFEST_VERSION = 1
+SAMPLE_MANIFEST_SUFFIX = ".samples"
+
+# Bit i of the `modalities` column is set if MODALITY_BITS[i] is an available modality
+MODALITY_BITS = ('ego_frames', 'exo_frames', 'ultrasound', 'point_cloud',
+                 'eye_gaze', 'eye_gaze_depth', 'hand_tracking', 'audio')
+
+SAMPLE_DTYPE = np.dtype([
+    ('take', np.int32),            # row of `takes` in meta.json
+    ('frame_idx', np.int32),
+    ('permutation', np.int16),     # last component of the sample id
+    ('modalities', np.uint16),     # MODALITY_BITS mask
+    ('prompt', np.int16),          # row of `prompts` in meta.json
+    ('answer_offset', np.int64),   # byte range of the answer in answers.bin
+    ('answer_length', np.int32),
+    ('answer_words', np.int32),
+])
+
+
+def _plain(value):
+    # numpy scalars (e.g. from the split table) -> JSON-serializable Python values
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def sample_id(surgery_type, procedure_id, take_id, frame_idx, permutation) -> str:
+    return f"{surgery_type}_{procedure_id}_{take_id}_{frame_idx}_{permutation}"
+
+
+class SampleManifest:
+    """
+    Columnar, memory-mapped form of the LLaVA sample JSON.
+
+    Stored as a directory `<name>.samples/` with
+        meta.json    take table, interned prompt texts and the modality bit order
+        index.npy    one SAMPLE_DTYPE row per sample
+        answers.bin  utf-8 answers (scene graph strings), concatenated
+
+    Indexing returns the same dict as the corresponding JSON sample
+    ('id', 'timepoint', 'hdf5_indices', 'conversations'), assembled on access, so the
+    datasets can use a manifest wherever they used the JSON list.
+    """
+    def __init__(self, index: np.ndarray, answers: np.ndarray, takes: List[list], prompts: List[str],
+                 modalities: Sequence[str] = MODALITY_BITS, path=None, source_signature=None):
+        self.index = index
+        self.answers = answers
+        self.takes = [tuple(take) for take in takes]
+        self.prompts = list(prompts)
+        self.modalities = tuple(modalities)
+        self.path = path
+        # size/mtime of the JSON file this manifest was converted from, if any
+        self.source_signature = source_signature
+        self._prompt_words = np.array([len(prompt.split()) for prompt in self.prompts], dtype=np.int64)
+        self._prompt_has_image = np.array(['<image>' in prompt for prompt in self.prompts], dtype=bool)
+        self._modality_names = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getstate__(self):
+        # a manifest on disk is re-mapped by spawned workers instead of being pickled whole
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state['index'] = state['answers'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.index is None:
+            mapped = SampleManifest.load(self.path)
+            self.index, self.answers = mapped.index, mapped.answers
+
+    @staticmethod
+    def is_manifest(path) -> bool:
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json'))
+
+    # ------------------------------------------------------------------ access
+    def modality_names(self, mask: int) -> List[str]:
+        names = self._modality_names.get(mask)
+        if names is None:
+            names = self._modality_names[mask] = [name for bit, name in enumerate(self.modalities) if mask & (1 << bit)]
+        return list(names)
+
+    def _answer(self, offset: int, length: int) -> str:
+        return self.answers[offset:offset + length].tobytes().decode('utf-8')
+
+    def answer(self, i: int) -> str:
+        row = self.index[i]
+        return self._answer(int(row['answer_offset']), int(row['answer_length']))
+
+    def __getitem__(self, i) -> Dict[str, Any]:
+        if isinstance(i, (list, tuple, np.ndarray)):
+            return [self[j] for j in i]
+        # one conversion of the row to Python scalars, field access on numpy records is slow
+        take, frame_idx, permutation, modalities, prompt, answer_offset, answer_length, _ = self.index[i].item()
+        surgery_type, procedure_id, take_id = self.takes[take]
+        return {
+            'id': sample_id(surgery_type, procedure_id, take_id, frame_idx, permutation),
+            'timepoint': frame_idx,
+            'hdf5_indices': {
+                'surgery_type': surgery_type,
+                'procedure_id': procedure_id,
+                'take_id': take_id,
+                'frame_idx': frame_idx,
+                'available_modalities': self.modality_names(modalities),
+            },
+            'conversations': [
+                {'from': 'human', 'value': self.prompts[prompt]},
+                {'from': 'gpt', 'value': self._answer(answer_offset, answer_length)},
+            ],
+        }
+
+    def word_counts(self) -> np.ndarray:
+        """Whitespace word count of both conversation turns of every sample (no per-sample decode)."""
+        return self._prompt_words[self.index['prompt']] + self.index['answer_words']
+
+    def has_image(self) -> np.ndarray:
+        """Whether the prompt of every sample contains the <image> token."""
+        return self._prompt_has_image[self.index['prompt']]
+
+    # ------------------------------------------------------------- conversion
+    @classmethod
+    def from_samples(cls, samples: Sequence[Dict[str, Any]]) -> "SampleManifest":
+        """Build an in-memory manifest from sample dicts as written by generate_dataset_format_for_llava."""
+        take_rows, prompt_rows, bits = {}, {}, {name: bit for bit, name in enumerate(MODALITY_BITS)}
+        index = np.zeros(len(samples), dtype=SAMPLE_DTYPE)
+        encoded_answers = []
+        offset = 0
+        for i, sample in enumerate(samples):
+            hdf5_indices = sample['hdf5_indices']
+            take = (_plain(hdf5_indices['surgery_type']), _plain(hdf5_indices['procedure_id']),
+                    _plain(hdf5_indices['take_id']))
+            frame_idx = int(hdf5_indices['frame_idx'])
+            conversations = sample['conversations']
+            if len(conversations) != 2 or conversations[0]['from'] != 'human' or conversations[1]['from'] != 'gpt':
+                raise ValueError(f"Sample {sample.get('id')} is not a single human/gpt exchange")
+            permutation = str(sample['id']).rsplit('_', 1)[-1]
+            if not permutation.isdigit() or sample['id'] != sample_id(*take, frame_idx, permutation):
+                raise ValueError(f"Sample id {sample['id']} does not follow <take>_<frame>_<permutation>")
+            if int(sample.get('timepoint', frame_idx)) != frame_idx:
+                raise ValueError(f"Sample {sample['id']} has a timepoint different from its frame")
+
+            mask = 0
+            for name in hdf5_indices['available_modalities']:
+                if name not in bits:
+                    raise ValueError(f"Unknown modality {name} in sample {sample['id']}")
+                mask |= 1 << bits[name]
+
+            answer = conversations[1]['value']
+            encoded = answer.encode('utf-8')
+            encoded_answers.append(encoded)
+            index[i] = (take_rows.setdefault(take, len(take_rows)), frame_idx, int(permutation), mask,
+                        prompt_rows.setdefault(conversations[0]['value'], len(prompt_rows)),
+                        offset, len(encoded), len(answer.split()))
+            offset += len(encoded)
+
+        answers = np.frombuffer(b''.join(encoded_answers), dtype=np.uint8)
+        return cls(index, answers, [list(take) for take in take_rows], list(prompt_rows))
+
+    def save(self, path) -> None:
+        """Write the manifest directory (files are replaced atomically)."""
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            'version': SAMPLE_MANIFEST_VERSION,
+            'num_samples': len(self),
+            'takes': [list(take) for take in self.takes],
+            'prompts': self.prompts,
+            'modalities': list(self.modalities),
+            'source_signature': self.source_signature,
+        }
+        for name, write in (('index.npy', lambda f: np.save(f, np.ascontiguousarray(self.index))),
+                            ('answers.bin', lambda f: f.write(np.ascontiguousarray(self.answers).tobytes())),
+                            ('meta.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))):
+            tmp_path = os.path.join(path, f"{name}.tmp{os.getpid()}")
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path) -> "SampleManifest":
+        """Open a manifest directory; the index and the answers are memory-mapped, not read."""
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != SAMPLE_MANIFEST_VERSION:
+            raise ValueError(f"Unsupported sample manifest version {meta.get('version')} in {path}")
+        # plain ndarray views of the maps, indexing np.memmap objects is several times slower
+        index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r').view(np.ndarray)
+        answers_path = os.path.join(path, 'answers.bin')
+        if os.path.getsize(answers_path) > 0:
+            answers = np.memmap(answers_path, dtype=np.uint8, mode='r').view(np.ndarray)
+        else:
+            answers = np.zeros(0, dtype=np.uint8)
+        if index.dtype != SAMPLE_DTYPE or len(index) != meta['num_samples']:
+            raise ValueError(f"Sample manifest {path} is inconsistent with its meta.json")
+        return cls(index, answers, meta['takes'], meta['prompts'], meta['modalities'], path=path,
+                   source_signature=meta.get('source_signature'))
+
+
+def load_samples(data_path) -> SampleManifest:
+    """
+    The samples at `data_path` (a manifest directory or a JSON sample list) as a SampleManifest.
+
+    A JSON list is converted once and cached next to it as `<data_path>.samples/`, which is
+    rebuilt when the JSON changes. The sample table then lives in a few NumPy buffers instead
+    of millions of Python objects, so forked DataLoader workers never write to (and copy)
+    its pages through refcount updates.
+    """
+    data_path = os.fspath(data_path)
+    if SampleManifest.is_manifest(data_path):
+        return SampleManifest.load(data_path)
+
+    cache_path = data_path + SAMPLE_MANIFEST_SUFFIX
+    signature = file_signature(data_path)
+    if SampleManifest.is_manifest(cache_path):
+        try:
+            manifest = SampleManifest.load(cache_path)
+            if manifest.source_signature == signature:
+                return manifest
+            print(f"Sample manifest {cache_path} is stale, rebuilding.")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read sample manifest {cache_path}: {e}. Rebuilding.")
+
+    with open(data_path, 'r') as f:
+        manifest = SampleManifest.from_samples(json.load(f))
+    manifest.source_signature = signature
+    try:
+        manifest.save(cache_path)
+        return SampleManifest.load(cache_path)
+    except OSError as e:
+        print(f"Warning: could not write sample manifest {cache_path}: {e}")
+        return manifest
@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Low-dimensional per-frame datasets, a few MB per take, loaded whole by TakeArrayCache
+TAKE_CACHE_KEYS = ('eye_gaze/coordinates', 'eye_gaze_depth/values', 'hand_tracking/positions')
+DEFAULT_TAKE_CACHE_BYTES = 256 * 1024 ** 2
+SHARED_MEMORY_DIR = '/dev/shm'
+
+
+def _array_file(take_path: str, key: str) -> str:
+    # data/<surgery_type>/<procedure_id>/take/<take_id> + eye_gaze/coordinates -> <...>.eye_gaze.coordinates.npy
+    return f"{take_path}/{key}".strip('/').replace('/', '.') + '.npy'
+
+
+def _publish(path: str, array: np.ndarray) -> None:
+    """Write `array` as a .npy file at `path`. Concurrent writers agree on one file, readers never see a partial one."""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as fh:
+        np.save(fh, array)
+    try:
+        # link() fails if another worker published the array first
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+def _remove_root(root: str, owner_pid: int) -> None:
+    # forked workers inherit the finalizer, only the process that created the directory removes it
+    if os.getpid() == owner_pid:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+class TakeArrayCache:
+    """
+    Whole-take, in-RAM cache of the low-dimensional per-frame datasets (eye gaze, gaze depth,
+    hand tracking), which the loaders would otherwise read from HDF5 one frame at a time.
+
+    The first touch of a (take, dataset) reads the whole dataset once and publishes it as a
+    .npy file in a shared-memory directory (`/dev/shm`), created by the main process and
+    inherited by the DataLoader workers: every worker maps the same pages instead of
+    reading the take again. Each process keeps the arrays it uses mapped in LRU order.
+    Before an array is added, the least recently used mappings of the process and the
+    arrays of the directory mapped longest ago are dropped until it fits in `max_bytes`
+    (an array another worker still maps is only freed when that worker drops it). Arrays
+    larger than the budget are not cached. Hits and misses are counted per process, like
+    ReadAhead.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_TAKE_CACHE_BYTES, keys: Sequence[str] = TAKE_CACHE_KEYS,
+                 root: Optional[str] = None):
+        self.max_bytes = int(max_bytes)
+        self.keys = frozenset(keys)
+        # a directory given by the caller is left in place
+        self._owner_pid = None
+        if root is None:
+            shm_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+            root = tempfile.mkdtemp(prefix='egoexor_take_cache_', dir=shm_dir)
+            self._owner_pid = os.getpid()
+            weakref.finalize(self, _remove_root, root, self._owner_pid)
+        self.root = root
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._arrays: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._mapped_bytes = 0
+        self.hits = 0        # served from memory (mapped by this process or published by another)
+        self.misses = 0      # read whole from HDF5
+        self.bypassed = 0    # larger than the budget, read per frame
+        self.evictions = 0
+
+    def __getstate__(self):
+        # mappings are per process, spawned workers map the published arrays again
+        state = self.__dict__.copy()
+        state['_arrays'] = OrderedDict()
+        state['_mapped_bytes'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _check_process(self):
+        if os.getpid() != self._pid:
+            # forked DataLoader worker: start with fresh statistics, keep the inherited mappings
+            arrays, mapped_bytes = self._arrays, self._mapped_bytes
+            self._reset()
+            self._arrays, self._mapped_bytes = arrays, mapped_bytes
+
+    def covers(self, key: str) -> bool:
+        return key in self.keys
+
+    # --------------------------------------------------------------- eviction
+    def _unmap_until(self, nbytes: int):
+        while self._arrays and self._mapped_bytes + nbytes > self.max_bytes:
+            _, array = self._arrays.popitem(last=False)
+            self._mapped_bytes -= array.nbytes
+
+    def _evict_until(self, nbytes: int):
+        """Delete the published arrays mapped longest ago until `nbytes` more fit in the budget."""
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total + nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _map(self, name: str, path: str) -> np.ndarray:
+        array = np.load(path, mmap_mode='r')
+        self._unmap_until(array.nbytes)
+        self._arrays[name] = array
+        self._mapped_bytes += array.nbytes
+        # the modification time orders the published arrays for eviction
+        os.utime(path)
+        return array
+
+    # ----------------------------------------------------------------- access
+    def array(self, f, take_path: str, key: str) -> Optional[np.ndarray]:
+        """The whole dataset `key` of a take (read-only), or None if it is not cached (unknown key or over budget)."""
+        if key not in self.keys:
+            return None
+        self._check_process()
+        name = _array_file(take_path, key)
+        array = self._arrays.get(name)
+        if array is not None:
+            self._arrays.move_to_end(name)
+            self.hits += 1
+            return array
+
+        path = os.path.join(self.root, name)
+        try:
+            array = self._map(name, path)
+            self.hits += 1
+            return array
+        except FileNotFoundError:
+            pass
+
+        ds = f[f'{take_path}/{key}']
+        if ds.size * ds.dtype.itemsize > self.max_bytes:
+            self.bypassed += 1
+            return None
+        data = ds[()]
+        self.misses += 1
+        self._unmap_until(data.nbytes)
+        self._evict_until(data.nbytes)
+        _publish(path, data)
+        try:
+            return self._map(name, path)
+        except FileNotFoundError:
+            # evicted by another worker in the meantime
+            return data
+
+    def row(self, f, take_path: str, key: str, frame_idx: int) -> Optional[np.ndarray]:
+        """Row `frame_idx` of the dataset `key` of a take as a private array, or None if it is not cached."""
+        array = self.array(f, take_path, key)
+        return None if array is None else np.array(array[frame_idx])
+
+    def close(self):
+        """Unmap every array and delete the shared directory (in the process that created it)."""
+        self._arrays.clear()
+        self._mapped_bytes = 0
+        _remove_root(self.root, self._owner_pid)
+
+    # ----------------------------------------------------------------- metrics
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.bypassed
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'bypassed': self.bypassed, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate, 'mapped_bytes': self._mapped_bytes}
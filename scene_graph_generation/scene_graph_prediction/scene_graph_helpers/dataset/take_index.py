@@ -0,0 +1,261 @@
+import base64
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import h5py
+import numpy as np
+
+from .dataset_utils import GAZE_FIXATION_TO_TAKE, SOURCES, reversed_sources
+from .hdf5_utils import file_signature
+
+TAKE_INDEX_VERSION = 2
+TAKE_INDEX_SUFFIX = ".takeindex.json"
+# Packed [num_frames, num_cameras] bitmap of the non-blank views, written by data/utils/frame_validity.py
+FRAME_VALIDITY_KEY = "frames/valid"
+# Source id of cameras whose name is not in SOURCES
+UNKNOWN_SOURCE_ID = np.iinfo(np.int64).min
+
+
+def take_path(surgery_type: str, procedure_id, take_id) -> str:
+    return f"data/{surgery_type}/{procedure_id}/take/{take_id}"
+
+
+@dataclass
+class TakeInfo:
+    """Static metadata of a single take, read once from the HDF5 file."""
+    path: str
+    camera_names: List[Optional[str]]
+    num_frames: int = 0
+    num_cameras: int = 0
+    members: List[str] = field(default_factory=list)
+    datasets: Dict[str, dict] = field(default_factory=dict)
+    fixation_roles: List[str] = field(default_factory=list)
+    # base64 of the frames/valid bitmap, None if the take has none
+    validity: Optional[str] = None
+
+    def __post_init__(self):
+        self._member_set = frozenset(self.members)
+        self._fixation_set = frozenset(self.fixation_roles)
+        self._split_cache = {}
+        # camera index -> SOURCES id, and the SOURCES ids of the roles whose gaze needs the fixation offset
+        self._source_ids = np.array([SOURCES.get(self.camera_name(i), UNKNOWN_SOURCE_ID)
+                                     for i in range(len(self.camera_names))], dtype=np.int64)
+        self.fixation_source_ids = np.array(sorted(source_id for source_id, role in reversed_sources.items()
+                                                   if role in self._fixation_set), dtype=np.int64)
+        self._validity = None
+        if self.validity is not None:
+            self._validity = np.frombuffer(base64.b64decode(self.validity), dtype=np.uint8).reshape(self.num_frames, -1)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_split_cache'] = {}
+        return state
+
+    def has(self, key: str) -> bool:
+        """Equivalent of `f"{take_path}/{key}" in f` for top-level groups and their datasets."""
+        return key in self.datasets or key in self._member_set
+
+    def shape(self, key: str) -> Optional[Tuple[int, ...]]:
+        info = self.datasets.get(key)
+        return tuple(info['shape']) if info is not None else None
+
+    def camera_name(self, cam_idx: int) -> str:
+        if 0 <= cam_idx < len(self.camera_names) and self.camera_names[cam_idx] is not None:
+            return self.camera_names[cam_idx]
+        return f"source_{cam_idx}"
+
+    def source_ids(self, cams: Sequence[int]) -> np.ndarray:
+        """SOURCES ids (int64) of the cameras `cams`, the ids gaze rows are labelled with."""
+        ids = self._source_ids[np.asarray(cams, dtype=np.intp)]
+        if (ids == UNKNOWN_SOURCE_ID).any():
+            raise KeyError(f"Camera not in SOURCES: {[self.camera_name(c) for c in cams]}")
+        return ids
+
+    def valid_cameras(self, frame_idx: int, cams: Sequence[int]) -> Optional[List[int]]:
+        """
+        The cameras of `cams` whose view of `frame_idx` is not blank, from the frames/valid
+        bitmap, without touching the HDF5 file. None if the take has no bitmap.
+        """
+        if self._validity is None:
+            return None
+        bits = np.unpackbits(self._validity[frame_idx], count=self.num_cameras)
+        return [cam_idx for cam_idx in cams if bits[cam_idx]]
+
+    def needs_fixation(self, role: str) -> bool:
+        """Return True if gaze of `role` needs the extra gaze-fixation offset in this take."""
+        return role in self._fixation_set
+
+    def split_cameras(self, ego_sources: Sequence[str], exo_sources: Sequence[str],
+                      include_ultrasound: bool) -> Tuple[List[int], List[int]]:
+        """
+        Classify the camera indices of this take into ego and exo cameras.
+
+        The ultrasound screen recording only counts as an exo camera when
+        `include_ultrasound` is set (i.e. 'ultrasound' is an available modality).
+        """
+        key = (tuple(ego_sources), tuple(exo_sources), bool(include_ultrasound))
+        cached = self._split_cache.get(key)
+        if cached is None:
+            ego_indices, exo_indices = [], []
+            for i, name in enumerate(self.camera_names):
+                if name is None:
+                    continue
+                if name in ego_sources:
+                    ego_indices.append(i)
+                elif name in exo_sources:
+                    if name != "ultrasound" or include_ultrasound:
+                        exo_indices.append(i)
+            cached = (ego_indices, exo_indices)
+            self._split_cache[key] = cached
+        return cached
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'camera_names': self.camera_names,
+            'num_frames': self.num_frames,
+            'num_cameras': self.num_cameras,
+            'members': self.members,
+            'datasets': self.datasets,
+            'fixation_roles': self.fixation_roles,
+            'validity': self.validity,
+        }
+
+
+class TakeIndex:
+    """
+    Per-take metadata of an EgoExOR HDF5 file: camera maps, modality presence,
+    frame counts and gaze-fixation flags.
+
+    Built once per dataset (a full scan only touches group/attribute metadata) and
+    cached in a sidecar JSON file next to the HDF5 file, so later runs start instantly.
+    Instances are plain Python objects and are inherited by (or pickled to) DataLoader workers.
+    """
+    def __init__(self, takes: Dict[str, TakeInfo], hdf5_path: Optional[str] = None):
+        self.takes = takes
+        self.hdf5_path = hdf5_path
+
+    def __len__(self):
+        return len(self.takes)
+
+    def __contains__(self, path: str) -> bool:
+        return path.strip('/') in self.takes
+
+    def __getitem__(self, path: str) -> TakeInfo:
+        return self.takes[path.strip('/')]
+
+    def get(self, surgery_type: str, procedure_id, take_id) -> TakeInfo:
+        return self.takes[take_path(surgery_type, procedure_id, take_id)]
+
+    # ------------------------------------------------------------------ build
+    @staticmethod
+    def _scan_take(f: h5py.File, path: str) -> TakeInfo:
+        take_grp = f[path]
+        camera_names = []
+        if 'sources' in take_grp:
+            src_grp = take_grp['sources']
+            camera_count = int(src_grp.attrs.get('source_count', 0))
+            for i in range(camera_count):
+                name = src_grp.attrs.get(f'source_{i}')
+                if isinstance(name, bytes):
+                    name = name.decode('utf-8')
+                camera_names.append(str(name) if name is not None else None)
+
+        members = list(take_grp.keys())
+        datasets = {}
+        for member in members:
+            # annotations hold one group per frame, listing them would dominate the scan
+            if member == 'annotations':
+                continue
+            item = take_grp[member]
+            children = item.items() if isinstance(item, h5py.Group) else [(None, item)]
+            for name, child in children:
+                if isinstance(child, h5py.Dataset):
+                    key = member if name is None else f"{member}/{name}"
+                    datasets[key] = {
+                        'shape': list(child.shape),
+                        'dtype': str(child.dtype),
+                        'chunks': list(child.chunks) if child.chunks else None,
+                    }
+
+        rgb_shape = datasets.get('frames/rgb', {}).get('shape', [0, 0])
+        fixation_roles = sorted(role for role, takes in GAZE_FIXATION_TO_TAKE.items() if path in takes)
+        validity = None
+        if FRAME_VALIDITY_KEY in datasets and len(rgb_shape) > 1:
+            # a bitmap written for other frames (frames/rgb replaced afterwards) is ignored
+            validity_ds = take_grp[FRAME_VALIDITY_KEY]
+            if validity_ds.shape[0] == rgb_shape[0] and validity_ds.attrs.get('num_cameras') == rgb_shape[1]:
+                validity = base64.b64encode(validity_ds[()].tobytes()).decode('ascii')
+        return TakeInfo(
+            path=path,
+            camera_names=camera_names,
+            num_frames=int(rgb_shape[0]),
+            num_cameras=int(rgb_shape[1]) if len(rgb_shape) > 1 else 0,
+            members=members,
+            datasets=datasets,
+            fixation_roles=fixation_roles,
+            validity=validity,
+        )
+
+    @classmethod
+    def build(cls, h5_file) -> "TakeIndex":
+        """Scan every take of an open h5py.File (or a path to one)."""
+        if not isinstance(h5_file, h5py.File):
+            with h5py.File(h5_file, 'r') as f:
+                return cls.build(f)
+
+        takes = {}
+        if 'data' in h5_file:
+            for surgery_type in h5_file['data']:
+                for procedure_id in h5_file[f'data/{surgery_type}']:
+                    takes_path = f'data/{surgery_type}/{procedure_id}/take'
+                    if takes_path not in h5_file:
+                        continue
+                    for take_id in h5_file[takes_path]:
+                        path = take_path(surgery_type, procedure_id, take_id)
+                        takes[path] = cls._scan_take(h5_file, path)
+        return cls(takes, hdf5_path=h5_file.filename)
+
+    # ---------------------------------------------------------- serialization
+    def save(self, sidecar_path) -> None:
+        payload = {
+            'version': TAKE_INDEX_VERSION,
+            'signature': file_signature(self.hdf5_path) if self.hdf5_path else None,
+            'takes': {path: take.to_dict() for path, take in self.takes.items()},
+        }
+        tmp_path = f"{sidecar_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, sidecar_path)
+
+    @classmethod
+    def load(cls, hdf5_path, sidecar_path=None, rebuild: bool = False) -> "TakeIndex":
+        """
+        Load the index from its sidecar file, or build it (and try to write the sidecar)
+        when the sidecar is missing or was written for a different version of the HDF5 file.
+        """
+        hdf5_path = os.fspath(hdf5_path)
+        if sidecar_path is None:
+            sidecar_path = hdf5_path + TAKE_INDEX_SUFFIX
+
+        if not rebuild and os.path.exists(sidecar_path):
+            try:
+                with open(sidecar_path, 'r') as f:
+                    payload = json.load(f)
+                if payload.get('version') == TAKE_INDEX_VERSION and \
+                        payload.get('signature') == file_signature(hdf5_path):
+                    takes = {path: TakeInfo(**info) for path, info in payload['takes'].items()}
+                    return cls(takes, hdf5_path=hdf5_path)
+                print(f"Take index {sidecar_path} is stale, rebuilding.")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Warning: could not read take index {sidecar_path}: {e}. Rebuilding.")
+
+        index = cls.build(hdf5_path)
+        index.hdf5_path = hdf5_path
+        try:
+            index.save(sidecar_path)
+        except OSError as e:
+            print(f"Warning: could not write take index {sidecar_path}: {e}")
+        return index
@@ -0,0 +1,226 @@
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from .hdf5_utils import expand_index, load_export_headers
+
+try:
+    # PyAV, only needed to read a video export (data/utils/export_video_frames.py)
+    import av
+except ImportError:
+    av = None
+
+# Layout written by data/utils/export_video_frames.py
+VIDEO_FRAMES_VERSION = 2
+VIDEO_FRAMES_SUFFIX = ".videoframes"
+DEFAULT_GOP_CACHE_BYTES = 256 * 1024 ** 2
+
+
+class VideoFrames:
+    """
+    `frames/rgb` of one take, decoded from its per-camera videos on read.
+
+    Indexes like the HDF5 dataset for the forms the loaders use (read_cameras and the
+    batched reads): frames, then cameras, each an integer, a slice or a list. The result is
+    a uint8 array of the same shape h5py would return.
+    """
+    def __init__(self, store: "VideoFrameStore", take_path: str, header: dict):
+        self.store = store
+        self.take_path = take_path
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(np.uint8)
+        self.ndim = len(self.shape)
+        self.chunks = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        frames, drop_frames = expand_index(index[0], self.shape[0])
+        cams, drop_cams = expand_index(index[1], self.shape[1]) if len(index) > 1 else (list(range(self.shape[1])), False)
+        out = np.empty((len(frames), len(cams)) + self.shape[2:], dtype=self.dtype)
+        for j, cam_idx in enumerate(cams):
+            for i, frame_idx in enumerate(frames):
+                out[i, j] = self.store.view(self.take_path, frame_idx, cam_idx)
+        if len(index) > 2:
+            out = out[(slice(None), slice(None)) + tuple(index[2:])]
+        if drop_cams:
+            out = out[:, 0]
+        if drop_frames:
+            out = out[0]
+        return out
+
+
+class VideoFrameStore:
+    """
+    Video export of `frames/rgb` (data/utils/export_video_frames.py): one H.264/HEVC/MJPEG
+    stream per camera and take, with the keyframes of every stream in the take's header.
+
+    `frames(take_path)` returns a VideoFrames that the loaders read like the HDF5 dataset.
+    A view is decoded with its whole GOP: seek to the keyframe at or before the frame, decode
+    up to the next keyframe, and keep the decoded GOP in an LRU of `gop_cache_bytes`, so the
+    neighbouring frames a locality-aware sampler asks for next are served from memory.
+    Containers and decoded GOPs are per process (dropped after a fork); a lock serializes
+    decoding for the read-ahead threads. The codec is lossy unless exported losslessly, so
+    blank views (the `blank` frame ranges of a camera) are returned as zeros without decoding.
+    """
+    def __init__(self, root, hdf5_path=None, gop_cache_bytes: int = DEFAULT_GOP_CACHE_BYTES,
+                 max_open_files: int = 64):
+        if av is None:
+            raise ImportError("Reading a video frame export requires PyAV (pip install av)")
+        self.root = os.fspath(root)
+        self.gop_cache_bytes = int(gop_cache_bytes)
+        self.max_open_files = int(max_open_files)
+        self.headers, self.stale = load_export_headers(self.root, VIDEO_FRAMES_VERSION, hdf5_path)
+        # (starts, stops) of the blank frame ranges of every (take, camera)
+        self._blank = {(take_path, int(cam)): tuple(zip(*camera['blank'])) if camera['blank'] else ((), ())
+                       for take_path, header in self.headers.items() for cam, camera in header['cameras'].items()}
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._containers: "OrderedDict[str, object]" = OrderedDict()
+        self._gops: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._gop_bytes = 0
+        self.hits = 0           # views served from a decoded GOP
+        self.misses = 0         # views whose GOP had to be decoded
+        self.decoded_frames = 0
+        self.compressed_bytes = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_lock', '_containers', '_gops'):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __contains__(self, take_path: str) -> bool:
+        return take_path in self.headers
+
+    def frames(self, take_path: str) -> Optional[VideoFrames]:
+        """`frames/rgb` of a take decoded on read, None if the take was not exported."""
+        header = self.headers.get(take_path)
+        return VideoFrames(self, take_path, header) if header is not None else None
+
+    # --------------------------------------------------------------- decoding
+    def _container(self, path: str):
+        container = self._containers.get(path)
+        if container is None:
+            container = av.open(path, mode='r')
+            self._containers[path] = container
+            if len(self._containers) > self.max_open_files:
+                self._containers.popitem(last=False)[1].close()
+        else:
+            self._containers.move_to_end(path)
+        return container
+
+    def _decode_gop(self, header: dict, cam_idx: int, start: int, stop: int) -> np.ndarray:
+        """Frames [start, stop) of a camera, decoded from the keyframe at `start`."""
+        camera = header['cameras'][str(cam_idx)]
+        height, width = header['shape'][2:4]
+        fps = header['fps']
+        container = self._container(os.path.join(self.root, camera['file']))
+        stream = container.streams.video[0]
+        container.seek(int(start / fps / stream.time_base), stream=stream, backward=True)
+        gop = np.zeros((stop - start, height, width, 3), dtype=np.uint8)
+        decoded = 0
+        for packet in container.demux(stream):
+            self.compressed_bytes += packet.size
+            done = False
+            for frame in packet.decode():
+                frame_idx = int(round(frame.time * fps))
+                if frame_idx >= stop:
+                    done = True
+                    break
+                if frame_idx >= start:
+                    # frames were padded to even sizes for the encoder
+                    gop[frame_idx - start] = frame.to_ndarray(format='rgb24')[:height, :width]
+                    decoded += 1
+            if done:
+                break
+        self.decoded_frames += decoded
+        if decoded != stop - start:
+            raise RuntimeError(f"Decoded {decoded} of frames {start}-{stop} from {camera['file']}")
+        return gop
+
+    def is_blank(self, take_path: str, frame_idx: int, cam_idx: int) -> bool:
+        starts, stops = self._blank[(take_path, cam_idx)]
+        position = bisect_right(starts, frame_idx) - 1
+        return position >= 0 and frame_idx < stops[position]
+
+    def view(self, take_path: str, frame_idx: int, cam_idx: int) -> np.ndarray:
+        """uint8 view [H, W, 3] of a camera at a frame."""
+        header = self.headers[take_path]
+        if self.is_blank(take_path, frame_idx, cam_idx):
+            return np.zeros(header['shape'][2:], dtype=np.uint8)
+        if os.getpid() != self._pid:
+            # containers opened before a fork must not be used by the worker
+            self._reset()
+        keyframes = header['cameras'][str(cam_idx)]['keyframes']
+        position = bisect_right(keyframes, frame_idx) - 1
+        start = keyframes[max(position, 0)]
+        stop = keyframes[position + 1] if position + 1 < len(keyframes) else header['shape'][0]
+        key = (take_path, cam_idx, start)
+        with self._lock:
+            gop = self._gops.get(key)
+            if gop is not None:
+                self._gops.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                gop = self._decode_gop(header, cam_idx, start, stop)
+                self._gops[key] = gop
+                self._gop_bytes += gop.nbytes
+                while len(self._gops) > 1 and self._gop_bytes > self.gop_cache_bytes:
+                    self._gop_bytes -= self._gops.popitem(last=False)[1].nbytes
+        return gop[frame_idx - start]
+
+    # ----------------------------------------------------------------- metrics
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+                'decoded_frames': self.decoded_frames, 'compressed_bytes': self.compressed_bytes,
+                'gop_cache_bytes': self._gop_bytes}
+
+
+_stores: Dict[str, Optional[VideoFrameStore]] = {}
+
+
+def get_video_frame_store(hdf5_path) -> Optional[VideoFrameStore]:
+    """
+    The video export next to an HDF5 file (`<hdf5_path>.videoframes`), or None if there is
+    none (or PyAV is not installed). Looked up once per file and process.
+    """
+    key = os.path.abspath(os.fspath(hdf5_path))
+    if key not in _stores:
+        root = key + VIDEO_FRAMES_SUFFIX
+        store = None
+        if os.path.isdir(root):
+            if av is None:
+                print(f"Warning: {root} needs PyAV (pip install av), frames are read from HDF5.")
+            else:
+                store = VideoFrameStore(root, hdf5_path=key)
+                if store.stale:
+                    print(f"Warning: {store.stale} takes of {root} were exported from another version of "
+                          f"{key} and are read from HDF5. Re-run data/utils/export_video_frames.py.")
+                if not len(store):
+                    store = None
+        _stores[key] = store
+    return _stores[key]
@@ -5,8 +5,8 @@ import json
 import re
 from collections import defaultdict
 from copy import deepcopy
+from functools import partial
 
-import h5py
 import numpy as np
 import open3d as o3d
 import torch
@@ -24,12 +24,18 @@ from .input_transformation import (
 )
 
 from ..dataset.dataset_utils import (
-    reversed_sources, reversed_relation_synonyms, reversed_entity_synonyms,
+    reversed_relation_synonyms, reversed_entity_synonyms,
     map_vocab_idx_to_scene_graph_name, map_scene_graph_name_to_vocab_idx,
-    scene_graph_name_to_vocab_idx,
-    GAZE_FIXATION, SOURCES
+    scene_graph_name_to_vocab_idx
 )
-from ..dataset.or_dataset import _needs_fixation
+from ..dataset.hdf5_utils import get_h5_pool
+from ..dataset.read_ahead import FrameReads
+from ..dataset.take_index import TakeIndex
+from ..dataset.frame_cache import FrameCache, load_views
+from ..dataset.modality_plan import ModalityPlan
+from ..dataset.ego_alignment import apply_gaze_fixation, gaze_rows, ego_rows
+from ..dataset.take_cache import TakeArrayCache
+from ..dataset.audio_embedding import CLAP_MODEL_NAME, LazyAudioProcessor, has_audio, load_audio_features
 from typing import Dict, Optional, Sequence, List, Tuple, Any
 
 
@@ -56,8 +62,12 @@ def to_device(obj, device):
 
 
 class ModelWrapper:
-    def __init__(self, hdf5_path, dataset_name, relationNames, classNames, model_path, model_base='liuhaotian/llava-v1.5-7b', load_8bit=False, load_4bit=False, temporality=None, mv_type="learned", device="cuda", device_map="auto"):
+    def __init__(self, hdf5_path, dataset_name, relationNames, classNames, model_path, model_base='liuhaotian/llava-v1.5-7b', load_8bit=False, load_4bit=False, temporality=None, mv_type="learned", device="cuda", device_map="auto", hdf5_rdcc_nbytes=None, frame_cache_dir=None, frame_cache_dtype="bfloat16", modality_plan=None, take_cache_bytes=0, take_index_path=None):
         self.hdf5_path = hdf5_path
+        # shares the process-wide handle pool with ORDataset when it runs in the main process
+        self.h5_pool = get_h5_pool(rdcc_nbytes=hdf5_rdcc_nbytes)
+        # the same sidecar as the eval dataset (ORDataset), not a second one next to the HDF5 file
+        self.take_index = TakeIndex.load(hdf5_path, sidecar_path=take_index_path)
         self.n_object_types = 6
         self.relationNames = relationNames
         self.classNames = classNames
@@ -103,35 +113,132 @@ class ModelWrapper:
 
 
         self.frame_transform = FrameTransform(self.image_processor)
+        self.frame_cache = None
+        if frame_cache_dir is not None:
+            self.frame_cache = FrameCache(frame_cache_dir, self.frame_transform, storage_dtype=frame_cache_dtype,
+                                          hdf5_path=hdf5_path)
+        # gaze, gaze depth and hand tracking of whole takes, read once per take (disabled if take_cache_bytes is 0)
+        self.take_cache = TakeArrayCache(max_bytes=take_cache_bytes) if take_cache_bytes else None
+        # optional ReadAhead over the eval dataset (see main.py), reads the next samples while this batch generates
+        self.read_ahead = None
         self.gaze_normalize = GazeNormalize(img_width=336, img_height=336)
         self.depth_normalize = GazeDepthNormalize(max_depth=1.0)
         self.hand_normalize = HandTrackingNormalize(img_width=336, img_height=336)
         self.audio_normalize = AudioTransform()
         # since we used frozen audio processor we dont need to get it from pretrained egoexor mode
-        self.audio_processor = AudioProcessor(model_name="laion/larger_clap_general", d_model=1024, clap_hidden_size=512)
+        # CLAP is only loaded for takes without a precomputed audio/clap_embedding
+        self.audio_processor = LazyAudioProcessor(partial(AudioProcessor, model_name=CLAP_MODEL_NAME, d_model=1024, clap_hidden_size=512))
 
         self.dataset_name = dataset_name
 
         self.is_egoexor = True if self.dataset_name == "egoexor" else False
         self.is_4dor = True if self.dataset_name == "4dor" else False
         self.is_mmor = True if self.dataset_name == "mmor" else False
+        # modalities the model consumes (every feature by default); the others are never read
+        self.modality_plan = modality_plan if modality_plan is not None else ModalityPlan.from_config(dataset_name)
 
-    def load_and_process_image(self, img_tensor):
-        img_np = img_tensor.cpu().numpy()
-        img_np = (img_np * 255).astype(np.uint8) if img_np.max() <= 1.0 else img_np.astype(np.uint8)
+    def load_and_process_image(self, img_np):
+        # img_np is a uint8 [H, W, 3] camera view as stored in frames/rgb
         img_np = img_np[..., ::-1]  # Convert RGB to BGR
         img_pil = Image.fromarray(img_np).convert('RGB')
         return self.frame_transform(img_pil)
     
 
-    def forward(self, batch):
+    def select_eval_views(self, combined_exo_source_names):
+        """
+        Deterministic view selection of the single-branch (non-egoexor) evaluation.
+        Works on source names only and returns the kept positions, so the discarded
+        views are never read or preprocessed.
+        """
+        # For evaluation: Select up to 7 images deterministically
+        # - Up to 3 egocentric images (prioritizing assistant, head_surgeon, anesthetist if all 4 exist)
+        # - Up to 3 exocentric images (prioritizing external_1, external_3, external_5 if available)
+        # - 1 ultrasound image (if available)
+        max_images = min(7, len(combined_exo_source_names))
+        kept_indices = []
+
+        # Step 1: Select up to 3 egocentric images
+        ego_indices = []
+        for i, source_names in enumerate(combined_exo_source_names):
+            if any(name in ['assistant', 'head_surgeon', 'circulator', 'anesthetist'] for name in source_names):
+                ego_indices.append(i)
+
+        # Check if all 4 egocentric sources exist
+        ego_source_set = set()
+        for i in ego_indices:
+            ego_source_set.update(combined_exo_source_names[i])
+        all_ego_present = all(name in ego_source_set for name in ['assistant', 'head_surgeon', 'circulator', 'anesthetist'])
+
+        if all_ego_present:
+            # Keep assistant, head_surgeon, anesthetist
+            for i in ego_indices:
+                if any(name in ['assistant', 'head_surgeon', 'anesthetist'] for name in combined_exo_source_names[i]):
+                    kept_indices.append(i)
+        else:
+            # Keep up to 3 egocentric images in order
+            ego_count = 0
+            for i in ego_indices:
+                if ego_count < 3:
+                    kept_indices.append(i)
+                    ego_count += 1
+
+        if len(kept_indices) >= max_images:
+            kept_indices = kept_indices[:max_images]
+
+        # Step 2: Select up to 3 exocentric images (non-ultrasound)
+        exo_indices = []
+        for i, source_names in enumerate(combined_exo_source_names):
+            if i not in kept_indices and 'ultrasound' not in source_names:
+                exo_indices.append(i)
+
+        # Check for external_[1 to 5]
+        external_indices = []
+        for i in exo_indices:
+            if any(name in ['external_1', 'external_2', 'external_3', 'external_4', 'external_5'] for name in combined_exo_source_names[i]):
+                external_indices.append(i)
+
+        if external_indices:
+            # Prioritize external_1, external_3, external_5
+            priority_exo = []
+            for i in external_indices:
+                if any(name in ['external_1', 'external_3', 'external_5'] for name in combined_exo_source_names[i]):
+                    priority_exo.append(i)
+            # Add up to 3 prioritized external indices
+            for i in priority_exo:
+                if len(kept_indices) < max_images:
+                    kept_indices.append(i)
+        else:
+            # Add up to 3 exocentric images in order
+            exo_count = 0
+            for i in exo_indices:
+                if exo_count < 3 and len(kept_indices) < max_images:
+                    kept_indices.append(i)
+                    exo_count += 1
+
+        if len(kept_indices) >= max_images:
+            kept_indices = kept_indices[:max_images]
+
+        # Step 3: Select 1 ultrasound image (if available)
+        for i, source_names in enumerate(combined_exo_source_names):
+            if 'ultrasound' in source_names and i not in kept_indices:
+                if len(kept_indices) < max_images:
+                    kept_indices.append(i)
+                break
+
+        # Sort indices to maintain order
+        kept_indices = sorted(kept_indices)
+        return kept_indices
+
+    def load_inputs(self, batch):
+        """Per-sample model inputs (prompt, preprocessed views and modalities) of a DataCollatorForORDataset batch."""
         batch_size = len(batch["sample"])
         outputs = []
+        indices = batch.get("index")
 
-        with h5py.File(self.hdf5_path, 'r') as f:
+        with self.h5_pool.file(self.hdf5_path) as f:
             for batch_idx in range(batch_size):
                 metadata = batch["sample"][batch_idx]["hdf5_indices"]
-                available_modalities = metadata["available_modalities"]
+                available_modalities = self.modality_plan.filter(metadata["available_modalities"])
                 ego_source_names = batch["ego_source_names"][batch_idx]
                 exo_source_names = batch["exo_source_names"][batch_idx]
                 ego_source_ids = batch["ego_source_ids"][batch_idx]
@@ -139,112 +246,82 @@ class ModelWrapper:
 
                 path = f"data/{metadata['surgery_type']}/{metadata['procedure_id']}/take/{metadata['take_id']}"
                 frame_idx = metadata["frame_idx"]
-                frame_rgb = torch.from_numpy(f[f'{path}/frames/rgb'][frame_idx]).float()
+                take = self.take_index[path]
+                has_image = len(ego_source_ids) > 0 or len(exo_source_ids) > 0
+                if self.read_ahead is not None and indices is not None:
+                    reads = self.read_ahead.reads(f, path, frame_idx, indices[batch_idx], take_cache=self.take_cache)
+                else:
+                    reads = FrameReads(f, path, frame_idx, take_cache=self.take_cache)
 
-                # --- Ego & Exo Image Processing ---
-                ego_images, exo_images = [], []
-                for source_img_id in ego_source_ids:
-                    processed = self.load_and_process_image(frame_rgb[source_img_id])
-                    if processed is not None:
-                        ego_images.append(processed)
+                # --- View selection on source names, before any image is read ---
+                if not self.is_egoexor:
+                    combined_exo_source_ids = list(ego_source_ids) + list(exo_source_ids)
+                    combined_exo_source_names = list(ego_source_names) + list(exo_source_names)
+                    kept_indices = self.select_eval_views(combined_exo_source_names)
+                    combined_exo_source_names = [combined_exo_source_names[i] for i in kept_indices]
+                    combined_exo_source_ids = [combined_exo_source_ids[i] for i in kept_indices]
+                    read_ego_ids = []
+                else:
+                    combined_exo_source_ids = exo_source_ids
+                    combined_exo_source_names = exo_source_names
+                    read_ego_ids = list(ego_source_ids)
 
-                for source_img_id in exo_source_ids:
-                    processed = self.load_and_process_image(frame_rgb[source_img_id])
-                    if processed is not None:
-                        exo_images.append(processed)
+                # --- Ego & Exo Image Processing: only the kept cameras are read, kept as uint8 ---
+                # every view is channel-flipped (see load_and_process_image); with a frame cache only misses are read
+                ego_images = load_views(self.frame_transform, self.frame_cache, take, frame_idx,
+                                        read_ego_ids, [True] * len(read_ego_ids), reads.cameras)
+                combined_exo_images = load_views(self.frame_transform, self.frame_cache, take, frame_idx,
+                                                 combined_exo_source_ids, [True] * len(combined_exo_source_ids), reads.cameras)
 
                 # --- Modalities ---
                 modality_data = {}
 
                 # Eye Gaze
                 if 'eye_gaze' in available_modalities:
-                    gaze_key = f'{path}/eye_gaze/coordinates'
-                    if gaze_key in f:
-                        raw = f[gaze_key][frame_idx]
-                        for i in range(raw.shape[0]):
-                            cam_id = int(raw[i, 0])
-                            role = reversed_sources.get(cam_id)
-                            if role and _needs_fixation(role, path):
-                                raw[i, 1] += GAZE_FIXATION["x"]
-                                raw[i, 2] += GAZE_FIXATION["y"]
+                    if take.has('eye_gaze/coordinates'):
+                        raw = apply_gaze_fixation(reads.row('eye_gaze/coordinates'), take)
 
                         coords = torch.from_numpy(raw[:, 1:3]).float()
                         coords = self.gaze_normalize(coords).to(dtype=torch.bfloat16)
                         camera_ids = torch.from_numpy(raw[:, 0]).long()
-                        ego_source_ids_mapped = [SOURCES[name] for name in ego_source_names]
-
-                        valid_indices = [idx for idx, cam_id in enumerate(camera_ids) if cam_id.item() in ego_source_ids_mapped]
-                        valid_coords = coords[valid_indices]
-                        valid_camera_ids = camera_ids[valid_indices]
-
-                        ordered_indices = []
-                        for source_id in ego_source_ids_mapped:
-                            for idx, cam_id in enumerate(valid_camera_ids):
-                                if cam_id.item() == source_id:
-                                    ordered_indices.append(idx)
-                                    break
+                        rows = torch.from_numpy(gaze_rows(camera_ids.numpy(), take.source_ids(ego_source_ids)))
 
                         modality_data['eye_gaze'] = {
-                            'data': valid_coords[ordered_indices] if ordered_indices else torch.zeros((0, 2), dtype=torch.bfloat16),
-                            'camera_ids': valid_camera_ids[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.long),
+                            'data': coords[rows],
+                            'camera_ids': camera_ids[rows],
                         }
 
                 # Eye Gaze Depth
                 if 'eye_gaze_depth' in available_modalities:
-                    depth_key = f'{path}/eye_gaze_depth/values'
-                    if depth_key in f:
-                        raw_d = torch.from_numpy(f[depth_key][frame_idx]).float()
+                    if take.has('eye_gaze_depth/values'):
+                        raw_d = torch.from_numpy(reads.row('eye_gaze_depth/values')).float()
                         raw_d = self.depth_normalize(raw_d).to(dtype=torch.bfloat16)
-
-                        valid_indices = [i for i in range(len(raw_d)) if i + min(ego_source_ids) in ego_source_ids]
-                        valid_d = raw_d[valid_indices]
-
-                        ordered_indices = []
-                        for idx in valid_indices:
-                            source_idx = idx + min(ego_source_ids)
-                            if source_idx in ego_source_ids:
-                                ordered_indices.append(valid_indices.index(idx))
+                        rows = torch.from_numpy(ego_rows(ego_source_ids, raw_d.shape[0]))
 
                         modality_data['eye_gaze_depth'] = {
-                            'data': valid_d[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.bfloat16)
+                            'data': raw_d[rows]
                         }
 
                 # Hand Tracking
                 if 'hand_tracking' in available_modalities:
-                    hand_key = f'{path}/hand_tracking/positions'
-                    if hand_key in f:
-                        raw_h = torch.from_numpy(f[hand_key][frame_idx][:, 1:]).float()
+                    if take.has('hand_tracking/positions'):
+                        raw_h = torch.from_numpy(reads.row('hand_tracking/positions')[:, 1:]).float()
                         mask = torch.isnan(raw_h).any(dim=-1)
                         raw_h = torch.nan_to_num(raw_h, nan=0.0)
                         raw_h = self.hand_normalize(raw_h).to(dtype=torch.bfloat16)
-                        camera_ids = torch.arange(raw_h.shape[0]).long()
-
-                        valid_indices = [idx for idx in range(raw_h.shape[0]) if idx + min(ego_source_ids) in ego_source_ids]
-                        valid_h = raw_h[valid_indices]
-                        valid_mask = mask[valid_indices]
-                        valid_camera_ids = camera_ids[valid_indices]
-
-                        ordered_indices = []
-                        for name in ego_source_names:
-                            target_id = ego_source_ids[ego_source_names.index(name)]
-                            for idx, cam_idx in enumerate(valid_camera_ids):
-                                if cam_idx + min(ego_source_ids) == target_id:
-                                    ordered_indices.append(idx)
-                                    break
+                        rows = torch.from_numpy(ego_rows(ego_source_ids, raw_h.shape[0]))
 
                         modality_data['hand_tracking'] = {
-                            'data': valid_h[ordered_indices] if ordered_indices else torch.zeros((0, raw_h.shape[1]), dtype=torch.bfloat16),
-                            'mask': valid_mask[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.bool),
-                            'camera_ids': valid_camera_ids[ordered_indices] if ordered_indices else torch.zeros((0,), dtype=torch.long),
+                            'data': raw_h[rows],
+                            'mask': mask[rows],
+                            'camera_ids': rows,
                         }
 
                 # Point Cloud
                 if 'point_cloud' in available_modalities:
-                    points_key = f'{path}/point_cloud/coordinates'
-                    colors_key = f'{path}/point_cloud/colors'
-                    if points_key in f and colors_key in f:
-                        coords = np.asarray(f[points_key][frame_idx])
-                        colors = np.asarray(f[colors_key][frame_idx])
+                    if take.has('point_cloud/coordinates') and take.has('point_cloud/colors'):
+                        coords = np.asarray(reads.row('point_cloud/coordinates'))
+                        colors = np.asarray(reads.row('point_cloud/colors'))
                         pts6 = np.concatenate([coords, colors], axis=1)
                         modality_data['point_cloud'] = {
                             'data': torch.from_numpy(pts6).float()
@@ -252,11 +329,8 @@ class ModelWrapper:
 
                 # Audio
                 if 'audio' in available_modalities:
-                    audio_key = f'{path}/audio/snippets'
-                    if audio_key in f:
-                        raw_a = torch.from_numpy(f[audio_key][frame_idx]).float()
-                        raw_a = self.audio_normalize(raw_a).to(dtype=torch.bfloat16)
-                        raw_a = self.audio_processor(raw_a.unsqueeze(0))  # Add batch dim
+                    if has_audio(take):
+                        raw_a = load_audio_features(reads, take, self.audio_normalize, self.audio_processor)
                         modality_data['audio'] = {'data': raw_a}
 
                 # Conversations (LLM input)
@@ -270,101 +344,6 @@ class ModelWrapper:
                     "prompt" : prompt,
                 }
 
-                if not self.is_egoexor:
-                    combined_exo_images = ego_images + exo_images
-                    combined_exo_source_ids = ego_source_ids + exo_source_ids
-                    combined_exo_source_names = ego_source_names + exo_source_names
-                    
-                    # For evaluation: Select up to 7 images deterministically
-                    # - Up to 3 egocentric images (prioritizing assistant, head_surgeon, anesthetist if all 4 exist)
-                    # - Up to 3 exocentric images (prioritizing external_1, external_3, external_5 if available)
-                    # - 1 ultrasound image (if available)
-                    max_images = min(7, len(combined_exo_images))
-                    kept_indices = []
-
-                    # Step 1: Select up to 3 egocentric images
-                    ego_indices = []
-                    for i, source_names in enumerate(combined_exo_source_names):
-                        if any(name in ['assistant', 'head_surgeon', 'circulator', 'anesthetist'] for name in source_names):
-                            ego_indices.append(i)
-
-                    # Check if all 4 egocentric sources exist
-                    ego_source_set = set()
-                    for i in ego_indices:
-                        ego_source_set.update(combined_exo_source_names[i])
-                    all_ego_present = all(name in ego_source_set for name in ['assistant', 'head_surgeon', 'circulator', 'anesthetist'])
-
-                    if all_ego_present:
-                        # Keep assistant, head_surgeon, anesthetist
-                        for i in ego_indices:
-                            if any(name in ['assistant', 'head_surgeon', 'anesthetist'] for name in combined_exo_source_names[i]):
-                                kept_indices.append(i)
-                    else:
-                        # Keep up to 3 egocentric images in order
-                        ego_count = 0
-                        for i in ego_indices:
-                            if ego_count < 3:
-                                kept_indices.append(i)
-                                ego_count += 1
-
-                    if len(kept_indices) >= max_images:
-                        kept_indices = kept_indices[:max_images]
-
-                    # Step 2: Select up to 3 exocentric images (non-ultrasound)
-                    exo_indices = []
-                    for i, source_names in enumerate(combined_exo_source_names):
-                        if i not in kept_indices and 'ultrasound' not in source_names:
-                            exo_indices.append(i)
-
-                    # Check for external_[1 to 5]
-                    external_indices = []
-                    for i in exo_indices:
-                        if any(name in ['external_1', 'external_2', 'external_3', 'external_4', 'external_5'] for name in combined_exo_source_names[i]):
-                            external_indices.append(i)
-
-                    if external_indices:
-                        # Prioritize external_1, external_3, external_5
-                        priority_exo = []
-                        for i in external_indices:
-                            if any(name in ['external_1', 'external_3', 'external_5'] for name in combined_exo_source_names[i]):
-                                priority_exo.append(i)
-                        # Add up to 3 prioritized external indices
-                        for i in priority_exo:
-                            if len(kept_indices) < max_images:
-                                kept_indices.append(i)
-                    else:
-                        # Add up to 3 exocentric images in order
-                        exo_count = 0
-                        for i in exo_indices:
-                            if exo_count < 3 and len(kept_indices) < max_images:
-                                kept_indices.append(i)
-                                exo_count += 1
-
-                    if len(kept_indices) >= max_images:
-                        kept_indices = kept_indices[:max_images]
-
-                    # Step 3: Select 1 ultrasound image (if available)
-                    for i, source_names in enumerate(combined_exo_source_names):
-                        if 'ultrasound' in source_names and i not in kept_indices:
-                            if len(kept_indices) < max_images:
-                                kept_indices.append(i)
-                            break
-
-                    # Sort indices to maintain order
-                    kept_indices = sorted(kept_indices)
-
-                    # Update the combined lists to only include selected indices
-                    combined_exo_images = [combined_exo_images[i] for i in kept_indices]
-                    combined_exo_source_names = [combined_exo_source_names[i] for i in kept_indices]
-                    combined_exo_source_ids = [combined_exo_source_ids[i] for i in kept_indices]
-
-
-
-                else:
-                    combined_exo_images = exo_images
-                    combined_exo_source_ids = exo_source_ids
-                    combined_exo_source_names = exo_source_names
-
                 if combined_exo_images:
                     data_dict['exo_frames'] = torch.stack(combined_exo_images)
                     data_dict['exo_source_ids'] = combined_exo_source_ids
@@ -377,7 +356,7 @@ class ModelWrapper:
                     data_dict['ego_source_names'] = ego_source_names
 
                 # Fallback zeros when truly no images and multimodal
-                if not ego_images and not exo_images:
+                if not has_image:
                     zeros = torch.zeros(1, 3, 336, 336)
                     data_dict['exo_frames']       = zeros
                     data_dict['ego_frames']       = zeros if self.is_egoexor else None
@@ -390,8 +369,11 @@ class ModelWrapper:
 
                 data_dict.update(modality_data)
                 outputs.append(data_dict)
+        return outputs
 
-
+    def collate_inputs(self, outputs):
+        """generate() keyword arguments (without stopping criteria) of the load_inputs outputs, on the model device."""
+        batch_size = len(outputs)
         # at the and batch should have the same sturcture as before but with added new data
         # === Build final batch dictionary ===
         final_batch = {}
@@ -465,17 +447,12 @@ class ModelWrapper:
             for key in ("ego_frames", "ego_source_names", "ego_source_ids"):
                 final_batch.pop(key, None)
 
-        
-        stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
-        stopping_criteria = KeywordsStoppingCriteria([stop_str], self.tokenizer, input_ids)
-
 
         forward_kwargs = {
             "input_ids": final_batch["input_ids"],
             "do_sample": False,
             "use_cache": True,
             "max_new_tokens": 300,
-            "stopping_criteria": [stopping_criteria]
         }
 
         # List all optional modalities and their arg‐names
@@ -513,8 +490,16 @@ class ModelWrapper:
                 for i, vv in enumerate(v):
                     if torch.is_tensor(vv):
                         assert vv.device == device, f"{k}[{i}] still on {vv.device}"
+        return forward_kwargs
 
+    def forward(self, batch):
+        batch_size = len(batch["sample"])
+        forward_kwargs = self.collate_inputs(self.load_inputs(batch))
+        input_ids = forward_kwargs["input_ids"]
 
+        conv = default_conversation
+        stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
+        forward_kwargs["stopping_criteria"] = [KeywordsStoppingCriteria([stop_str], self.tokenizer, input_ids)]
 
         with torch.inference_mode():
             output_ids = self.model.generate(**forward_kwargs)
@@ -724,6 +709,8 @@ class ModelWrapper:
                             take_rel_preds[take_name].append(self.relation_names_lower_case.index('none'))
                             take_rel_binary_interaction_preds[take_name].append(0)
         
+        if self.read_ahead is not None:
+            print(f"Read-ahead: {self.read_ahead.stats()}")
         self.val_take_rel_preds, self.val_take_rel_gts = take_rel_preds, take_rel_gts
         self.val_take_rel_binary_interaction_preds, self.val_take_rel_binary_interaction_gts = take_rel_binary_interaction_preds, take_rel_binary_interaction_gts
         self.val_take_entity_preds, self.val_take_entity_gts = take_entity_preds, take_entity_gts